@@ -7,4 +7,5 @@ class LibraryApiConfig(AppConfig):
 
     def ready(self):
         import library_api.signals
+        import library_api.db_pool
 
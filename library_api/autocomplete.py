@@ -0,0 +1,204 @@
+"""
+In-process prefix index for title and author typeahead.
+
+Each worker keeps every Book's normalized title and author tokens in one
+sorted list, so a prefix lookup is two bisects and a slice. Suggestions are
+answered from memory. The index checks the catalog version (see catalog.py)
+at most every AUTOCOMPLETE_CHECK_INTERVAL seconds and reloads only the books
+changed since it was built. It is rebuilt from the table when the change log
+has gaps or more than AUTOCOMPLETE_MAX_CHANGES entries, and after
+AUTOCOMPLETE_MAX_AGE seconds in any case.
+
+A refresh builds a new snapshot and swaps it in, so lookups never lock.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .catalog import catalog_version, changed_books
+from .models import Book
+
+# Letters and digits of any script; underscores separate words, as punctuation does
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Casefold and strip accents: 'Émile Zola' -> 'emile zola', 'Straße' -> 'strasse'"""
+    if not text:
+        return ''
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class IndexSnapshot:
+    __slots__ = ('version', 'built_at', 'checked_at', 'books', 'keys', 'ids', 'title_keys', 'title_ids')
+
+    def __init__(self, version, books, entries):
+        """entries: (token, title key, book id) for every token of every book, sorted"""
+        self.version = version
+        self.built_at = self.checked_at = time.monotonic()
+        self.books = books  # id -> (title, author, title key, title tokens, all tokens)
+        self.keys = [entry[0] for entry in entries]
+        self.ids = [entry[2] for entry in entries]
+        titles = sorted((row[2], book_id) for book_id, row in books.items())
+        self.title_keys = [title_key for title_key, _ in titles]
+        self.title_ids = [book_id for _, book_id in titles]
+
+    def entries(self):
+        for token, book_id in zip(self.keys, self.ids):
+            yield token, self.books[book_id][2], book_id
+
+
+def _load_books(queryset):
+    books = {}
+    entries = []
+    for book_id, title, author in queryset.values_list('id', 'title', 'author'):
+        title_tokens = tuple(tokenize(title))
+        title_key = ' '.join(title_tokens)
+        tokens = frozenset(title_tokens) | frozenset(tokenize(author))
+        books[book_id] = (title, author, title_key, title_tokens, tokens)
+        # Within one token, entries run in title order, so capped scans see the best titles first
+        entries.extend((token, title_key, book_id) for token in tokens)
+    return books, entries
+
+
+def build_snapshot(version):
+    books, entries = _load_books(Book.objects.using('default').all())
+    entries.sort()
+    return IndexSnapshot(version, books, entries)
+
+
+def apply_changes(snapshot, version, book_ids):
+    """New snapshot with the given books reloaded (or dropped, if deleted)"""
+    loaded, new_entries = _load_books(Book.objects.using('default').filter(id__in=book_ids))
+    new_entries.sort()
+    kept = (entry for entry in snapshot.entries() if entry[2] not in book_ids)
+    books = {book_id: row for book_id, row in snapshot.books.items() if book_id not in book_ids}
+    books.update(loaded)
+    refreshed = IndexSnapshot(version, books, list(heapq.merge(kept, new_entries)))
+    refreshed.built_at = snapshot.built_at
+    return refreshed
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _is_fresh(self, snapshot):
+        now = time.monotonic()
+        return (
+            now - snapshot.built_at < getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300)
+            and now - snapshot.checked_at < getattr(settings, 'AUTOCOMPLETE_CHECK_INTERVAL', 1.0)
+        )
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh(snapshot):
+            return snapshot
+        # Only the first worker thread to notice refreshes; the others keep using the old snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if snapshot is not None and self._is_fresh(snapshot):
+                return snapshot
+            self._snapshot = snapshot = self._refresh(snapshot)
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def _refresh(self, snapshot):
+        # Read the version before loading rows, so a concurrent change is replayed next time
+        version = catalog_version()
+        now = time.monotonic()
+        if snapshot is None or now - snapshot.built_at >= getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300) \
+                or version < snapshot.version:
+            return build_snapshot(version)
+        if version == snapshot.version:
+            snapshot.checked_at = now
+            return snapshot
+        book_ids = None
+        if version - snapshot.version <= getattr(settings, 'AUTOCOMPLETE_MAX_CHANGES', 500):
+            book_ids = changed_books(snapshot.version, version)
+        if book_ids is None:
+            return build_snapshot(version)
+        return apply_changes(snapshot, version, book_ids)
+
+    def suggest(self, query, limit=10):
+        """
+        Books whose title or author tokens start with every token of the query.
+
+        Titles that start with the query come first, alphabetically, straight
+        from the sorted title keys. The rest are found by walking the narrowest
+        term's token range, capped at AUTOCOMPLETE_MAX_CANDIDATES books, and
+        ranked: title starts with the first term, then any title word does,
+        then author matches.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        snapshot = self.snapshot()
+        books = snapshot.books
+        phrase = ' '.join(terms)
+
+        results = []
+        position = bisect_left(snapshot.title_keys, phrase)
+        while len(results) < limit and position < len(snapshot.title_keys) \
+                and snapshot.title_keys[position].startswith(phrase):
+            results.append(snapshot.title_ids[position])
+            position += 1
+
+        if len(results) < limit:
+            ranges = []
+            for term in terms:
+                start = bisect_left(snapshot.keys, term)
+                ranges.append((bisect_left(snapshot.keys, term + '\uffff', start) - start, start, term))
+            width, start, narrowest = min(ranges)
+            others = [term for term in terms if term != narrowest]
+            seen = set(results)
+            candidates = []
+            cap = getattr(settings, 'AUTOCOMPLETE_MAX_CANDIDATES', 500)
+            for book_id in snapshot.ids[start:start + width]:
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                tokens = books[book_id][4]
+                if all(any(token.startswith(term) for token in tokens) for term in others):
+                    candidates.append(book_id)
+                    if len(candidates) >= cap:
+                        break
+
+            first = terms[0]
+
+            def rank(book_id):
+                title_key, title_tokens = books[book_id][2], books[book_id][3]
+                if title_tokens and title_tokens[0].startswith(first):
+                    tier = 0
+                elif any(token.startswith(first) for token in title_tokens):
+                    tier = 1
+                else:
+                    tier = 2  # matched on the author
+                return (tier, title_key, book_id)
+
+            results.extend(heapq.nsmallest(limit - len(results), candidates, key=rank))
+
+        return [{'id': book_id, 'title': books[book_id][0], 'author': books[book_id][1]} for book_id in results]
+
+
+index = AutocompleteIndex()
@@ -0,0 +1,57 @@
+"""
+Authentication backend that accepts a username or an email address.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Case, IntegerField, Q, When
+
+UserModel = get_user_model()
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Resolve the user by username or email together with their profile in a
+    single query, then verify the password on that row.
+
+    Usernames are case-sensitive and may contain '@', so an exact username
+    match always wins. Otherwise the input is matched case-insensitively
+    against email (when it contains '@') and then username. If the best
+    match is shared by two accounts (emails aren't unique, and usernames can
+    differ only by case), the password is checked against both and the one
+    it belongs to is logged in; if it fits both, neither is.
+
+    Login used to look the user up, authenticate() looked them up again by
+    username, and the view then loaded the profile for the role.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+
+        username = username.strip()
+        matches = Q(username=username) | Q(username__iexact=username)
+        tiers = [When(username=username, then=0)]
+        if '@' in username:
+            matches |= Q(email__iexact=username)
+            tiers.append(When(email__iexact=username, then=1))
+        tiers.append(When(username__iexact=username, then=2))
+
+        candidates = list(
+            UserModel._default_manager
+            .select_related('userprofile')
+            .filter(matches)
+            .annotate(match_tier=Case(*tiers, output_field=IntegerField()))
+            .order_by('match_tier', 'pk')[:2]
+        )
+        if not candidates:
+            # Run the hasher once anyway so unknown users take as long as wrong passwords
+            UserModel().set_password(password)
+            return None
+
+        best = [user for user in candidates if user.match_tier == candidates[0].match_tier]
+        verified = [user for user in best if user.check_password(password) and self.user_can_authenticate(user)]
+        if len(verified) == 1:
+            return verified[0]
+        return None
@@ -0,0 +1,79 @@
+"""
+Catalog version counter and change log.
+
+Every committed change to what the catalog indexes see of a Book (its title,
+author, publication date, whether any copies are on the shelf, or its
+existence) increments `catalog:version` in the cache and records the changed
+book id under `catalog:change:<version>`. A loan or return that leaves copies
+on the shelf changes none of that and is not logged, so it doesn't invalidate
+cached facets. In-process
+structures built from the Book table (the autocomplete index, facet counts)
+compare the version they were built at with the current one, and either
+replay the logged ids or rebuild if entries have expired.
+
+With a shared cache every worker sees every change. With the per-process
+LocMemCache only the worker that made the change does, so readers also rebuild
+after a maximum age.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version'
+CHANGE_KEY_PREFIX = 'catalog:change:'
+CHANGE_LOG_TIMEOUT = 60 * 60
+
+
+# Book fields catalog_state() reads
+CATALOG_FIELDS = ('title', 'author', 'published_date', 'copies_available')
+
+
+def catalog_state(book):
+    """What the catalog indexes see of a book, or None if it can't be compared"""
+    try:
+        return (book.title, book.author, book.published_date, book.copies_available > 0)
+    except TypeError:
+        return None  # e.g. copies_available set to an F() expression
+
+
+def _change_key(version):
+    return f'{CHANGE_KEY_PREFIX}{version}'
+
+
+def catalog_version():
+    """Current catalog version; 0 when nothing has been recorded (or the cache was cleared)"""
+    try:
+        return cache.get(VERSION_KEY) or 0
+    except Exception:
+        return 0
+
+
+def record_catalog_change(book_id):
+    try:
+        cache.add(VERSION_KEY, 0, None)
+        version = cache.incr(VERSION_KEY)
+        cache.set(_change_key(version), book_id, CHANGE_LOG_TIMEOUT)
+    except Exception as e:
+        logger.warning(f'Could not record catalog change for book {book_id}: {str(e)}')
+
+
+def record_catalog_change_on_commit(book_id):
+    """Log the change once the transaction commits, so readers can load the new row"""
+    transaction.on_commit(lambda: record_catalog_change(book_id))
+
+
+def changed_books(since, until):
+    """Book ids changed in versions (since, until], or None if any log entry is gone"""
+    if until <= since:
+        return set()
+    keys = [_change_key(version) for version in range(since + 1, until + 1)]
+    try:
+        found = cache.get_many(keys)
+    except Exception:
+        return None
+    if len(found) != len(keys):
+        return None
+    return set(found.values())
@@ -0,0 +1,73 @@
+"""
+Index-friendly date range predicates for catalog filters.
+
+Year and date filters on Book.published_date are compiled into one half-open
+range, published_date >= lower AND published_date < upper, rather than a
+chain of separate lookups. Comparing the bare column keeps the predicate
+sargable: the planner can seek the published_date indexes (see Book.Meta)
+instead of evaluating EXTRACT(YEAR ...) or a date function on every row.
+
+    compile_date_range(year=1999, after=date(1999, 6, 1))
+    -> (date(1999, 6, 1), date(2000, 1, 1))
+"""
+from datetime import date, timedelta
+
+
+class EmptyRange(ValueError):
+    """The constraints cannot match any date"""
+
+
+def year_range(year):
+    """[Jan 1 of year, Jan 1 of the next year); the upper bound is None for 9999"""
+    if year != int(year) or not date.min.year <= year <= date.max.year:
+        raise EmptyRange(f'{year} is not a valid year')
+    year = int(year)
+    upper = date(year + 1, 1, 1) if year < date.max.year else None
+    return date(year, 1, 1), upper
+
+
+def decade_range(decade):
+    """[Jan 1 of the decade's first year, Jan 1 ten years later), e.g. 1990 -> 1990-1999"""
+    if decade != int(decade) or decade % 10:
+        raise EmptyRange(f'{decade} is not the first year of a decade')
+    lower, _ = year_range(max(decade, 1))
+    _, upper = year_range(min(decade + 9, date.max.year))
+    return lower, upper
+
+
+def intersect(lower, upper, other_lower, other_upper):
+    if other_lower is not None and (lower is None or other_lower > lower):
+        lower = other_lower
+    if other_upper is not None and (upper is None or other_upper < upper):
+        upper = other_upper
+    if lower is not None and upper is not None and lower >= upper:
+        raise EmptyRange(f'{lower} is not before {upper}')
+    return lower, upper
+
+
+def compile_date_range(year=None, decade=None, after=None, before=None):
+    """
+    Half-open (lower, upper) bounds satisfying every given constraint; either
+    bound may be None for an open end. `after` and `before` are inclusive
+    dates, as in the published_after/published_before filters. Raises
+    EmptyRange when nothing can match.
+    """
+    lower, upper = None, None
+    if year is not None:
+        lower, upper = intersect(lower, upper, *year_range(year))
+    if decade is not None:
+        lower, upper = intersect(lower, upper, *decade_range(decade))
+    if after is not None:
+        lower, upper = intersect(lower, upper, after, None)
+    if before is not None:
+        exclusive = before + timedelta(days=1) if before < date.max else None
+        lower, upper = intersect(lower, upper, None, exclusive)
+    return lower, upper
+
+
+def filter_date_range(queryset, field, lower, upper):
+    if lower is not None:
+        queryset = queryset.filter(**{f'{field}__gte': lower})
+    if upper is not None:
+        queryset = queryset.filter(**{f'{field}__lt': upper})
+    return queryset
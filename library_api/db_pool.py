@@ -0,0 +1,63 @@
+"""
+Database connection statistics for the /metrics/ view.
+
+connections_opened counts new connections per alias in this process. With
+persistent connections or PgBouncer it should level off at one per worker
+thread; a steady climb means connections are being dropped and reopened
+(CONN_MAX_AGE expiry, failed health checks or a failover).
+
+pool_stats() reports, per configured alias, whether this thread currently
+holds a connection and how long it has been open, plus psycopg's own pool
+counters when the native pool is in use.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+connections_opened = {}
+_opened_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    with _opened_lock:
+        connections_opened[connection.alias] = connections_opened.get(connection.alias, 0) + 1
+    connection._lms_opened_at = time.monotonic()
+
+
+def pool_mode():
+    return getattr(settings, 'DB_POOL_MODE', 'persistent')
+
+
+def _native_pool_stats(connection):
+    if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+        return None
+    pool = getattr(connection, 'pool', None)  # Django 5.1+
+    if pool is None or not hasattr(pool, 'get_stats'):
+        return None
+    return pool.get_stats()
+
+
+def pool_stats():
+    """Per-alias connection state for the current thread, plus native pool counters"""
+    stats = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        opened_at = getattr(connection, '_lms_opened_at', None)
+        connected = connection.connection is not None
+        entry = {
+            'connected': connected,
+            'age_seconds': round(time.monotonic() - opened_at, 1) if connected and opened_at else None,
+            'opened_total': connections_opened.get(alias, 0),
+            'pool': None,
+        }
+        try:
+            entry['pool'] = _native_pool_stats(connection)
+        except Exception:
+            pass
+        stats[alias] = entry
+    return stats
@@ -0,0 +1,125 @@
+"""
+Primary/replica database routing.
+
+Writes always go to `default`. Reads go to a replica only while a view that
+opted in with ReplicaReadMixin is handling a safe-method request; everything
+else (auth lookups before the view runs, background threads, management
+commands) reads from the primary.
+
+Read-your-writes: after a user's successful unsafe request on one of those
+views (checkout, return, edits), their reads stay on the primary for
+REPLICA_STICKY_SECONDS, which should exceed the usual replication lag.
+The pin is kept in the default cache, so it only holds across workers when
+that cache is shared (Redis). With a per-process cache (LocMem) a write on
+one worker and a read on another would miss it, so replica reads are turned
+off and a warning is logged instead.
+"""
+import contextvars
+import logging
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+
+_warned_unshared_cache = False
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', None) or []
+
+
+def replica_reads_enabled():
+    """True when replicas are configured and the primary pin is visible to every worker"""
+    global _warned_unshared_cache
+    if not replica_aliases():
+        return False
+    from .tokens import cache_is_shared
+
+    if cache_is_shared():
+        return True
+    if not _warned_unshared_cache:
+        _warned_unshared_cache = True
+        logger.warning(
+            'DATABASE_REPLICAS is set but the default cache is per-process; reads stay on the primary '
+            'because the read-your-writes pin needs a shared cache (set REDIS_URL)'
+        )
+    return False
+
+
+def choose_replica(replicas):
+    return random.choice(replicas)
+
+
+def _pin_key(user_id):
+    return f'db:primary-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    """Keep this user's reads on the primary until replicas have caught up"""
+    if not replica_reads_enabled() or not getattr(user, 'is_authenticated', False):
+        return
+    try:
+        cache.set(_pin_key(user.pk), 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 15))
+    except Exception:
+        pass
+
+
+def is_pinned(user):
+    if not getattr(user, 'is_authenticated', False):
+        return False
+    try:
+        return bool(cache.get(_pin_key(user.pk)))
+    except Exception:
+        # Without the pin we can't promise read-your-writes; stay on the primary
+        return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return choose_replica(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
+
+
+class ReplicaReadMixin:
+    """
+    DRF view mixin: serve safe-method requests from a replica unless the user
+    has written recently, and pin the user to the primary after a write.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Runs after authentication, so the pin can be looked up for this user
+        if request.method in SAFE_METHODS and replica_reads_enabled() and not is_pinned(request.user):
+            self._replica_token = _use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _use_replica.reset(token)
+            self._replica_token = None
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(getattr(request, 'user', None))
+        return super().finalize_response(request, response, *args, **kwargs)
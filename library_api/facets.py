@@ -0,0 +1,222 @@
+"""
+Facet counts for the available-books listing: books per author, per decade of
+publication, and available vs. loaned out.
+
+Unfiltered facets, the common case when browsing starts, come from an
+in-process rollup kept per worker. Like the autocomplete index it checks the
+catalog version (see catalog.py) at most every FACETS_CHECK_INTERVAL seconds
+and adjusts its counters for just the books changed since, so a loan or
+return costs one row reload rather than a GROUP BY over Book. It is rebuilt
+when the change log has gaps or more than FACETS_MAX_CHANGES entries, and
+after FACETS_MAX_AGE seconds in any case.
+
+Filtered facets are aggregated in the database once and cached under the
+catalog version and the filter values, so paging through a filtered listing
+reuses them until the next catalog change, or for FACETS_CACHE_SECONDS at
+most. Loans and returns only change the catalog when they empty a shelf or
+restock an empty one (see catalog.py), so they rarely invalidate the cache.
+
+Author and decade counts cover the listed (available) books. Availability
+counts cover every book matching the filters, so the loaned-out remainder
+is visible.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog import catalog_version, changed_books
+from .models import Book
+
+CACHE_PREFIX = 'facets:'
+
+
+def decade_of(published_date):
+    return published_date.year // 10 * 10
+
+
+def _author_limit():
+    return getattr(settings, 'FACETS_AUTHOR_LIMIT', 20)
+
+
+def format_facets(authors, decades, available, unavailable):
+    """authors and decades: iterables of (value, count), already in display order"""
+    return {
+        'author': [{'value': author, 'count': count} for author, count in authors],
+        'decade': [{'value': decade, 'count': count} for decade, count in decades],
+        'availability': [
+            {'value': 'available', 'count': available},
+            {'value': 'unavailable', 'count': unavailable},
+        ],
+    }
+
+
+class FacetRollup:
+    __slots__ = ('version', 'built_at', 'checked_at', 'books', 'authors', 'decades', 'available', 'unavailable')
+
+    def __init__(self, version):
+        self.version = version
+        self.built_at = self.checked_at = time.monotonic()
+        self.books = {}  # id -> (author, decade, is available)
+        self.authors = Counter()  # available books only, like the listing
+        self.decades = Counter()
+        self.available = self.unavailable = 0
+
+    def add(self, book_id, row):
+        self.books[book_id] = row
+        author, decade, is_available = row
+        if is_available:
+            self.authors[author] += 1
+            self.decades[decade] += 1
+            self.available += 1
+        else:
+            self.unavailable += 1
+
+    def discard(self, book_id):
+        row = self.books.pop(book_id, None)
+        if row is None:
+            return
+        author, decade, is_available = row
+        if is_available:
+            self.authors.subtract((author,))
+            self.decades.subtract((decade,))
+            if self.authors[author] <= 0:
+                del self.authors[author]
+            if self.decades[decade] <= 0:
+                del self.decades[decade]
+            self.available -= 1
+        else:
+            self.unavailable -= 1
+
+    def load(self, queryset):
+        for book_id, author, published_date, copies in queryset.values_list(
+                'id', 'author', 'published_date', 'copies_available'):
+            self.add(book_id, (author, decade_of(published_date), copies > 0))
+
+    def facets(self):
+        authors = sorted(self.authors.items(), key=lambda item: (-item[1], item[0]))[:_author_limit()]
+        return format_facets(authors, sorted(self.decades.items()), self.available, self.unavailable)
+
+
+def build_rollup(version):
+    rollup = FacetRollup(version)
+    rollup.load(Book.objects.using('default').all())
+    return rollup
+
+
+def apply_changes(rollup, version, book_ids):
+    """Adjust the counters in place for the given books (reloaded, or dropped if deleted)"""
+    for book_id in book_ids:
+        rollup.discard(book_id)
+    rollup.load(Book.objects.using('default').filter(id__in=book_ids))
+    rollup.version = version
+    return rollup
+
+
+class CatalogFacets:
+    def __init__(self):
+        self._rollup = None
+        self._facets = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._rollup = self._facets = None
+
+    def _is_fresh(self, rollup):
+        now = time.monotonic()
+        return (
+            now - rollup.built_at < getattr(settings, 'FACETS_MAX_AGE', 300)
+            and now - rollup.checked_at < getattr(settings, 'FACETS_CHECK_INTERVAL', 1.0)
+        )
+
+    def unfiltered(self):
+        """Facets of the whole available catalog, from the rollup"""
+        rollup, facets = self._rollup, self._facets
+        if rollup is not None and self._is_fresh(rollup):
+            return facets
+        # Only the first worker thread to notice refreshes; the others keep the last counts
+        if not self._lock.acquire(blocking=rollup is None):
+            return facets
+        try:
+            rollup = self._rollup
+            if rollup is None or not self._is_fresh(rollup):
+                refreshed = self._refresh(rollup)
+                # Counters change in place, so readers only ever see the facets rendered from them
+                self._facets = refreshed.facets()
+                self._rollup = refreshed
+            return self._facets
+        finally:
+            self._lock.release()
+
+    def _refresh(self, rollup):
+        # Read the version before loading rows, so a concurrent change is replayed next time
+        version = catalog_version()
+        now = time.monotonic()
+        if rollup is None or now - rollup.built_at >= getattr(settings, 'FACETS_MAX_AGE', 300) \
+                or version < rollup.version:
+            return build_rollup(version)
+        rollup.checked_at = now
+        if version == rollup.version:
+            return rollup
+        book_ids = None
+        if version - rollup.version <= getattr(settings, 'FACETS_MAX_CHANGES', 500):
+            book_ids = changed_books(rollup.version, version)
+        if book_ids is None:
+            return build_rollup(version)
+        return apply_changes(rollup, version, book_ids)
+
+
+catalog_facets = CatalogFacets()
+
+
+def aggregate_facets(listing, catalog):
+    """
+    Facets by GROUP BY: `listing` is the filtered available books, `catalog`
+    the same filters over every book
+    """
+    listing = listing.using('default').order_by()
+    authors = (
+        listing.values_list('author').annotate(count=Count('id')).order_by('-count', 'author')[:_author_limit()]
+    )
+    decades = Counter()
+    for year, count in listing.values_list('published_date__year').annotate(count=Count('id')):
+        decades[year // 10 * 10] += count
+    availability = catalog.using('default').order_by().aggregate(
+        available=Count('id', filter=Q(copies_available__gt=0)),
+        unavailable=Count('id', filter=Q(copies_available=0)),
+    )
+    return format_facets(list(authors), sorted(decades.items()), availability['available'], availability['unavailable'])
+
+
+def cache_key(version, params):
+    canonical = sorted((name, str(value)) for name, value in params.items())
+    digest = hashlib.sha1(repr(canonical).encode()).hexdigest()
+    return f'{CACHE_PREFIX}{version}:{digest}'
+
+
+def facet_counts(listing, catalog, params):
+    """
+    Facets for the available-books listing. params: the filter values in use
+    (name -> cleaned value); empty means unfiltered.
+    """
+    if not params:
+        return catalog_facets.unfiltered()
+    key = cache_key(catalog_version(), params)
+    try:
+        cached = cache.get(key)
+    except Exception:
+        key, cached = None, None
+    if cached is not None:
+        return cached
+    facets = aggregate_facets(listing, catalog)
+    if key is not None:
+        try:
+            cache.set(key, facets, getattr(settings, 'FACETS_CACHE_SECONDS', 300))
+        except Exception:
+            pass
+    return facets
@@ -0,0 +1,62 @@
+"""
+Password hashers whose cost parameters come from settings.
+
+Login is the most CPU-bound endpoint, so the hashing cost is an operational
+knob rather than a library default. Each hasher reads its parameters from
+settings at call time; Django's must_update() then compares stored hashes
+against the configured cost, so changing a parameter (or the preferred
+algorithm) transparently rehashes passwords on the next successful login.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with PBKDF2_ITERATIONS iterations"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """Scrypt (stdlib hashlib) with SCRYPT_WORK_FACTOR, SCRYPT_BLOCK_SIZE and SCRYPT_PARALLELISM"""
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'SCRYPT_PARALLELISM', ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # scrypt needs roughly 128 * r * (N + p) bytes; OpenSSL's 32 MiB default
+        # is too small for work factors above 2**15
+        return 128 * self.block_size * (self.work_factor + self.parallelism) + 1024 * 1024
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with ARGON2_TIME_COST, ARGON2_MEMORY_COST (KiB) and ARGON2_PARALLELISM; needs argon2-cffi"""
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
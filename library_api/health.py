@@ -0,0 +1,146 @@
+"""
+Liveness and readiness probes for load balancers.
+
+/health/live/ answers from memory: if the worker can run a view, it is alive.
+
+/health/ready/ checks the database, the cache and email delivery, but each
+result is kept in process for HEALTH_CHECK_TTL seconds (HEALTH_EMAIL_CHECK_TTL
+for email, which opens a network connection). Probes every few seconds per
+instance therefore cost at most one `SELECT 1` per TTL. Only one probe
+refreshes an expired check at a time; concurrent probes get the last result.
+
+Only the checks in HEALTH_CRITICAL_CHECKS decide the status code. The others
+are reported as degraded.
+"""
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import JsonResponse
+
+from .startup import startup_state
+
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return None
+
+
+def check_cache():
+    key = 'health:probe'
+    value = str(time.time())
+    cache.set(key, value, 30)
+    if cache.get(key) != value:
+        raise RuntimeError('cache did not return the value just written')
+    return None
+
+
+def check_email():
+    """Configuration plus a TCP connect to the provider; nothing is sent"""
+    backend = getattr(settings, 'EMAIL_BACKEND', '')
+    if 'console' in backend or 'locmem' in backend:
+        if not settings.DEBUG:
+            raise RuntimeError(f'{backend} does not deliver mail')
+        return 'not sending (development backend)'
+
+    if backend.endswith('BrevoAPIEmailBackend'):
+        if not getattr(settings, 'BREVO_API_KEY', ''):
+            raise RuntimeError('BREVO_API_KEY is not set')
+        host, port = 'api.brevo.com', 443
+    else:
+        host, port = settings.EMAIL_HOST, settings.EMAIL_PORT
+
+    timeout = min(getattr(settings, 'EMAIL_TIMEOUT', 10), 3)
+    with socket.create_connection((host, port), timeout=timeout):
+        pass
+    return f'{host}:{port} reachable'
+
+
+CHECKS = {
+    'database': check_database,
+    'cache': check_cache,
+    'email': check_email,
+}
+
+_results = {}
+_refresh_locks = {name: threading.Lock() for name in CHECKS}
+
+
+def _ttl(name):
+    if name == 'email':
+        return getattr(settings, 'HEALTH_EMAIL_CHECK_TTL', 60)
+    return getattr(settings, 'HEALTH_CHECK_TTL', 10)
+
+
+def _run_check(name):
+    started = time.perf_counter()
+    try:
+        detail = CHECKS[name]()
+        result = {'ok': True, 'detail': detail}
+    except Exception as e:
+        result = {'ok': False, 'detail': str(e) or e.__class__.__name__}
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    result['checked_at'] = time.time()
+    return result
+
+
+def get_check(name):
+    """Cached result of one check, refreshed by at most one caller once it expires"""
+    cached = _results.get(name)
+    if cached is not None and time.time() - cached['checked_at'] < _ttl(name):
+        return cached
+    lock = _refresh_locks[name]
+    if not lock.acquire(blocking=cached is None):
+        return cached  # another probe is refreshing; serve the last result
+    try:
+        cached = _results.get(name)
+        if cached is None or time.time() - cached['checked_at'] >= _ttl(name):
+            cached = _results[name] = _run_check(name)
+        return cached
+    finally:
+        lock.release()
+
+
+def reset_checks():
+    _results.clear()
+
+
+def readiness(include_details=False):
+    critical = set(getattr(settings, 'HEALTH_CRITICAL_CHECKS', ['database']))
+    checks = {}
+    ready = True
+    for name in CHECKS:
+        result = get_check(name)
+        now = time.time()
+        if not result['ok'] and name in critical:
+            ready = False
+        checks[name] = {
+            'status': 'ok' if result['ok'] else ('failing' if name in critical else 'degraded'),
+            'duration_ms': result['duration_ms'],
+            'age_seconds': round(now - result['checked_at'], 1),
+        }
+        if include_details and result['detail']:
+            checks[name]['detail'] = result['detail']
+    return ready, {
+        'status': 'ready' if ready else 'not_ready',
+        'startup': startup_state['status'],
+        'checks': checks,
+    }
+
+
+def liveness_view(request):
+    """No I/O: the process is up and serving requests"""
+    return JsonResponse({'status': 'alive'})
+
+
+def readiness_view(request):
+    """Cached dependency checks; 503 when a critical dependency is down"""
+    user = getattr(request, 'user', None)
+    include_details = settings.DEBUG or bool(user is not None and user.is_superuser)
+    ready, payload = readiness(include_details=include_details)
+    return JsonResponse(payload, status=200 if ready else 503)
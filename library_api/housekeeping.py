@@ -0,0 +1,121 @@
+"""
+Housekeeping tasks that keep the auth support tables small.
+
+PasswordResetCode rows are only ever flagged as used, and with refresh token
+rotation the simplejwt OutstandingToken/BlacklistedToken tables grow on every
+refresh. The helpers here delete dead rows in bounded batches so each DELETE
+is a short transaction and never holds locks on the whole table.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PasswordResetCode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+_scheduler_thread = None
+_scheduler_lock = threading.Lock()
+
+
+def delete_in_batches(queryset, batch_size=DEFAULT_BATCH_SIZE, pause=0.0):
+    """
+    Delete the rows matched by queryset, at most batch_size primary keys at a time.
+
+    Returns the total number of rows removed, including cascaded rows.
+    """
+    model = queryset.model
+    total = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        deleted, _ = model.objects.filter(pk__in=pks).delete()
+        total += deleted
+        if len(pks) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def expired_reset_codes(grace=timedelta(0)):
+    """Reset codes that are used or past their expiry (older than the grace period)"""
+    cutoff = timezone.now() - grace
+    return PasswordResetCode.objects.filter(
+        Q(expires_at__lt=cutoff) | Q(used=True, created_at__lt=cutoff)
+    )
+
+
+def expired_outstanding_tokens(grace=timedelta(0)):
+    """Outstanding refresh tokens past their expiry; their blacklist rows cascade"""
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    return OutstandingToken.objects.filter(expires_at__lt=timezone.now() - grace)
+
+
+def run_housekeeping(batch_size=DEFAULT_BATCH_SIZE, pause=0.0, grace=timedelta(0), dry_run=False):
+    """
+    Purge expired password reset codes and refresh tokens.
+
+    Returns a dict with the number of rows reclaimed per table (or the number
+    that would be reclaimed when dry_run is set).
+    """
+    codes = expired_reset_codes(grace)
+    tokens = expired_outstanding_tokens(grace)
+
+    if dry_run:
+        return {
+            'password_reset_codes': codes.count(),
+            'outstanding_tokens': tokens.count(),
+        }
+
+    return {
+        'password_reset_codes': delete_in_batches(codes, batch_size, pause),
+        'outstanding_tokens': delete_in_batches(tokens, batch_size, pause),
+    }
+
+
+def _scheduler_loop(interval, batch_size):
+    # Stagger workers so they don't all hit the database at the same moment
+    time.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        try:
+            reclaimed = run_housekeeping(batch_size=batch_size)
+            if any(reclaimed.values()):
+                logger.info(f'Housekeeping reclaimed rows: {reclaimed}')
+        except Exception as e:
+            logger.warning(f'Housekeeping run failed: {str(e)}')
+        finally:
+            close_old_connections()
+        time.sleep(interval)
+
+
+def start_housekeeping_scheduler(interval, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Start a daemon thread that runs housekeeping every `interval` seconds.
+
+    Safe to call more than once per process; only one thread is started.
+    """
+    global _scheduler_thread
+    if not interval or interval <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(
+                target=_scheduler_loop,
+                args=(interval, batch_size),
+                name='library-housekeeping',
+                daemon=True,
+            )
+            _scheduler_thread.start()
+            logger.info(f'Housekeeping scheduler started (every {interval}s)')
+    return _scheduler_thread
@@ -0,0 +1,67 @@
+"""
+ISBN normalization.
+
+Books are stored under their ISBN-13, digits only. Input may be an ISBN-10 or
+ISBN-13, with or without hyphens and spaces (e.g. '0-306-40615-2' and
+'978-0-306-40615-7' are the same book), so every form of an ISBN maps to one
+key and lookups are a single seek on the unique isbn index.
+"""
+import re
+
+_SEPARATORS_RE = re.compile(r'[\s\-\u2010-\u2015]')
+
+
+class InvalidISBN(ValueError):
+    pass
+
+
+def clean(raw):
+    """Strip separators and uppercase the ISBN-10 'X' check digit"""
+    return _SEPARATORS_RE.sub('', str(raw or '')).upper()
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_check_digit(first9):
+    total = sum(int(digit) * (10 - index) for index, digit in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def is_valid_isbn13(value):
+    return len(value) == 13 and value.isdigit() and isbn13_check_digit(value[:12]) == value[12]
+
+
+def is_valid_isbn10(value):
+    return (
+        len(value) == 10 and value[:9].isdigit() and (value[9].isdigit() or value[9] == 'X')
+        and isbn10_check_digit(value[:9]) == value[9]
+    )
+
+
+def normalize_isbn(raw):
+    """Canonical ISBN-13 for any valid ISBN-10/13 form; raises InvalidISBN otherwise"""
+    value = clean(raw)
+    if is_valid_isbn13(value):
+        return value
+    if is_valid_isbn10(value):
+        first12 = '978' + value[:9]
+        return first12 + isbn13_check_digit(first12)
+    if len(value) in (10, 13):
+        raise InvalidISBN(f'{raw} has an invalid check digit')
+    raise InvalidISBN(f'{raw} is not a 10 or 13 digit ISBN')
+
+
+def lookup_key(raw):
+    """
+    The value to match Book.isbn against: the canonical ISBN-13 when the input
+    is valid, otherwise the input as given (trimmed). Invalid ISBNs are stored
+    as entered, separators included, so they only match when typed the same way.
+    """
+    try:
+        return normalize_isbn(raw)
+    except InvalidISBN:
+        return str(raw or '').strip()
@@ -0,0 +1,184 @@
+"""
+Logging pipeline: JSON lines, request ids, sampling and a non-blocking queue.
+
+Loggers write to a QueuedHandler, which only formats the message and puts the
+record on an in-memory queue. A QueueListener thread does the console and
+file I/O, so a slow disk or a burst of log lines never holds up a request.
+When the queue is full, records are dropped and counted rather than blocking;
+the count is exported as lms_log_records_dropped_total (see metrics.py) and
+reported on stderr at most every DROP_WARNING_INTERVAL seconds.
+
+RequestIdMiddleware (in middleware.py) stores the request id in a context
+variable, and every record picks it up when it is queued. SamplingFilter keeps
+a fraction of sub-WARNING records from chatty loggers (LOG_SAMPLING in settings).
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+DROP_WARNING_INTERVAL = 60
+
+_queued_handlers = weakref.WeakSet()
+
+# Attributes every LogRecord has; anything else was passed via extra= and is logged too
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+def _handler_by_name(name):
+    get_handler = getattr(logging, 'getHandlerByName', None)  # Python 3.12+
+    if get_handler is not None:
+        return get_handler(name)
+    return logging._handlers.get(name)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, request id and extras"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None) or request_id_var.get(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only `rate` of the records below WARNING from the given logger prefixes.
+
+    rates maps a logger name (or prefix) to the fraction to keep, e.g.
+    {'library_api.views': 0.1}. The longest matching prefix wins; warnings and
+    errors always pass.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+class QueuedHandler(QueueHandler):
+    """
+    Queue records for the target handlers (names or instances), written by a background listener.
+
+    The listener starts on the first record in each process, so it also works
+    when gunicorn forks workers after settings are loaded.
+    """
+
+    def __init__(self, handlers=(), queue_size=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        # Hold the targets here: the logging module only keeps weak references to
+        # named handlers, and these are not attached to any logger themselves
+        self.targets = []
+        for name in handlers:
+            target = name if isinstance(name, logging.Handler) else _handler_by_name(name)
+            if target is None:
+                # dictConfig retries handlers whose error mentions this phrase
+                raise ValueError(f'target not configured yet: {name}')
+            self.targets.append(target)
+        self.queue_size = queue_size
+        self.respect_handler_level = respect_handler_level
+        self.dropped = 0
+        self._warned_at = None
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        _queued_handlers.add(self)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A listener inherited across fork has no thread; start over with a fresh queue
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self._listener = QueueListener(self.queue, *self.targets, respect_handler_level=self.respect_handler_level)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush_and_stop)
+
+    def prepare(self, record):
+        # Render the message on the calling thread, where args and the request id are valid.
+        # Work on a copy: other handlers on the logger still see the original record.
+        record = copy.copy(record)
+        record.request_id = request_id_var.get()
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._warn_dropped()
+
+    def _warn_dropped(self):
+        # Straight to stderr: logging the warning would only queue another record
+        now = time.monotonic()
+        if self._warned_at is not None and now - self._warned_at < DROP_WARNING_INTERVAL:
+            return
+        self._warned_at = now
+        try:
+            sys.stderr.write(
+                f'library_api.logs: log queue full ({self.queue_size} records), '
+                f'{self.dropped} records dropped in process {os.getpid()}\n'
+            )
+        except Exception:
+            pass
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def flush_and_stop(self):
+        """Write out everything still queued (called at exit)"""
+        listener = self._listener
+        if listener is not None and self._pid == os.getpid():
+            self._listener = None
+            self._pid = None
+            try:
+                listener.stop()
+            except queue.Full:
+                pass
+
+
+def dropped_records():
+    """Records dropped on a full queue by this process's QueuedHandlers"""
+    return sum(handler.dropped for handler in list(_queued_handlers))
@@ -0,0 +1,273 @@
+"""
+Benchmark the circulation hot paths against a synthetic library in a throwaway test database.
+Usage: python manage.py bench [--books 2000] [--users 200] [--transactions 5000]
+                              [--requests 200] [--threads 4] [--scenario search] [--output bench.json]
+"""
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from library_api.models import Book, Transaction, UserProfile
+
+SCENARIOS = ('checkout', 'return', 'search', 'my_books', 'overdue')
+
+WORDS = (
+    'river', 'shadow', 'garden', 'empire', 'winter', 'silent', 'golden', 'night', 'ocean', 'stone',
+    'forest', 'machine', 'history', 'letters', 'island', 'secret', 'city', 'fire', 'glass', 'journey',
+)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class QueryCounter:
+    """execute_wrapper that counts queries and rows returned on one connection"""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        # SQLite reports -1 for SELECT row counts; only trust drivers that report them
+        self.rows_known = False
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        rowcount = getattr(context['cursor'], 'rowcount', -1)
+        if sql.lstrip()[:6].upper() == 'SELECT' and rowcount is not None and rowcount >= 0:
+            self.rows += rowcount
+            self.rows_known = True
+        return result
+
+
+class Command(BaseCommand):
+    help = 'Seeds a synthetic library in a test database and reports latency and query counts per endpoint as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--transactions', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Concurrent client threads per scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, default=[],
+                            help='Only run this scenario; repeatable')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Random seed, so runs on different commits see the same data')
+        parser.add_argument('--output', metavar='FILE',
+                            help='Also write the JSON report to FILE')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs (reseeded each time)')
+
+    # ---- seeding --------------------------------------------------------
+
+    def seed(self, books, users, transactions, rng):
+        Transaction.objects.all().delete()
+        UserProfile.objects.all().delete()
+        User.objects.filter(username__startswith='bench_').delete()
+        Book.objects.all().delete()
+
+        password = make_password(None)  # unusable; requests authenticate with JWT
+        User.objects.bulk_create(
+            [User(username=f'bench_{i}', email=f'bench_{i}@example.com', password=password) for i in range(users)],
+            batch_size=1000,
+        )
+        user_ids = list(User.objects.filter(username__startswith='bench_').values_list('id', flat=True))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id, role='member') for user_id in user_ids],
+            batch_size=1000,
+        )
+
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=' '.join(rng.sample(WORDS, 3)).title() + f' {i}',
+                    author=f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son',
+                    isbn=f'{9780000000000 + i}',
+                    published_date=date(1950, 1, 1) + timedelta(days=rng.randrange(27000)),
+                    copies_available=rng.randint(1, 5),
+                )
+                for i in range(books)
+            ],
+            batch_size=1000,
+        )
+        book_ids = list(Book.objects.values_list('id', flat=True))
+
+        today = timezone.now().date()
+        rows = []
+        for _ in range(transactions):
+            checkout = today - timedelta(days=rng.randrange(60))
+            returned = rng.random() < 0.7
+            rows.append(Transaction(
+                book_id=rng.choice(book_ids),
+                user_id=rng.choice(user_ids),
+                checkout_date=checkout,
+                due_date=checkout + timedelta(days=14),
+                return_date=checkout + timedelta(days=rng.randrange(1, 20)) if returned else None,
+            ))
+        Transaction.objects.bulk_create(rows, batch_size=1000)
+        return user_ids, book_ids
+
+    # ---- scenarios ------------------------------------------------------
+
+    def build_requests(self, scenario, count, user_ids, book_ids, rng):
+        """Return a list of (user_id, method, path, data) to replay"""
+        if scenario == 'checkout':
+            return [
+                (rng.choice(user_ids), 'post', '/api/checkout/', {'book': rng.choice(book_ids)})
+                for _ in range(count)
+            ]
+        if scenario == 'return':
+            open_loans = list(
+                Transaction.objects.filter(return_date__isnull=True).values_list('id', 'user_id')[:count]
+            )
+            return [(user_id, 'patch', f'/api/return/{pk}/', {}) for pk, user_id in open_loans]
+        if scenario == 'search':
+            return [
+                (rng.choice(user_ids), 'get', '/api/available-books/', {'search': rng.choice(WORDS)})
+                for _ in range(count)
+            ]
+        if scenario == 'my_books':
+            return [(rng.choice(user_ids), 'get', '/api/my-books/', {}) for _ in range(count)]
+        return [(rng.choice(user_ids), 'get', '/api/overdue-books/', {}) for _ in range(count)]
+
+    def run_scenario(self, planned, threads, tokens):
+        samples = []
+        lock = threading.Lock()
+        slices = [planned[i::threads] for i in range(threads)]
+
+        def worker(work):
+            client = APIClient()
+            results = []
+            try:
+                for user_id, method, path, data in work:
+                    client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[user_id]}')
+                    counter = QueryCounter()
+                    with connection.execute_wrapper(counter):
+                        started = time.perf_counter()
+                        response = getattr(client, method)(path, data, format='json' if method != 'get' else None, secure=True)
+                        elapsed = time.perf_counter() - started
+                    results.append((elapsed, counter.queries, counter.rows if counter.rows_known else None, response.status_code))
+            finally:
+                # Closing ends the backend, which flushes its statistics for rows_scanned
+                connections.close_all()
+            with lock:
+                samples.extend(results)
+
+        scanned_before = self.rows_scanned()
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(work,)) for work in slices if work]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        wall = time.perf_counter() - started
+        scanned_after = self.rows_scanned()
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        count = len(samples) or 1
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[3] >= 400),
+            'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+            'p90_ms': round(percentile(latencies, 90), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+            'mean_ms': round(sum(latencies) / count, 2),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+            'queries_per_request': round(sum(sample[1] for sample in samples) / count, 2),
+            'rows_fetched_per_request': (
+                round(sum(sample[2] for sample in samples) / count, 1)
+                if samples and all(sample[2] is not None for sample in samples) else None
+            ),
+            'rows_scanned_per_request': (
+                round((scanned_after - scanned_before) / count, 1)
+                if scanned_before is not None and scanned_after is not None else None
+            ),
+        }
+
+    def rows_scanned(self):
+        """Rows read by sequential scans plus index entries returned (Postgres only)"""
+        if connection.vendor != 'postgresql':
+            return None
+        time.sleep(0.5)  # let closed backends report their statistics
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_stat_clear_snapshot()')
+            cursor.execute('SELECT tup_returned FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+    # ---- entry point ----------------------------------------------------
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, cwd=settings.BASE_DIR, timeout=5,
+            ).stdout.strip() or None
+        except Exception:
+            return None
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        threads = max(options['threads'], 1)
+        rng = random.Random(options['seed'])
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']):
+                seeded = time.perf_counter()
+                user_ids, book_ids = self.seed(options['books'], options['users'], options['transactions'], rng)
+                seed_seconds = time.perf_counter() - seeded
+                tokens = {user_id: str(AccessToken.for_user(User(id=user_id))) for user_id in user_ids}
+
+                results = {}
+                for scenario in scenarios:
+                    planned = self.build_requests(scenario, options['requests'], user_ids, book_ids, rng)
+                    if not planned:
+                        raise CommandError(f'Nothing to replay for {scenario}; seed more transactions')
+                    results[scenario] = self.run_scenario(planned, threads, tokens)
+                    self.stderr.write(
+                        f"{scenario:<10} p50 {results[scenario]['p50_ms']} ms, "
+                        f"p99 {results[scenario]['p99_ms']} ms, "
+                        f"{results[scenario]['queries_per_request']} queries/request"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'revision': self.git_revision(),
+            'database': connection.vendor,
+            'dataset': {
+                'books': options['books'],
+                'users': options['users'],
+                'transactions': options['transactions'],
+                'seed': options['seed'],
+                'seed_seconds': round(seed_seconds, 2),
+            },
+            'threads': threads,
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
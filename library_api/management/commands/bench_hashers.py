@@ -0,0 +1,53 @@
+"""
+Benchmark the configured password hashers to size gunicorn workers.
+Usage: python manage.py bench_hashers [--rounds 5] [--hasher scrypt]
+"""
+import os
+import time
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+
+
+class Command(BaseCommand):
+    help = 'Reports password hashes per second per core for each configured hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Number of hashes to time per hasher')
+        parser.add_argument('--hasher', action='append', default=[],
+                            help='Only benchmark this algorithm (e.g. pbkdf2_sha256, scrypt, argon2); repeatable')
+
+    def handle(self, *args, **options):
+        rounds = max(options['rounds'], 1)
+        wanted = set(options['hasher'])
+        cores = os.cpu_count() or 1
+        password = get_random_string(16)
+
+        self.stdout.write(f'CPU cores: {cores}, rounds per hasher: {rounds}')
+        self.stdout.write(f"{'algorithm':<16} {'ms/hash':>10} {'hashes/s/core':>14} {'hashes/s (all cores)':>21}")
+
+        for index, hasher in enumerate(get_hashers()):
+            if wanted and hasher.algorithm not in wanted:
+                continue
+            try:
+                hasher.encode(password, hasher.salt())  # warm-up, loads optional libraries
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    hasher.encode(password, hasher.salt())
+                elapsed = time.perf_counter() - started
+            except (ValueError, ImportError) as e:
+                self.stdout.write(self.style.WARNING(f'{hasher.algorithm:<16} skipped: {str(e)}'))
+                continue
+
+            per_hash = elapsed / rounds
+            per_core = 1 / per_hash if per_hash else float('inf')
+            label = f'{hasher.algorithm} *' if index == 0 else hasher.algorithm
+            self.stdout.write(f'{label:<16} {per_hash * 1000:>10.1f} {per_core:>14.1f} {per_core * cores:>21.1f}')
+
+        self.stdout.write('* preferred hasher (used for new and upgraded passwords)')
+        self.stdout.write(
+            'Each sync gunicorn worker verifies at most hashes/s/core logins per second; '
+            'size workers so peak logins stay below workers x that rate.'
+        )
@@ -0,0 +1,102 @@
+"""
+Compare JSON rendering and parsing throughput for DRF's stdlib classes and the orjson-backed ones.
+Usage: python manage.py bench_json [--rows 100] [--seconds 1.0]
+"""
+import io
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from library_api import renderers
+from library_api.models import Book, Transaction
+from library_api.serializers import BookSerializer, TransactionSerializer
+
+
+def sample_payloads(rows):
+    """Paginated responses shaped like /api/books/ and /api/transaction-history/"""
+    books = [
+        Book(id=i, title=f'Collected Letters, Volume {i}', author='Ada Q. Writer',
+             isbn=f'{9780000000000 + i}', published_date=date(1990, 1, 1) + timedelta(days=i),
+             copies_available=i % 7)
+        for i in range(1, rows + 1)
+    ]
+    user = User(id=1, username='reader')
+    transactions = [
+        Transaction(id=i, book=books[i - 1], user=user,
+                    checkout_date=date(2024, 1, 1), due_date=date(2024, 1, 15),
+                    return_date=date(2024, 1, 20) if i % 2 else None,
+                    overdue_penalty=Decimal('2.50') if i % 2 else Decimal('0.00'))
+        for i in range(1, rows + 1)
+    ]
+
+    def page(results):
+        return {'count': rows * 10, 'next': '/api/books/?limit=100&offset=100', 'previous': None, 'results': results}
+
+    return {
+        'books': page(BookSerializer(books, many=True).data),
+        'transaction_history': page(TransactionSerializer(transactions, many=True).data),
+    }
+
+
+def throughput(func, seconds):
+    """Calls per CPU second and the CPU time of one call"""
+    calls = 0
+    started = time.process_time()
+    deadline = started + seconds
+    while True:
+        func()
+        calls += 1
+        now = time.process_time()
+        if now >= deadline:
+            break
+    elapsed = now - started
+    return calls / elapsed, elapsed / calls
+
+
+class Command(BaseCommand):
+    help = 'Reports MB/s per core for rendering and parsing API payloads with the default and fast JSON classes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100,
+                            help='Rows per page (PAGE_SIZE)')
+        parser.add_argument('--seconds', type=float, default=1.0,
+                            help='CPU seconds to spend per measurement')
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson is not installed; the fast classes fall back to the stdlib and will match the default'
+            ))
+
+        seconds = max(options['seconds'], 0.05)
+        classes = {
+            'default': (JSONRenderer(), JSONParser()),
+            'fast': (renderers.FastJSONRenderer(), renderers.FastJSONParser()),
+        }
+
+        self.stdout.write(f"{'payload':<22} {'op':<7} {'class':<8} {'bytes':>9} {'us/call':>10} {'MB/s/core':>10}")
+        for name, data in sample_payloads(max(options['rows'], 1)).items():
+            body = JSONRenderer().render(data)
+            results = {}
+            for label, (renderer, parser) in classes.items():
+                rate, per_call = throughput(lambda: renderer.render(data), seconds)
+                results[('render', label)] = rate
+                self.stdout.write(
+                    f'{name:<22} {"render":<7} {label:<8} {len(body):>9} {per_call * 1e6:>10.1f} '
+                    f'{rate * len(body) / 1e6:>10.1f}'
+                )
+                rate, per_call = throughput(lambda: parser.parse(io.BytesIO(body), parser_context={}), seconds)
+                results[('parse', label)] = rate
+                self.stdout.write(
+                    f'{name:<22} {"parse":<7} {label:<8} {len(body):>9} {per_call * 1e6:>10.1f} '
+                    f'{rate * len(body) / 1e6:>10.1f}'
+                )
+            for op in ('render', 'parse'):
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}: {op} is {results[(op, "fast")] / results[(op, "default")]:.1f}x the default'
+                ))
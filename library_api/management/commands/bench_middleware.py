@@ -0,0 +1,80 @@
+"""
+Measure per-request middleware overhead for API paths with and without the lean profile.
+Usage: python manage.py bench_middleware [--requests 5000] [--path /api/bench/] [--no-cookie]
+"""
+import time
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import re_path
+from django.utils.crypto import get_random_string
+
+
+def _noop_view(request):
+    # What DRF's SessionAuthentication does before JWTAuthentication gets a turn
+    user = getattr(request, 'user', None)
+    if user is not None:
+        user.is_active
+    return HttpResponse(b'{}', content_type='application/json')
+
+
+class BenchURLConf:
+    """Routes every path to a near-empty view, so only middleware is measured"""
+    urlpatterns = [re_path(r'^.*$', _noop_view)]
+
+
+class Command(BaseCommand):
+    help = 'Compares middleware overhead per request for the full stack and the lean API profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000,
+                            help='Requests to time per profile')
+        parser.add_argument('--path', default='/api/bench/',
+                            help='Request path (should fall under LEAN_API_PREFIXES)')
+        parser.add_argument('--no-cookie', action='store_true',
+                            help='Send requests without a session cookie')
+
+    def _time_profile(self, lean_prefixes, path, count, session_key):
+        with override_settings(
+            LEAN_API_PREFIXES=lean_prefixes,
+            ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+        ):
+            handler = BaseHandler()
+            handler.load_middleware()
+            factory = RequestFactory()
+
+            def run_once():
+                request = factory.get(path, secure=True, HTTP_AUTHORIZATION='Bearer x')
+                if session_key:
+                    # Browser clients on the same site send the admin session cookie too
+                    request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+                request.urlconf = BenchURLConf
+                return handler.get_response(request)
+
+            response = run_once()
+            if response.status_code != 200:
+                raise CommandError(f'{path} returned {response.status_code}; check ALLOWED_HOSTS and redirects')
+            for _ in range(min(count, 200)):
+                run_once()
+            started = time.perf_counter()
+            for _ in range(count):
+                run_once()
+            return (time.perf_counter() - started) / count
+
+    def handle(self, *args, **options):
+        count = max(options['requests'], 1)
+        path = options['path']
+        session_key = None if options['no_cookie'] else get_random_string(32)
+
+        full = self._time_profile([], path, count, session_key)
+        lean = self._time_profile(settings.LEAN_API_PREFIXES or ['/api/'], path, count, session_key)
+
+        self.stdout.write(f"Path: {path}, requests per profile: {count}, session cookie: {'no' if session_key is None else 'yes'}")
+        self.stdout.write(f'Full middleware stack: {full * 1e6:8.1f} us/request')
+        self.stdout.write(f'Lean API profile:      {lean * 1e6:8.1f} us/request')
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {(full - lean) * 1e6:.1f} us/request ({(1 - lean / full) * 100 if full else 0:.0f}%)'
+        ))
@@ -0,0 +1,40 @@
+"""
+Delete expired password reset codes and expired refresh tokens in small batches.
+Usage: python manage.py housekeeping [--batch-size 500] [--pause 0.1] [--dry-run]
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from library_api.housekeeping import DEFAULT_BATCH_SIZE, run_housekeeping
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired/used PasswordResetCode rows and expired simplejwt tokens in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Maximum rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--grace-hours', type=float, default=0.0,
+                            help='Keep rows that expired less than this many hours ago')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many rows would be deleted')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            self.stdout.write(self.style.ERROR('Error: --batch-size must be a positive integer.'))
+            return
+
+        reclaimed = run_housekeeping(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            grace=timedelta(hours=options['grace_hours']),
+            dry_run=options['dry_run'],
+        )
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f"{verb} {reclaimed['password_reset_codes']} password reset code(s)")
+        self.stdout.write(f"{verb} {reclaimed['outstanding_tokens']} expired token row(s), including cascaded blacklist entries")
+        self.stdout.write(self.style.SUCCESS(f'Housekeeping complete: {sum(reclaimed.values())} row(s)'))
@@ -0,0 +1,343 @@
+"""
+Profile import cost and time-to-first-request of a fresh worker process.
+Usage: python manage.py profile_startup [--path /api/books/] [--runs 3] [--json] [--compare baseline.json]
+"""
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: boots Django the way a gunicorn worker does, by
+# importing the project's WSGI module (settings.WSGI_APPLICATION, so the startup
+# checks and housekeeping scheduler it starts are included), and serves one
+# request through that application.
+FIRST_REQUEST_SCRIPT = '''
+import importlib, importlib.util, json, sys, time
+
+if 'importtime' in sys._xoptions:
+    # -X importtime only reports imports that go through __import__, but Django
+    # loads apps, models, middleware and urlconfs with importlib.import_module
+    def import_module(name, package=None):
+        name = importlib.util.resolve_name(name, package) if name.startswith('.') else name
+        __import__(name)
+        return sys.modules[name]
+    importlib.import_module = import_module
+
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+# get_wsgi_application() in the module calls django.setup() again, which is a no-op by now
+wsgi_module, _, wsgi_attr = sys.argv[3].rpartition('.')
+application = getattr(importlib.import_module(wsgi_module), wsgi_attr)
+wsgi_done = time.perf_counter()
+from django.test import RequestFactory
+
+def serve(path, host):
+    environ = RequestFactory()._base_environ(PATH_INFO=path, HTTP_HOST=host, **{'wsgi.url_scheme': 'https'})
+    status = []
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    b''.join(body)
+    getattr(body, 'close', lambda: None)()
+    return status[0] if status else ''
+
+first_status = serve(sys.argv[1], sys.argv[2])
+first_done = time.perf_counter()
+serve(sys.argv[1], sys.argv[2])
+second_done = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - started) * 1000,
+    'wsgi_ms': (wsgi_done - setup_done) * 1000,
+    'first_request_ms': (first_done - wsgi_done) * 1000,
+    'second_request_ms': (second_done - first_done) * 1000,
+    'total_ms': (first_done - started) * 1000,
+    'status': first_status,
+}))
+'''
+
+# Heavy components that only some requests need, and how to stop paying for them at boot
+LAZY_IMPORT_CANDIDATES = {
+    'drf_spectacular': (
+        'OpenAPI schema generation',
+        'Only /api/schema/, /swagger/ and /redoc/ need it; move the docs routes into a '
+        'separate urlconf module included lazily, and keep it out of DEBUG=False boots.',
+    ),
+    'rest_framework_simplejwt.token_blacklist': (
+        'Refresh token blacklist models',
+        'Loaded as an installed app; keep model imports inside tokens.py/housekeeping.py '
+        'functions rather than at module level in views and serializers.',
+    ),
+    'django.core.mail': (
+        'Email sending',
+        'Only password reset sends mail; import send_mail inside the code paths that send.',
+    ),
+    'library_api.email_backends': (
+        'Brevo API email backend',
+        'Resolved by get_connection() on first send; must not be imported at module level.',
+    ),
+    'requests': (
+        'HTTP client used by the Brevo backend',
+        'Import inside BrevoAPIEmailBackend.send_messages() so boots without email skip it.',
+    ),
+    'dotenv': (
+        'Loading .env files',
+        'Production settings come from the platform environment; only load .env when the file exists.',
+    ),
+}
+
+PROJECT_PACKAGES = ('library_api', 'library_management_system')
+
+# Report values --compare shows deltas for
+COMPARED_METRICS = (
+    ('imports', 'total_self_ms'),
+    ('cold_start', 'setup_ms'),
+    ('cold_start', 'wsgi_ms'),
+    ('cold_start', 'first_request_ms'),
+    ('cold_start', 'total_ms'),
+)
+
+
+def compare_reports(report, baseline):
+    """{'cold_start.total_ms': {'baseline': ..., 'current': ..., 'delta': ...}} for metrics both reports have"""
+    comparison = {}
+    for section, key in COMPARED_METRICS:
+        current = report.get(section, {}).get(key)
+        previous = baseline.get(section, {}).get(key) if isinstance(baseline.get(section), dict) else None
+        if isinstance(current, (int, float)) and isinstance(previous, (int, float)):
+            comparison[f'{section}.{key}'] = {
+                'baseline': previous,
+                'current': current,
+                'delta': round(current - previous, 1),
+            }
+    return comparison
+
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (module, self_us, cumulative_us, depth) in print order"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        stripped = name.lstrip(' ')
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((stripped.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def component_cost_us(rows, prefix):
+    """Cumulative import time of the outermost modules under prefix (children are not double counted)"""
+    def matches(name):
+        return name == prefix or name.startswith(prefix + '.')
+
+    total = 0
+    stack = []  # (depth, inside a matching module)
+    # importtime prints children before parents; walk parents first
+    for name, self_us, cumulative_us, depth in reversed(rows):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        inside = any(flag for _, flag in stack)
+        if matches(name) and not inside:
+            total += cumulative_us
+        stack.append((depth, inside or matches(name)))
+    return total
+
+
+def scan_imports(base_dir):
+    """Yield (module, 'path:line', lazy) for every import in the project source"""
+    for package in PROJECT_PACKAGES:
+        for path in sorted((Path(base_dir) / package).rglob('*.py')):
+            relative = path.relative_to(base_dir)
+            if 'migrations' in relative.parts or 'management' in relative.parts or path.name == 'tests.py':
+                continue
+            try:
+                tree = ast.parse(path.read_text(), filename=str(path))
+            except SyntaxError:
+                continue
+            module_package = '.'.join(relative.with_suffix('').parts[:-1])
+            yield from _walk_imports(tree, module_package, str(relative), lazy=False)
+
+
+def _walk_imports(node, module_package, location, lazy):
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.Import):
+            for alias in child.names:
+                yield alias.name, f'{location}:{child.lineno}', lazy
+        elif isinstance(child, ast.ImportFrom):
+            if child.level:
+                parts = module_package.split('.')
+                base = '.'.join(parts[:len(parts) - child.level + 1])
+                target = f'{base}.{child.module}' if child.module else base
+            else:
+                target = child.module
+            yield target, f'{location}:{child.lineno}', lazy
+            for alias in child.names:
+                yield f'{target}.{alias.name}', f'{location}:{child.lineno}', lazy
+        else:
+            nested = lazy or isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda))
+            yield from _walk_imports(child, module_package, location, nested)
+
+
+class Command(BaseCommand):
+    help = 'Reports per-module import cost, time-to-first-request and a lazy-import plan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/books/',
+                            help='Path of the first request')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Fresh processes to time (median is reported)')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Number of modules and packages to list')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON (save it to compare later releases)')
+        parser.add_argument('--compare', metavar='FILE',
+                            help='Earlier --json report to show deltas against (added as "comparison" with --json)')
+
+    def _run(self, extra_args, path, host):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, *extra_args, '-c', FIRST_REQUEST_SCRIPT, path, host, settings.WSGI_APPLICATION],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        try:
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            raise CommandError(f'Profiling process failed:\n{result.stderr[-2000:]}')
+        return timings, result.stderr
+
+    def _host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host and host != '*' and not host.startswith('.'):
+                return host
+        return 'localhost'
+
+    def build_report(self, path, runs, top):
+        host = self._host()
+        _, stderr = self._run(['-X', 'importtime'], path, host)
+        rows = parse_importtime(stderr)
+
+        by_package = {}
+        for name, self_us, _, _ in rows:
+            package = name.split('.')[0]
+            by_package[package] = by_package.get(package, 0) + self_us
+
+        samples = [self._run([], path, host)[0] for _ in range(max(runs, 1))]
+        cold_start = {
+            key: round(statistics.median(sample[key] for sample in samples), 1)
+            for key in ('setup_ms', 'wsgi_ms', 'first_request_ms', 'second_request_ms', 'total_ms')
+        }
+        cold_start['status'] = samples[-1]['status']
+
+        importers = {}
+        for module, location, lazy in scan_imports(settings.BASE_DIR):
+            for prefix in LAZY_IMPORT_CANDIDATES:
+                if module == prefix or module.startswith(prefix + '.'):
+                    entry = importers.setdefault(prefix, {'eager': set(), 'lazy': set()})
+                    entry['lazy' if lazy else 'eager'].add(location)
+
+        plan = []
+        for prefix, (description, suggestion) in LAZY_IMPORT_CANDIDATES.items():
+            cost_us = component_cost_us(rows, prefix)
+            found = importers.get(prefix, {'eager': set(), 'lazy': set()})
+            plan.append({
+                'component': prefix,
+                'description': description,
+                'import_ms': round(cost_us / 1000, 1),
+                'loaded_at_boot': cost_us > 0,
+                'eager_imports': sorted(found['eager']),
+                'lazy_imports': len(found['lazy']),
+                'suggestion': suggestion,
+            })
+        plan.sort(key=lambda item: item['import_ms'], reverse=True)
+
+        return {
+            'path': path,
+            'python': sys.version.split()[0],
+            'imports': {
+                'modules': len(rows),
+                'total_self_ms': round(sum(row[1] for row in rows) / 1000, 1),
+                'top_modules': [
+                    {'module': name, 'cumulative_ms': round(cumulative_us / 1000, 1), 'self_ms': round(self_us / 1000, 1)}
+                    for name, self_us, cumulative_us, _ in sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+                ],
+                'top_packages': [
+                    {'package': package, 'self_ms': round(self_us / 1000, 1)}
+                    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+                ],
+            },
+            'cold_start': cold_start,
+            'lazy_import_plan': plan,
+        }
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline {options["compare"]}: {str(e)}')
+            if not isinstance(baseline, dict):
+                raise CommandError(f'{options["compare"]} is not a profile_startup --json report')
+
+        report = self.build_report(options['path'], options['runs'], options['top'])
+        comparison = compare_reports(report, baseline) if baseline is not None else {}
+
+        if options['json']:
+            if baseline is not None:
+                report['comparison'] = comparison
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        def delta(value, *keys):
+            entry = comparison.get('.'.join(keys))
+            return f"  ({entry['delta']:+.1f})" if entry else ''
+
+        imports = report['imports']
+        self.stdout.write(self.style.MIGRATE_HEADING('Import cost (python -X importtime, includes the first request)'))
+        self.stdout.write(
+            f"  {imports['modules']} modules, {imports['total_self_ms']} ms"
+            f"{delta(imports['total_self_ms'], 'imports', 'total_self_ms')}"
+        )
+        self.stdout.write('  Slowest modules (cumulative ms / self ms):')
+        for row in imports['top_modules']:
+            self.stdout.write(f"    {row['cumulative_ms']:>8.1f} {row['self_ms']:>8.1f}  {row['module']}")
+        self.stdout.write('  Packages by self time (ms):')
+        for row in imports['top_packages']:
+            self.stdout.write(f"    {row['self_ms']:>8.1f}  {row['package']}")
+
+        cold = report['cold_start']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Cold start (median of {options['runs']} fresh processes)"))
+        self.stdout.write(f"  django.setup()      {cold['setup_ms']:>8.1f} ms{delta(cold['setup_ms'], 'cold_start', 'setup_ms')}")
+        self.stdout.write(f"  WSGI module         {cold['wsgi_ms']:>8.1f} ms{delta(cold['wsgi_ms'], 'cold_start', 'wsgi_ms')}")
+        self.stdout.write(
+            f"  First GET {report['path']:<10}{cold['first_request_ms']:>8.1f} ms ({cold['status']})"
+            f"{delta(cold['first_request_ms'], 'cold_start', 'first_request_ms')}"
+        )
+        self.stdout.write(f"  Second request      {cold['second_request_ms']:>8.1f} ms")
+        self.stdout.write(
+            f"  Time to first byte  {cold['total_ms']:>8.1f} ms{delta(cold['total_ms'], 'cold_start', 'total_ms')}"
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Lazy-import plan (ms includes dependencies each component loads first)'))
+        for item in report['lazy_import_plan']:
+            if item['loaded_at_boot']:
+                label = self.style.WARNING(f"{item['import_ms']:>7.1f} ms")
+            else:
+                label = self.style.SUCCESS('    not loaded')
+            self.stdout.write(f"  {label}  {item['component']} - {item['description']}")
+            for location in item['eager_imports']:
+                self.stdout.write(f'             eager: {location}')
+            if item['lazy_imports']:
+                self.stdout.write(f"             already deferred in {item['lazy_imports']} place(s)")
+            if item['loaded_at_boot']:
+                self.stdout.write(f"             plan: {item['suggestion']}")
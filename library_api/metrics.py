@@ -0,0 +1,179 @@
+"""
+In-process request metrics, exported as Prometheus text by the /metrics/ view.
+
+Every request is counted and its latency goes into a histogram, which costs
+two perf_counter() calls and a locked dict update. A sampled fraction of
+requests (METRICS_SAMPLE_RATE) is also traced with connection.execute_wrapper
+for query count and DB time, and timed around response rendering, which is
+where DRF serializes to JSON.
+
+Database connection counters come from db_pool and cover the scraping worker,
+as does the count of log records dropped by logs.QueuedHandler.
+
+Metrics are per worker process; each scrape reports the worker that served it.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+# Upper bounds in seconds, matching the usual Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'lms'
+
+
+class ViewStats:
+    __slots__ = ('requests', 'latency_sum', 'buckets', 'sampled', 'queries', 'db_seconds', 'render_seconds')
+
+    def __init__(self):
+        self.requests = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sampled = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started_at = time.time()
+
+    def record(self, view, method, status, latency, trace=None):
+        key = (view, method, f'{status // 100}xx')
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ViewStats()
+            stats.requests += 1
+            stats.latency_sum += latency
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[index] += 1
+                    break
+            if trace is not None:
+                stats.sampled += 1
+                stats.queries += trace.queries
+                stats.db_seconds += trace.db_seconds
+                stats.render_seconds += trace.render_seconds
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: (stats.requests, stats.latency_sum, list(stats.buckets), stats.sampled,
+                      stats.queries, stats.db_seconds, stats.render_seconds)
+                for key, stats in self._stats.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+class RequestTrace:
+    """execute_wrapper for one sampled request: counts queries and time spent in the database"""
+    __slots__ = ('queries', 'db_seconds', 'render_seconds', 'render_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot=None, db_stats=None, dropped_logs=None):
+    """Prometheus text exposition format (version 0.0.4)"""
+    if snapshot is None:
+        snapshot = registry.snapshot()
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+    def labels(key, **extra):
+        view, method, status = key
+        pairs = [('view', view), ('method', method), ('status', status), *extra.items()]
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    ordered = sorted(snapshot.items())
+
+    header('http_requests_total', 'counter', 'Requests handled, by view, method and status class.')
+    for key, row in ordered:
+        lines.append(f'{PREFIX}_http_requests_total{labels(key)} {row[0]}')
+
+    header('http_request_duration_seconds', 'histogram', 'Total request latency including middleware.')
+    for key, row in ordered:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, row[2]):
+            cumulative += count
+            lines.append(f'{PREFIX}_http_request_duration_seconds_bucket{labels(key, le=bound)} {cumulative}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_bucket{labels(key, le="+Inf")} {row[0]}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_sum{labels(key)} {row[1]:.6f}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_count{labels(key)} {row[0]}')
+
+    header('sampled_requests_total', 'counter', 'Requests traced for query count, DB and render time.')
+    for key, row in ordered:
+        lines.append(f'{PREFIX}_sampled_requests_total{labels(key)} {row[3]}')
+
+    header('db_queries_total', 'counter', 'Database queries issued by sampled requests.')
+    for key, row in ordered:
+        lines.append(f'{PREFIX}_db_queries_total{labels(key)} {row[4]}')
+
+    header('db_duration_seconds_total', 'counter', 'Time spent in the database by sampled requests.')
+    for key, row in ordered:
+        lines.append(f'{PREFIX}_db_duration_seconds_total{labels(key)} {row[5]:.6f}')
+
+    header('render_duration_seconds_total', 'counter', 'Time spent rendering (serializing) sampled responses.')
+    for key, row in ordered:
+        lines.append(f'{PREFIX}_render_duration_seconds_total{labels(key)} {row[6]:.6f}')
+
+    if db_stats is None:
+        from .db_pool import pool_stats
+        db_stats = pool_stats()
+    mode = _escape(getattr(settings, 'DB_POOL_MODE', 'persistent'))
+
+    header('db_connections_opened_total', 'counter', 'Database connections opened by this worker process.')
+    for alias, entry in sorted(db_stats.items()):
+        lines.append(f'{PREFIX}_db_connections_opened_total{{alias="{_escape(alias)}",mode="{mode}"}} {entry["opened_total"]}')
+
+    header('db_connection_age_seconds', 'gauge', 'Age of the connection held by the scraping thread, if any.')
+    for alias, entry in sorted(db_stats.items()):
+        if entry['age_seconds'] is not None:
+            lines.append(f'{PREFIX}_db_connection_age_seconds{{alias="{_escape(alias)}"}} {entry["age_seconds"]}')
+
+    pooled = [(alias, entry['pool']) for alias, entry in sorted(db_stats.items()) if entry['pool']]
+    if pooled:
+        header('db_pool', 'gauge', 'psycopg connection pool counters (native pool mode).')
+        for alias, counters in pooled:
+            for name, value in sorted(counters.items()):
+                lines.append(f'{PREFIX}_db_pool{{alias="{_escape(alias)}",stat="{_escape(name)}"}} {value}')
+
+    if dropped_logs is None:
+        from .logs import dropped_records
+        dropped_logs = dropped_records()
+    header('log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.')
+    lines.append(f'{PREFIX}_log_records_dropped_total {dropped_logs}')
+
+    header('process_start_time_seconds', 'gauge', 'Start time of this worker process since the epoch.')
+    lines.append(f'{PREFIX}_process_start_time_seconds {registry.started_at:.3f}')
+
+    return '\n'.join(lines) + '\n'
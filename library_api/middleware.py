@@ -1,59 +1,326 @@
 # library_api/middleware.py
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http.response import ResponseHeaders
+from django.utils.cache import patch_vary_headers
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+
+from .compression import available_encoders, negotiate
+from .logs import request_id_var
+from .metrics import RequestTrace, registry
+
+# Default header policy. SECURITY_HEADERS in settings (or the SECURITY_HEADERS_JSON
+# environment variable) is merged over this, so policies can change without code edits.
+DEFAULT_SECURITY_HEADERS = {
+    # Explicitly disables unused browser APIs/hardware features for security audits
+    'PERMISSIONS_POLICY': [
+        'accelerometer', 'ambient-light-sensor', 'autoplay', 'camera', 'display-capture',
+        'document-domain', 'encrypted-media', 'fullscreen', 'geolocation', 'gyroscope',
+        'interest-cohort', 'magnetometer', 'microphone', 'midi', 'payment',
+        'picture-in-picture', 'publickey-credentials-get', 'screen-wake-lock', 'sync-xhr',
+        'usb', 'web-share', 'xr-spatial-tracking',
+    ],
+    # Strictly enforces 'self' without 'unsafe-inline' for API routes
+    'CSP': {
+        'default-src': ["'self'"],
+        'script-src': ["'self'"],
+        'style-src': ["'self'", "'unsafe-inline'", 'https://fonts.googleapis.com'],
+        'font-src': ["'self'", 'https://fonts.gstatic.com', 'data:'],
+        'img-src': ["'self'", 'data:', 'https:'],
+        'connect-src': ["'self'", 'https:'],
+    },
+    'HEADERS': {
+        'X-Content-Type-Options': 'nosniff',
+        'X-Frame-Options': 'DENY',
+        'Referrer-Policy': 'strict-origin-when-cross-origin',
+    },
+    # Per path-prefix overrides; the longest matching prefix wins
+    'ROUTES': {
+        # Swagger/ReDoc need inline scripts and the jsDelivr CDN
+        '/swagger': {'CSP': {'script-src': ["'self'", "'unsafe-inline'", 'https://cdn.jsdelivr.net']}},
+        '/redoc': {'CSP': {'script-src': ["'self'", "'unsafe-inline'", 'https://cdn.jsdelivr.net']}},
+    },
+}
+
+
+def _merge_policy(base, override):
+    """Shallow-merge each section of a header policy (CSP directives replace, not append)"""
+    return {
+        'PERMISSIONS_POLICY': list(override.get('PERMISSIONS_POLICY', base.get('PERMISSIONS_POLICY', []))),
+        'CSP': {**base.get('CSP', {}), **override.get('CSP', {})},
+        'HEADERS': {**base.get('HEADERS', {}), **override.get('HEADERS', {})},
+    }
+
+
+def _render_headers(policy):
+    headers = dict(policy['HEADERS'])
+    if policy['PERMISSIONS_POLICY']:
+        headers['Permissions-Policy'] = ', '.join(f'{feature}=()' for feature in policy['PERMISSIONS_POLICY'])
+    if policy['CSP']:
+        headers['Content-Security-Policy'] = '; '.join(
+            f"{directive} {' '.join(sources)}" for directive, sources in policy['CSP'].items()
+        ) + ';'
+    # Drop headers explicitly disabled with a null/empty value
+    return {name: value for name, value in headers.items() if value}
+
+
+def compile_security_headers(config=None):
+    """
+    Build the header bundles once: returns (default_bundle, [(prefix, bundle), ...]).
+
+    Each bundle is a tuple of (name, value) pairs, rendered from the policy
+    and validated by ResponseHeaders at startup, so a bad header value fails
+    on boot rather than on a request.
+    """
+    if config is None:
+        config = getattr(settings, 'SECURITY_HEADERS', {}) or {}
+    routes = {**DEFAULT_SECURITY_HEADERS['ROUTES'], **config.get('ROUTES', {})}
+    base = _merge_policy(DEFAULT_SECURITY_HEADERS, config)
+
+    default_bundle = _compile_bundle(base)
+    route_bundles = [
+        (prefix, _compile_bundle(_merge_policy(base, routes[prefix])))
+        for prefix in sorted(routes, key=len, reverse=True)
+    ]
+    return default_bundle, route_bundles
+
+
+def _compile_bundle(policy):
+    headers = _render_headers(policy)
+    ResponseHeaders(headers)  # raises BadHeaderError / UnicodeError on invalid values
+    return tuple(headers.items())
+
 
 class SecurityHeadersMiddleware:
     """Injects modern security headers (Permissions-Policy & strict CSP) into all API responses."""
     def __init__(self, get_response):
         self.get_response = get_response
+        self.default_bundle, self.route_bundles = compile_security_headers()
 
     def __call__(self, request):
         response = self.get_response(request)
 
-        # 1. PERMISSIONS-POLICY
-        # Explicitly disables unused browser APIs/hardware features for security audits
-        response['Permissions-Policy'] = (
-            "accelerometer=(), "
-            "ambient-light-sensor=(), "
-            "autoplay=(), "
-            "camera=(), "
-            "display-capture=(), "
-            "document-domain=(), "
-            "encrypted-media=(), "
-            "fullscreen=(), "
-            "geolocation=(), "
-            "gyroscope=(), "
-            "interest-cohort=(), "
-            "magnetometer=(), "
-            "microphone=(), "
-            "midi=(), "
-            "payment=(), "
-            "picture-in-picture=(), "
-            "publickey-credentials-get=(), "
-            "screen-wake-lock=(), "
-            "sync-xhr=(), "
-            "usb=(), "
-            "web-share=(), "
-            "xr-spatial-tracking=()"
+        bundle = self.default_bundle
+        path = request.path
+        for prefix, route_bundle in self.route_bundles:
+            if path.startswith(prefix):
+                bundle = route_bundle
+                break
+
+        for name, value in bundle:
+            response.headers[name] = value
+        return response
+
+
+def is_lean_request(request):
+    """
+    True for stateless API requests that can skip session, CSRF, auth and messages.
+
+    Paths under LEAN_API_PREFIXES qualify unless they also match
+    LEAN_API_EXEMPT_PREFIXES (the schema view and the session-rendered
+    template pages).
+    The answer is cached on the request so each lean middleware pays for at
+    most one attribute lookup.
+    """
+    lean = getattr(request, '_lean_api', None)
+    if lean is None:
+        path = request.path_info
+        lean = (
+            path.startswith(_lean_prefixes())
+            and not path.startswith(_lean_exempt_prefixes())
         )
+        request._lean_api = lean
+    return lean
+
+
+def _lean_prefixes():
+    return tuple(getattr(settings, 'LEAN_API_PREFIXES', ()))
+
+
+def _lean_exempt_prefixes():
+    return tuple(getattr(settings, 'LEAN_API_EXEMPT_PREFIXES', ()))
+
+
+class LeanRouteMixin:
+    """
+    Skips the middleware it is mixed into for lean API requests.
+
+    Subclassing the real middleware (rather than wrapping it) keeps Django's
+    admin system checks and hook discovery working unchanged.
+    """
+
+    def __call__(self, request):
+        if is_lean_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class LeanSessionMiddleware(LeanRouteMixin, SessionMiddleware):
+    pass
+
+
+class LeanCsrfViewMiddleware(LeanRouteMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_lean_request(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class LeanAuthenticationMiddleware(LeanRouteMixin, AuthenticationMiddleware):
+    pass
+
 
-        # 2. CONTENT-SECURITY-POLICY
-        # Strictly enforces 'self' without 'unsafe-inline' for API routes, allowing it only on docs
-        if request.path.startswith('/swagger') or request.path.startswith('/redoc'):
-            script_src = "'self' 'unsafe-inline' https://cdn.jsdelivr.net"
+class LeanMessageMiddleware(LeanRouteMixin, MessageMiddleware):
+    pass
+
+
+KNOWN_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency for every request and, for a METRICS_SAMPLE_RATE fraction,
+    query count, DB time and render time (see library_api.metrics).
+
+    Sits first in MIDDLEWARE so the latency covers the whole stack.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'METRICS_SAMPLE_RATE', 0.0))
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        trace = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            trace = request._metrics_trace = RequestTrace()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(trace))
+                response = self.get_response(request)
         else:
-            script_src = "'self'"
-
-        response['Content-Security-Policy'] = (
-            f"default-src 'self'; "
-            f"script-src {script_src}; "
-            f"style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
-            f"font-src 'self' https://fonts.gstatic.com data:; "
-            f"img-src 'self' data: https:; "
-            f"connect-src 'self' https:;"
-        )
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else 'unmatched'
+        method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+        registry.record(view, method, response.status_code, latency, trace)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered (serialized to JSON) right after this hook
+        trace = getattr(request, '_metrics_trace', None)
+        if trace is not None:
+            trace.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self._rendered(trace))
+        return response
+
+    @staticmethod
+    def _rendered(trace):
+        trace.render_seconds += time.perf_counter() - trace.render_started
+
+
+REQUEST_ID_HEADER = 'HTTP_X_REQUEST_ID'
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestIdMiddleware:
+    """
+    Tag each request with an id for log correlation.
 
-        # 3. EXTRA HARDENING HEADERS
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-Frame-Options'] = 'DENY'
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+    Reuses a well-formed incoming X-Request-ID (e.g. from the load balancer),
+    otherwise generates one, and echoes it back in the response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.META.get(REQUEST_ID_HEADER, '')
+        request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        request.request_id = request_id
+        token = request_id_var.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses with the best encoding the client accepts (zstd,
+    br or gzip; see library_api.compression).
+
+    Only stateless JWT API requests (is_lean_request) are compressed. Admin,
+    docs and other session-rendered pages carry CSRF tokens next to
+    attacker-influenced content, where compressed sizes could leak the token
+    (BREACH), so they always go out as-is, as does any response that used the
+    CSRF token. Also skips bodies under COMPRESSION_MIN_SIZE bytes, where the
+    CPU is not worth the bytes saved, content types outside
+    COMPRESSION_CONTENT_TYPES, and paths under COMPRESSION_EXCLUDE_PREFIXES:
+    API endpoints whose responses carry tokens or reflect credentials.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COMPRESSION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.encoders = available_encoders()
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.content_types = tuple(getattr(settings, 'COMPRESSION_CONTENT_TYPES', ('application/json',)))
+        self.exclude_prefixes = tuple(getattr(settings, 'COMPRESSION_EXCLUDE_PREFIXES', ()))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming:
+            if response.is_async:
+                return response
+        elif len(response.content) < self.min_size:
+            return response
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        if not response.get('Content-Type', '').startswith(self.content_types):
+            return response
+        if request.path_info.startswith(self.exclude_prefixes) or not is_lean_request(request):
+            return response
+        if 'CSRF_COOKIE' in request.META:
+            return response  # the body may embed the CSRF token
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encoders)
+        if encoding is None:
+            return response
+        compress_bytes, compress_stream = self.encoders[encoding]
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content)
+            # The compressed length isn't known until the stream ends
+            del response.headers['Content-Length']
+        else:
+            compressed = compress_bytes(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
 
-        return response
\ No newline at end of file
+        # A strong ETag would claim byte-for-byte identity with the uncompressed body
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
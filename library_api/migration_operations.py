@@ -0,0 +1,24 @@
+"""
+Migration operations shared by library_api migrations.
+
+AddIndexOnline builds an index with CREATE INDEX CONCURRENTLY on Postgres,
+so the table stays writable while it builds. Migrations using it must set
+atomic = False, since a concurrent build can't run inside a transaction.
+Other databases get a plain AddIndex.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class AddIndexOnline(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on Postgres, so the table stays writable; a plain AddIndex elsewhere"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
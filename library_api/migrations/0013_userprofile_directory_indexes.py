@@ -0,0 +1,74 @@
+# Generated by Django 5.0.7 on 2026-10-19 08:25
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+from library_api.migration_operations import AddIndexOnline
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes matching the UPPER(...) LIKE '%term%' that icontains produces,
+# so member search by username or email fragment doesn't scan auth_user
+TRIGRAM_INDEXES = {
+    'auth_user_username_trgm': 'username',
+    'auth_user_email_trgm': 'email',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        # pg_trgm is a trusted extension on Postgres 13+, but the role may still lack
+        # CREATE on the database; search then works without the indexes
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except Exception as e:
+        logger.warning(f'pg_trgm unavailable, member search will not be indexed: {e}')
+        return
+    with connection.cursor() as cursor:
+        for name, column in TRIGRAM_INDEXES.items():
+            # An interrupted concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+            cursor.execute(
+                'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', [name]
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                f'ON auth_user USING gin (UPPER({column}) gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('library_api', '0012_passwordresetcode'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='userprofile',
+            index=models.Index(fields=['role', 'active_status', 'id'], name='userprofile_role_active_idx'),
+        ),
+        AddIndexOnline(
+            model_name='userprofile',
+            index=models.Index(fields=['date_of_membership', 'id'], name='userprofile_joined_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,38 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_isbns(apps, schema_editor):
+    """Rewrite valid ISBN-10s and hyphenated forms as the canonical ISBN-13"""
+    from library_api.isbn import InvalidISBN, normalize_isbn
+
+    Book = apps.get_model('library_api', 'Book')
+    db_alias = schema_editor.connection.alias
+    taken = set(Book.objects.using(db_alias).values_list('isbn', flat=True))
+    for book in Book.objects.using(db_alias).only('id', 'isbn').iterator():
+        try:
+            canonical = normalize_isbn(book.isbn)
+        except InvalidISBN:
+            continue  # left as entered; still matched exactly by lookups
+        if canonical == book.isbn:
+            continue
+        if canonical in taken:
+            logger.warning(f'Book {book.id}: ISBN {book.isbn} duplicates {canonical}; left unchanged')
+            continue
+        Book.objects.using(db_alias).filter(pk=book.pk).update(isbn=canonical)
+        taken.discard(book.isbn)
+        taken.add(canonical)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0013_userprofile_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
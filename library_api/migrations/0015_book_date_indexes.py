@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+from library_api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('library_api', '0014_normalize_book_isbns'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='book',
+            index=models.Index(fields=['published_date'], name='book_published_idx'),
+        ),
+        AddIndexOnline(
+            model_name='book',
+            index=models.Index(condition=models.Q(('copies_available__gt', 0)), fields=['published_date'], name='book_available_published_idx'),
+        ),
+        AddIndexOnline(
+            model_name='book',
+            index=models.Index(condition=models.Q(('copies_available__gt', 0)), fields=['title', 'author'], name='book_available_title_idx'),
+        ),
+    ]
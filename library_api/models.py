@@ -5,6 +5,8 @@ from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from .catalog import CATALOG_FIELDS, catalog_state
+from .isbn import InvalidISBN, normalize_isbn
 
 class Book(models.Model):
     title = models.CharField(max_length=200)
@@ -15,6 +17,44 @@ class Book(models.Model):
 
     class Meta:
         ordering = ['title', 'author']
+        indexes = [
+            models.Index(fields=['published_date'], name='book_published_idx'),
+            # /api/available-books/ and ?available=true always carry copies_available > 0:
+            # date ranges and the default title order seek these without visiting loaned-out books
+            models.Index(
+                fields=['published_date'], name='book_available_published_idx',
+                condition=models.Q(copies_available__gt=0),
+            ),
+            models.Index(
+                fields=['title', 'author'], name='book_available_title_idx',
+                condition=models.Q(copies_available__gt=0),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # Remembered so saves that don't change the catalog aren't logged (see catalog.py)
+        if not book.get_deferred_fields().intersection(CATALOG_FIELDS):
+            book._catalog_state = catalog_state(book)
+        if 'isbn' not in book.get_deferred_fields():
+            book._saved_isbn = book.isbn
+        return book
+
+    def save(self, *args, **kwargs):
+        # New and edited ISBNs are stored as the canonical ISBN-13 so every form finds the row.
+        # Stored values are left alone: migration 0014 keeps rows whose ISBN-13 belongs to
+        # another book, and rewriting them on a checkout would hit the unique index.
+        update_fields = kwargs.get('update_fields')
+        if 'isbn' not in self.get_deferred_fields() and (update_fields is None or 'isbn' in update_fields) \
+                and (self._state.adding or self.isbn != getattr(self, '_saved_isbn', None)):
+            try:
+                self.isbn = normalize_isbn(self.isbn)
+            except InvalidISBN:
+                pass  # BookSerializer rejects these; other callers store them as given
+        super().save(*args, **kwargs)
+        if 'isbn' not in self.get_deferred_fields():
+            self._saved_isbn = self.isbn
     
     def is_available(self):
         if self.copies_available <= 1:
@@ -40,6 +80,12 @@ class UserProfile(models.Model):
     ]
     class Meta:
         ordering = ['user']
+        indexes = [
+            # Member directory: filters walked in id (keyset) order; the trailing id lets
+            # the cursor's id bound be checked in the index and a single join date read in order
+            models.Index(fields=['role', 'active_status', 'id'], name='userprofile_role_active_idx'),
+            models.Index(fields=['date_of_membership', 'id'], name='userprofile_joined_idx'),
+        ]
 
     def validate_role(self):
         if self.role not in ['admin', 'member']:
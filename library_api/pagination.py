@@ -0,0 +1,221 @@
+"""
+Paginators that avoid a full COUNT(*) on every list request.
+
+fast_count() decides how to size a queryset:
+
+* Unfiltered listings on Postgres read the planner's row estimate
+  (pg_class.reltuples, kept current by autovacuum). Once it passes
+  PAGINATION_ESTIMATE_THRESHOLD rows the estimate is used as the count.
+* Anything else is counted exactly. Counts of PAGINATION_COUNT_CACHE_MIN rows
+  or more are cached for PAGINATION_COUNT_CACHE_SECONDS, keyed by the SQL of
+  the query, so paging through a large filtered listing counts it once.
+
+Responses carry `count_exact`: false when the count is an estimate or a
+cached value, which may be slightly off. Only `count` is approximate: with an
+inexact count the paginators fetch one row past the page to decide whether
+there is a `next` page, so pages beyond a low estimate are still served and
+linked. Reaching the last page this way also pins the count down exactly.
+Clients should rely on `next` rather than the count to find the last page.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_CACHE_PREFIX = 'pagination:count:'
+
+
+def _is_plain_table_scan(queryset):
+    query = queryset.query
+    return not (query.where or query.distinct or query.combinator or query.is_sliced or query.group_by)
+
+
+def estimated_rows(queryset):
+    """Planner estimate of the rows in the queryset's table, or None if unavailable"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # -1 means the table has never been vacuumed or analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+    return f'{COUNT_CACHE_PREFIX}{digest}'
+
+
+def fast_count(queryset):
+    """(count, exact) for a queryset, using an estimate or a cached count where possible"""
+    if not hasattr(queryset, 'query'):
+        return len(queryset), True
+
+    if _is_plain_table_scan(queryset):
+        threshold = getattr(settings, 'PAGINATION_ESTIMATE_THRESHOLD', 100000)
+        try:
+            estimate = estimated_rows(queryset)
+        except Exception:
+            estimate = None
+        if estimate is not None and estimate >= threshold:
+            return estimate, False
+
+    try:
+        key = count_cache_key(queryset)
+        cached = cache.get(key)
+    except Exception:
+        key, cached = None, None
+    if cached is not None:
+        return cached, False
+
+    count = queryset.count()
+    if key is not None and count >= getattr(settings, 'PAGINATION_COUNT_CACHE_MIN', 1000):
+        try:
+            cache.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_SECONDS', 300))
+        except Exception:
+            pass
+    return count, True
+
+
+def _add_count_exact_to_schema(schema):
+    schema['properties']['count_exact'] = {
+        'type': 'boolean',
+        'example': True,
+        'description': 'False when count is an estimate or a recently cached value',
+    }
+    return schema
+
+
+class FastCountPage(Page):
+    def __init__(self, object_list, number, paginator, has_next=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
+        return super().has_next()
+
+
+class FastCountPaginator(Paginator):
+    count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = fast_count(self.object_list)
+        return count
+
+    def _set_count(self, count, exact):
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+        self.count_exact = exact
+
+    def page(self, number):
+        """
+        With an inexact count, read one row past the page instead of trusting
+        the count to say whether this page exists and whether another follows
+        """
+        self.count  # sets count_exact
+        if self.count_exact:
+            return super().page(number)
+        number = self._validate_page_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        if has_next:
+            self._set_count(max(self.count, bottom + len(rows)), False)
+        elif rows or number == 1:
+            self._set_count(bottom + len(rows), True)
+        else:
+            # Past the end: only now is an exact count worth taking
+            self._set_count(self.object_list.count(), True)
+            raise EmptyPage(self.error_messages['no_results'])
+        return FastCountPage(rows[:self.per_page], number, self, has_next=has_next)
+
+    def _validate_page_number(self, number):
+        """Paginator.validate_number without the upper bound, which comes from the count"""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+
+class FastCountPageNumberPagination(PageNumberPagination):
+    django_paginator_class = FastCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_exact'] = self.page.paginator.count_exact
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        return _add_count_exact_to_schema(super().get_paginated_response_schema(schema))
+
+
+class FastCountLimitOffsetPagination(LimitOffsetPagination):
+    count_exact = True
+
+    def get_count(self, queryset):
+        count, self.count_exact = fast_count(queryset)
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.has_next = None
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count_exact:
+            rows = [] if self.count == 0 or self.offset > self.count else list(
+                queryset[self.offset:self.offset + self.limit])
+        else:
+            # Inexact count: read one row past the page to decide whether there is a next one
+            rows = list(queryset[self.offset:self.offset + self.limit + 1])
+            self.has_next = len(rows) > self.limit
+            if self.has_next:
+                self.count = max(self.count, self.offset + len(rows))
+                rows = rows[:self.limit]
+            elif rows or self.offset == 0:
+                self.count, self.count_exact = self.offset + len(rows), True
+            else:
+                self.count, self.count_exact = queryset.count(), True
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return rows
+
+    def get_next_link(self):
+        if self.has_next is False:
+            return None
+        if self.has_next:
+            # The base class would hide the link when offset + limit reaches the count
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+        return super().get_next_link()
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_exact'] = self.count_exact
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        return _add_count_exact_to_schema(super().get_paginated_response_schema(schema))
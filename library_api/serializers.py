@@ -3,16 +3,109 @@ from .models import Book, UserProfile, Transaction, PasswordResetCode
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .tokens import CachedRefreshToken
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.validators import UniqueValidator
+from .isbn import InvalidISBN, normalize_isbn
+
+
+
+def parse_field_list(value):
+    """'title, book.isbn,' -> {'title', 'book.isbn'}"""
+    if not value:
+        return set()
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for ?fields= and ?omit= (passed in as context['fields'] and
+    context['omit'], sets of field names).
+
+    'fields' keeps only the listed fields and 'omit' drops the listed ones. A dotted
+    name such as 'book.title' selects within the nested serializer registered for
+    'book' in nested_serializers. Unknown names are ignored.
+    """
+    nested_serializers = {}
+
+    def is_nested(self, name):
+        """Whether `name` is rendered inline, rather than as an id sideloaded by the view"""
+        return name in self.nested_serializers and name not in (self.context.get('sideload') or ())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        include = self.context.get('fields')
+        omit = self.context.get('omit')
+        if include:
+            keep = {path.split('.', 1)[0] for path in include}
+            for name in list(fields):
+                if name not in keep:
+                    del fields[name]
+        for path in omit or ():
+            if '.' not in path:
+                fields.pop(path, None)
+        return fields
+
+    def nested_context(self, name):
+        """Context for the nested serializer under `name`, with its part of the selection"""
+        prefix = name + '.'
+        include = self.context.get('fields')
+        context = dict(self.context)
+        context['fields'] = None
+        if include and name not in include:
+            context['fields'] = {path[len(prefix):] for path in include if path.startswith(prefix)} or None
+        context['omit'] = {path[len(prefix):] for path in self.context.get('omit') or () if path.startswith(prefix)}
+        return context
+
+    def only_fields(self, prefix=''):
+        """
+        Model field paths for QuerySet.only() covering the selected fields, or None
+        when a field reads something other than a concrete model field.
+        """
+        opts = self.Meta.model._meta
+        paths = {prefix + opts.pk.name}
+        for name, field in self.fields.items():
+            if field.source == '*':
+                return None
+            try:
+                model_field = opts.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete:
+                return None
+            paths.add(prefix + model_field.name)
+            if self.is_nested(name):
+                nested = self.nested_serializers[name]
+                nested_paths = nested(context=self.nested_context(name)).only_fields(f'{prefix}{model_field.name}__')
+                if nested_paths is None:
+                    return None
+                paths |= nested_paths
+        return paths
+
+
+class ISBNField(serializers.CharField):
+    """Accepts any ISBN-10/13 form and validates the checksum; the value is the canonical ISBN-13"""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            return normalize_isbn(value)
+        except InvalidISBN as e:
+            raise serializers.ValidationError(str(e))
 
 
+class BookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Normalized before the unique check, so an ISBN-10 of an existing book is caught
+    isbn = ISBNField(validators=[UniqueValidator(queryset=Book.objects.all(), message='book with this isbn already exists.')])
 
-class BookSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         title = attrs.get('title')
         author = attrs.get('author')
@@ -53,13 +146,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ['id', 'user', 'username', 'email', 'role', 'date_of_membership', 'active_status', 'loan_duration']
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.PrimaryKeyRelatedField(queryset=Book.objects.all(), required=False)
+    nested_serializers = {'book': BookSerializer}
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if instance.book:
-            representation['book'] = BookSerializer(instance.book).data
+        if 'book' in representation and instance.book_id is not None and self.is_nested('book'):
+            representation['book'] = BookSerializer(instance.book, context=self.nested_context('book')).data
         return representation
 
     def is_available(self):
@@ -179,39 +273,18 @@ class UserLoginSerializer(serializers.Serializer):
         if not username_or_email or not password:
             raise serializers.ValidationError({'error': 'Both username/email and password are required'})
         
-        # Try to find user by username (case-insensitive) or email (case-insensitive)
-        user = None
-        
-        # Check if it looks like an email (contains @)
-        if '@' in username_or_email:
-            # Try to find by email (case-insensitive)
-            try:
-                user = User.objects.get(email__iexact=username_or_email.lower())
-            except User.DoesNotExist:
-                pass
-            except User.MultipleObjectsReturned:
-                # If multiple users with same email, get the first one
-                user = User.objects.filter(email__iexact=username_or_email.lower()).first()
-        else:
-            # Try to find by username (case-insensitive)
-            try:
-                user = User.objects.get(username__iexact=username_or_email)
-            except User.DoesNotExist:
-                pass
-            except User.MultipleObjectsReturned:
-                # If multiple users with same username (shouldn't happen), get the first one
-                user = User.objects.filter(username__iexact=username_or_email).first()
-        
-        # If user found, authenticate with password
-        if user:
-            user = authenticate(username=user.username, password=password)
+        # UsernameOrEmailBackend resolves username or email (case-insensitive)
+        # plus the profile in one query and checks the password on that row
+        user = authenticate(
+            self.context.get('request'),
+            username=username_or_email,
+            password=password,
+        )
         
+        # Inactive accounts are refused by the backend (user_can_authenticate)
         if not user:
             raise serializers.ValidationError({'error': 'Invalid username/email or password'})
         
-        if not user.is_active:
-            raise serializers.ValidationError({'error': 'User account is disabled'})
-        
         refresh = RefreshToken.for_user(user)
         return {
             'user': user,
@@ -230,6 +303,30 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh serializer that checks the blacklist through the cache front"""
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                # get_or_create doubles as the check-and-set: if another request
+                # rotated this token first, the row already exists
+                _, created = refresh.blacklist()
+                if not created:
+                    raise InvalidToken('Token is blacklisted')
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
+
+
 # ============================================
 # NEW OTP-BASED PASSWORD RESET (SIMPLER APPROACH)
 # ============================================
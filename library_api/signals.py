@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .catalog import CATALOG_FIELDS, catalog_state, record_catalog_change_on_commit
+from .models import Book
+from .tokens import mark_jti_blacklisted
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,4 +12,25 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=User)
 def user_registered_signal(sender, instance, created, **kwargs):
     if created:
-        logger.info(f'New user registered: {instance.username}')
\ No newline at end of file
+        logger.info(f'New user registered: {instance.username}')
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_blacklisted_token(sender, instance, **kwargs):
+    mark_jti_blacklisted(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_save, sender=Book)
+def record_book_change(sender, instance, created=False, **kwargs):
+    if instance.get_deferred_fields().intersection(CATALOG_FIELDS):
+        record_catalog_change_on_commit(instance.pk)
+        return
+    state = catalog_state(instance)
+    if created or state is None or state != getattr(instance, '_catalog_state', None):
+        record_catalog_change_on_commit(instance.pk)
+    instance._catalog_state = state
+
+
+@receiver(post_delete, sender=Book)
+def record_book_deletion(sender, instance, **kwargs):
+    record_catalog_change_on_commit(instance.pk)
@@ -0,0 +1,226 @@
+"""
+Startup readiness checks that run off the WSGI import path.
+
+wsgi.py used to open a database connection and probe information_schema in
+every gunicorn worker at import time, and each worker that found a missing
+table ran `migrate` concurrently. Now each worker hands the check to a
+background thread and starts serving immediately:
+
+* The schema version is a hash of the migration leaf nodes on disk. Once any
+  worker has verified that version is applied it is recorded in the cache, so
+  with a shared cache the other workers skip the database entirely.
+* Only the worker holding a Postgres advisory lock builds the migration plan
+  and, if STARTUP_AUTO_MIGRATE is on, applies it. The rest stand down.
+
+startup_state records how the last check went for health endpoints and logs.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key for pg_advisory_lock; any 64-bit integer works
+MIGRATION_LOCK_ID = 0x4C4D535F4D494752  # "LMS_MIGR"
+
+SCHEMA_VERSION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Longest a migration run may hold the cache-based lock (PgBouncer mode) before it lapses
+MIGRATION_LOCK_TIMEOUT = 60 * 30
+
+startup_state = {
+    'status': 'pending',
+    'detail': None,
+    'duration_ms': None,
+    'finished_at': None,
+}
+
+_startup_thread = None
+_startup_lock = threading.Lock()
+
+
+def schema_version():
+    """Hash of the latest migration of every app, read from disk only"""
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    leaves = sorted(f'{app}.{name}' for app, name in loader.graph.leaf_nodes())
+    return hashlib.sha1('|'.join(leaves).encode()).hexdigest()[:16]
+
+
+def schema_cache_key(version):
+    return f'startup:schema:{version}'
+
+
+@contextmanager
+def migration_lock(using=DEFAULT_DB_ALIAS):
+    """
+    Try to take the application-wide migration lock; yields True if held,
+    False if another worker holds it, or None if no lock can be taken.
+
+    Uses a session-level Postgres advisory lock, so it is released when the
+    block exits or the connection drops. Behind PgBouncer in transaction mode
+    a session lock can end up on another client's server connection, so the
+    shared cache holds the lock instead. That needs a cache every worker sees
+    (Redis, Memcached): with a per-process cache each worker would get its
+    own lock, so none is taken (None) and migrations are left to the deploy
+    step. Other databases have no shared lock and always get True.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+
+    if getattr(settings, 'DB_POOL_MODE', 'persistent') == 'pgbouncer':
+        from .tokens import cache_is_shared
+
+        if not cache_is_shared():
+            logger.warning(
+                'DB_POOL_MODE=pgbouncer needs a shared cache (Redis or Memcached) for the migration lock; '
+                'not auto-migrating, run "manage.py migrate" from the release step or POST /migrate/'
+            )
+            yield None
+            return
+        key = f'startup:migration-lock:{using}'
+        acquired = cache.add(key, os.getpid(), MIGRATION_LOCK_TIMEOUT)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(key)
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [MIGRATION_LOCK_ID])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [MIGRATION_LOCK_ID])
+
+
+def pending_migrations(using=DEFAULT_DB_ALIAS):
+    """Migrations on disk that have not been applied to the database"""
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connections[using])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [f'{migration.app_label}.{migration.name}' for migration, backwards in plan]
+
+
+def check_migrations(auto_migrate=None, using=DEFAULT_DB_ALIAS):
+    """
+    Make sure the schema is current; returns a short status string.
+
+    'cached'   - another worker already verified this schema version
+    'follower' - another worker holds the migration lock
+    'current'  - nothing to apply
+    'migrated' - pending migrations were applied
+    'pending'  - migrations are pending but auto-migrate is off
+    """
+    from django.core.management import call_command
+
+    if auto_migrate is None:
+        auto_migrate = getattr(settings, 'STARTUP_AUTO_MIGRATE', True)
+
+    version = schema_version()
+    key = schema_cache_key(version)
+    try:
+        if cache.get(key):
+            return 'cached'
+    except Exception as e:
+        logger.warning(f'Schema version cache unavailable: {str(e)}')
+
+    with migration_lock(using) as leader:
+        if leader is None:
+            auto_migrate = False  # no lock spans the workers, so never migrate from one
+        elif not leader:
+            return 'follower'
+
+        pending = pending_migrations(using)
+        if pending and not auto_migrate:
+            logger.warning(f'{len(pending)} unapplied migrations: {", ".join(pending[:10])}')
+            return 'pending'
+
+        status = 'current'
+        if pending:
+            logger.warning(f'Applying {len(pending)} pending migrations on startup...')
+            call_command('migrate', '--noinput', database=using, verbosity=1)
+            status = 'migrated'
+
+    try:
+        cache.set(key, True, SCHEMA_VERSION_CACHE_TIMEOUT)
+    except Exception:
+        pass
+    return status
+
+
+def run_startup_checks():
+    """Run the migration check and cache warm-up, recording the outcome in startup_state"""
+    started = time.perf_counter()
+    try:
+        if getattr(settings, 'STARTUP_MIGRATION_CHECK', False):
+            status = check_migrations()
+        else:
+            status = 'skipped'
+        startup_state['detail'] = f'migrations: {status}'
+
+        from .db_routers import replica_reads_enabled
+
+        replica_reads_enabled()  # warns if replicas are configured without a shared cache
+
+        from .tokens import warm_blacklist_cache
+
+        warmed = warm_blacklist_cache()
+        startup_state['detail'] += f', blacklist cache: {warmed} entries'
+        startup_state['status'] = 'ready'
+    except Exception as e:
+        startup_state['status'] = 'failed'
+        startup_state['detail'] = str(e)
+        logger.warning(f'Startup checks failed: {str(e)}')
+        logger.info('You can run migrations manually via: POST /migrate/')
+    finally:
+        startup_state['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        startup_state['finished_at'] = time.time()
+
+    logger.info(f"Startup checks {startup_state['status']} in {startup_state['duration_ms']}ms ({startup_state['detail']})")
+    return startup_state
+
+
+def _run_in_background():
+    try:
+        run_startup_checks()
+    finally:
+        # Connections are per thread; don't leave this one open for the process lifetime
+        connections.close_all()
+
+
+def start_startup_checks(background=True):
+    """
+    Run the startup checks once per process.
+
+    In the background the worker starts answering requests straight away;
+    requests that arrive before a first deploy's migrations finish get the
+    existing "tables not found" 503 from the exception handler.
+    """
+    global _startup_thread
+    if not background:
+        return run_startup_checks()
+    with _startup_lock:
+        if _startup_thread is None:
+            _startup_thread = threading.Thread(
+                target=_run_in_background,
+                name='library-startup-checks',
+                daemon=True,
+            )
+            _startup_thread.start()
+    return _startup_thread
@@ -281,7 +281,7 @@ class BookSerializerTest(TestCase):
         data = {
             'title': 'Test Book',
             'author': 'Test Author',
-            'isbn': '1234567890126',
+            'isbn': '9782000001263',
             'published_date': '2020-01-01',
             'copies_available': 5
         }
@@ -404,7 +404,7 @@ class BookAPITest(APITestCase):
         self.book = Book.objects.create(
             title='Test Book',
             author='Test Author',
-            isbn='1234567890129',
+            isbn='9782000001294',
             published_date=date(2020, 1, 1),
             copies_available=5
         )
@@ -431,7 +431,7 @@ class BookAPITest(APITestCase):
         data = {
             'title': 'New Book',
             'author': 'New Author',
-            'isbn': '1234567890130',
+            'isbn': '9782000001300',
             'published_date': '2021-01-01',
             'copies_available': 3
         }
@@ -463,7 +463,7 @@ class BookAPITest(APITestCase):
         data = {
             'title': 'Updated Book',
             'author': 'Updated Author',
-            'isbn': '1234567890129',
+            'isbn': '9782000001294',
             'published_date': '2020-01-01',
             'copies_available': 5
         }
@@ -727,7 +727,7 @@ class IntegrationTest(APITestCase):
         book_data = {
             'title': 'Integration Test Book',
             'author': 'Test Author',
-            'isbn': '1234567890134',
+            'isbn': '9782000001348',
             'published_date': '2020-01-01',
             'copies_available': 3
         }
@@ -1100,3 +1100,2052 @@ class PasswordResetAPITest(APITestCase):
         })
         self.assertEqual(login_new.status_code, status.HTTP_200_OK)
         self.assertIn('access', login_new.data)
+
+
+# ==================== HOUSEKEEPING TESTS ====================
+
+class HousekeepingTest(TestCase):
+    """Test batched cleanup of expired reset codes and refresh tokens"""
+    
+    def setUp(self):
+        from .models import PasswordResetCode
+        self.user = User.objects.create_user(
+            username='cleanupuser',
+            email='cleanup@example.com',
+            password='testpass123'
+        )
+        now = timezone.now()
+        self.expired = PasswordResetCode.objects.create(
+            user=self.user, code='111111', email=self.user.email,
+            expires_at=now - timedelta(minutes=5)
+        )
+        self.used = PasswordResetCode.objects.create(
+            user=self.user, code='222222', email=self.user.email,
+            expires_at=now + timedelta(minutes=10), used=True
+        )
+        self.valid = PasswordResetCode.objects.create(
+            user=self.user, code='333333', email=self.user.email,
+            expires_at=now + timedelta(minutes=10)
+        )
+    
+    def test_housekeeping_deletes_expired_and_used_codes(self):
+        """Test expired and used codes are removed while valid codes are kept"""
+        from .models import PasswordResetCode
+        from .housekeeping import run_housekeeping
+        reclaimed = run_housekeeping(batch_size=1)
+        self.assertEqual(reclaimed['password_reset_codes'], 2)
+        self.assertEqual(list(PasswordResetCode.objects.values_list('pk', flat=True)), [self.valid.pk])
+    
+    def test_housekeeping_deletes_expired_tokens(self):
+        """Test expired outstanding tokens and their blacklist entries are removed"""
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+        from .housekeeping import run_housekeeping
+        live = RefreshToken.for_user(self.user)
+        expired = RefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+        
+        reclaimed = run_housekeeping()
+        self.assertEqual(reclaimed['outstanding_tokens'], 2)
+        self.assertTrue(OutstandingToken.objects.filter(jti=live['jti']).exists())
+        self.assertFalse(BlacklistedToken.objects.exists())
+    
+    def test_housekeeping_dry_run(self):
+        """Test dry run reports counts without deleting"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import PasswordResetCode
+        out = StringIO()
+        call_command('housekeeping', '--dry-run', stdout=out)
+        self.assertIn('Would delete 2 password reset code(s)', out.getvalue())
+        self.assertEqual(PasswordResetCode.objects.count(), 3)
+
+
+# ==================== TOKEN BLACKLIST CACHE TESTS ====================
+
+class TokenBlacklistCacheTest(APITestCase):
+    """Test the cache front for the refresh token blacklist"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='tokenuser',
+            email='token@example.com',
+            password='testpass123'
+        )
+    
+    def test_blacklisting_populates_cache(self):
+        """Test blacklisted JTIs are written to the cache on save"""
+        from django.core.cache import cache
+        from .tokens import BLACKLIST_CACHE_PREFIX, is_jti_blacklisted
+        refresh = RefreshToken.for_user(self.user)
+        refresh.blacklist()
+        self.assertTrue(cache.get(f"{BLACKLIST_CACHE_PREFIX}{refresh['jti']}"))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_jti_blacklisted(refresh['jti']))
+    
+    def test_cache_miss_never_reports_not_blacklisted(self):
+        """Test a cleared or stale cache still falls back to the database"""
+        from django.core.cache import cache
+        from .tokens import is_jti_blacklisted
+        refresh = RefreshToken.for_user(self.user)
+        jti = refresh['jti']
+        self.assertFalse(is_jti_blacklisted(jti))
+        refresh.blacklist()
+        cache.clear()
+        self.assertTrue(is_jti_blacklisted(jti))
+    
+    def test_refresh_rejects_rotated_token(self):
+        """Test a refresh token cannot be used twice after rotation"""
+        refresh = str(RefreshToken.for_user(self.user))
+        first = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', first.data)
+        second = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(second.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_valid_token_check_is_cached(self):
+        """Test "not blacklisted" is cached on a shared cache, and blacklisting replaces it"""
+        from unittest.mock import patch
+        from .tokens import is_jti_blacklisted
+        refresh = RefreshToken.for_user(self.user)
+        jti = refresh['jti']
+        with patch('library_api.tokens.cache_is_shared', return_value=True):
+            self.assertFalse(is_jti_blacklisted(jti))
+            with self.assertNumQueries(0):
+                self.assertFalse(is_jti_blacklisted(jti))
+            refresh.blacklist()
+            with self.assertNumQueries(0):
+                self.assertTrue(is_jti_blacklisted(jti))
+    
+    def test_local_cache_only_holds_blacklisted_tokens(self):
+        """Test a per-process cache never answers "not blacklisted" for other workers"""
+        from django.core.cache import cache
+        from .tokens import BLACKLIST_CACHE_PREFIX, is_jti_blacklisted
+        refresh = RefreshToken.for_user(self.user)
+        jti = refresh['jti']
+        self.assertFalse(is_jti_blacklisted(jti))
+        self.assertIsNone(cache.get(f'{BLACKLIST_CACHE_PREFIX}{jti}'))
+        with self.assertNumQueries(1):
+            self.assertFalse(is_jti_blacklisted(jti))
+    
+    def test_failed_cache_clear_is_raised(self):
+        """Test blacklisting fails loudly when a cached "not blacklisted" can't be cleared"""
+        from unittest.mock import patch
+        from .tokens import mark_jti_blacklisted
+        refresh = RefreshToken.for_user(self.user)
+        with patch('library_api.tokens.cache_is_shared', return_value=True), \
+             patch('library_api.tokens.cache.delete', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(ConnectionError):
+                mark_jti_blacklisted(refresh['jti'], timezone.now() + timedelta(days=1))
+    
+    def test_concurrent_reuse_is_unauthorized(self):
+        """Test a token rotated by a concurrent request gets simplejwt's 401, not a 400"""
+        from unittest.mock import patch
+        refresh = RefreshToken.for_user(self.user)
+        refresh.blacklist()
+        # Both requests passed the blacklist check before either blacklisted the token
+        with patch('library_api.tokens.is_jti_blacklisted', return_value=False):
+            response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_not_valid')
+    
+    def test_logout_blacklists_through_cache(self):
+        """Test logout marks the refresh token as blacklisted"""
+        from .tokens import is_jti_blacklisted, warm_blacklist_cache
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = self.client.post('/api/logout/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(warm_blacklist_cache(), 1)
+        self.assertTrue(is_jti_blacklisted(refresh['jti']))
+
+
+# ==================== PASSWORD HASHER TESTS ====================
+
+class PasswordHasherPolicyTest(TestCase):
+    """Test configurable hashing cost and rehash-on-login"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='hashuser',
+            email='hash@example.com',
+            password='testpass123'
+        )
+    
+    def test_login_rehashes_to_preferred_hasher(self):
+        """Test a successful login upgrades the hash to the preferred algorithm"""
+        from django.test import override_settings
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        hashers = [
+            'library_api.hashers.TunedScryptPasswordHasher',
+            'library_api.hashers.TunedPBKDF2PasswordHasher',
+        ]
+        with override_settings(PASSWORD_HASHERS=hashers, SCRYPT_WORK_FACTOR=2 ** 10):
+            serializer = UserLoginSerializer(data={'username_or_email': 'hashuser', 'password': 'testpass123'})
+            self.assertTrue(serializer.is_valid())
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+            self.assertTrue(self.user.check_password('testpass123'))
+    
+    def test_cost_change_marks_hash_for_update(self):
+        """Test changing a cost parameter makes existing hashes due for rehash"""
+        from django.test import override_settings
+        from .hashers import TunedScryptPasswordHasher
+        hasher = TunedScryptPasswordHasher()
+        with override_settings(SCRYPT_WORK_FACTOR=2 ** 10):
+            encoded = hasher.encode('testpass123', hasher.salt())
+            self.assertFalse(hasher.must_update(encoded))
+        with override_settings(SCRYPT_WORK_FACTOR=2 ** 11):
+            self.assertTrue(hasher.must_update(encoded))
+            self.assertTrue(hasher.verify('testpass123', encoded))
+
+
+# ==================== LOGIN BACKEND TESTS ====================
+
+class UsernameOrEmailBackendTest(APITestCase):
+    """Test single-query login resolution"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='LoginUser',
+            email='login@example.com',
+            password='testpass123'
+        )
+    
+    def test_login_by_email_case_insensitive(self):
+        """Test login resolves the user by email regardless of case"""
+        response = self.client.post('/api/login/', {
+            'username_or_email': 'LOGIN@example.com',
+            'password': 'testpass123'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.user.id)
+        self.assertEqual(response.data['role'], 'member')
+    
+    def test_login_by_username_case_insensitive(self):
+        """Test login resolves the user by username regardless of case"""
+        response = self.client.post('/api/login/', {
+            'username_or_email': 'loginuser',
+            'password': 'testpass123'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_exact_username_wins_over_case_variant(self):
+        """Test usernames differing only by case each log in to their own account"""
+        other = User.objects.create_user(username='loginuser', email='other@example.com', password='otherpass123')
+        for username, password, user in (('loginuser', 'otherpass123', other), ('LoginUser', 'testpass123', self.user)):
+            response = self.client.post('/api/login/', {'username_or_email': username, 'password': password})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['id'], user.id)
+        # Neither matches exactly: the password decides which account it is
+        for password, user in (('testpass123', self.user), ('otherpass123', other)):
+            response = self.client.post('/api/login/', {'username_or_email': 'LOGINUSER', 'password': password})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['id'], user.id)
+    
+    def test_shared_email_logs_in_the_account_the_password_fits(self):
+        """Test legacy accounts sharing an email each log in with their own password"""
+        other = User.objects.create_user(username='legacy', email='LOGIN@example.com', password='otherpass123')
+        for password, user in (('testpass123', self.user), ('otherpass123', other)):
+            response = self.client.post('/api/login/', {'username_or_email': 'login@example.com', 'password': password})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['id'], user.id)
+        # A password that fits both accounts can't tell them apart
+        other.set_password('testpass123')
+        other.save()
+        response = self.client.post('/api/login/', {'username_or_email': 'login@example.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_inactive_account_cannot_log_in(self):
+        """Test the backend refuses inactive users"""
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post('/api/login/', {'username_or_email': 'LoginUser', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_username_containing_at_sign(self):
+        """Test a username with '@' (allowed by Django) still logs in by username"""
+        user = User.objects.create_user(username='reader@home', email='reader@example.com', password='testpass123')
+        response = self.client.post('/api/login/', {'username_or_email': 'reader@home', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], user.id)
+        response = self.client.post('/api/login/', {'username_or_email': 'Reader@Example.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], user.id)
+    
+    def test_login_wrong_password(self):
+        """Test a wrong password is rejected"""
+        response = self.client.post('/api/login/', {
+            'username_or_email': 'loginuser',
+            'password': 'wrongpassword'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_login_uses_single_user_query(self):
+        """Test user and profile are loaded with one query"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/login/', {
+                'username_or_email': 'login@example.com',
+                'password': 'testpass123'
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        reads = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads), 1)
+        self.assertIn('library_api_userprofile', reads[0])
+
+
+# ==================== THROTTLING TESTS ====================
+
+class ThrottlingTest(APITestCase):
+    """Test token bucket throttles on login and password reset"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from .throttling import _local_buckets
+        cache.clear()
+        _local_buckets.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='throttleuser',
+            email='throttle@example.com',
+            password='testpass123'
+        )
+    
+    def throttle_settings(self, **rates):
+        from django.conf import settings
+        from django.test import override_settings
+        config = dict(settings.REST_FRAMEWORK)
+        config['DEFAULT_THROTTLE_RATES'] = rates
+        return override_settings(REST_FRAMEWORK=config)
+    
+    def test_login_throttled_per_username(self):
+        """Test repeated logins for one username are throttled"""
+        with self.throttle_settings(**{'login.username': '2/min'}):
+            for _ in range(2):
+                response = self.client.post('/api/login/', {'username_or_email': 'throttleuser', 'password': 'wrong'})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.post('/api/login/', {'username_or_email': 'THROTTLEUSER', 'password': 'wrong'})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+            # A different username still has tokens left
+            response = self.client.post('/api/login/', {'username_or_email': 'someoneelse', 'password': 'wrong'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_password_reset_throttled_per_ip(self):
+        """Test OTP requests from one IP are throttled across emails"""
+        with self.throttle_settings(**{'password_reset.ip': '1/hour'}):
+            response = self.client.post('/api/password-reset-otp/', {'email': 'nobody@example.com'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post('/api/password-reset-otp/', {'email': 'other@example.com'})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    def test_local_fallback_when_cache_fails(self):
+        """Test buckets keep counting in-process if the shared cache raises"""
+        from unittest import mock
+        from .throttling import take_token
+        with mock.patch('library_api.throttling.cache_is_shared', return_value=True), \
+             mock.patch('library_api.throttling.cache') as broken_cache:
+            broken_cache.incr.side_effect = ConnectionError('cache down')
+            self.assertEqual(take_token('throttle:test:fallback', 2, 60, now=1000.0), 0)
+            self.assertEqual(take_token('throttle:test:fallback', 2, 60, now=1000.0), 0)
+            self.assertAlmostEqual(take_token('throttle:test:fallback', 2, 60, now=1000.0), 30.0)
+    
+    def test_shared_cache_check_is_one_increment(self):
+        """Test a non-Redis shared cache counts each request with a single incr and no lock"""
+        from unittest import mock
+        from django.core.cache import caches
+        from .throttling import take_token
+        shared = mock.Mock(wraps=caches['default'])
+        with mock.patch('library_api.throttling.cache_is_shared', return_value=True), \
+             mock.patch('library_api.throttling.cache', shared):
+            self.assertEqual(take_token('throttle:test:window', 2, 60, now=1000.0), 0)
+            shared.reset_mock()
+            self.assertEqual(take_token('throttle:test:window', 2, 60, now=1001.0), 0)
+            self.assertEqual([call[0] for call in shared.method_calls], ['incr'])
+            self.assertAlmostEqual(take_token('throttle:test:window', 2, 60, now=1002.0), 18.0)
+            # The next window starts a new count
+            self.assertEqual(take_token('throttle:test:window', 2, 60, now=1020.0), 0)
+    
+    def test_redis_check_is_one_script_call(self):
+        """Test Django's Redis backend updates the bucket with one script call"""
+        from unittest import mock
+        from django.test import override_settings
+        from .throttling import BUCKET_SCRIPT, take_token
+        redis_cache = mock.Mock()
+        redis_cache.make_and_validate_key.side_effect = lambda key: f':1:{key}'
+        script = redis_cache._cache.get_client.return_value.register_script.return_value
+        script.return_value = b'12.5'
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                   'LOCATION': 'redis://localhost:6379'}}), \
+             mock.patch('library_api.throttling.cache', redis_cache):
+            self.assertEqual(take_token('throttle:test:redis', 2, 60, now=1000.0), 12.5)
+        redis_cache._cache.get_client.return_value.register_script.assert_called_once_with(BUCKET_SCRIPT)
+        script.assert_called_once_with(keys=[':1:throttle:test:redis'], args=[2, 60, '1000.0'])
+    
+    def test_bucket_refills_continuously(self):
+        """Test a drained bucket regains tokens at the steady rate, with no burst at a boundary"""
+        from .throttling import take_token
+        key = 'throttle:test:refill'
+        # 2/min: one token every 30 seconds, at most 2 banked
+        self.assertEqual(take_token(key, 2, 60, now=59.0), 0)
+        self.assertEqual(take_token(key, 2, 60, now=59.5), 0)
+        # A fixed window would reset at t=60 and allow two more
+        self.assertAlmostEqual(take_token(key, 2, 60, now=60.5), 28.5)
+        self.assertAlmostEqual(take_token(key, 2, 60, now=80.0), 9.0)
+        self.assertEqual(take_token(key, 2, 60, now=89.5), 0)
+        self.assertGreater(take_token(key, 2, 60, now=90.0), 0)
+        # Idle time banks no more than the bucket size
+        self.assertEqual(take_token(key, 2, 60, now=1000.0), 0)
+        self.assertEqual(take_token(key, 2, 60, now=1000.0), 0)
+        self.assertGreater(take_token(key, 2, 60, now=1000.0), 0)
+    
+    def test_retry_after_reports_refill_time(self):
+        """Test Retry-After is the time until the next token, not the window end"""
+        with self.throttle_settings(**{'login.username': '2/hour'}):
+            for _ in range(2):
+                self.client.post('/api/login/', {'username_or_email': 'throttleuser', 'password': 'wrong'})
+            response = self.client.post('/api/login/', {'username_or_email': 'throttleuser', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1790 <= int(response['Retry-After']) <= 1800)
+
+
+# ==================== SECURITY HEADER TESTS ====================
+
+class SecurityHeadersTest(APITestCase):
+    """Test precompiled security header bundles"""
+    
+    def test_api_response_has_strict_headers(self):
+        """Test API responses carry the strict default policy"""
+        response = self.client.get('/api/books/')
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Referrer-Policy'], 'strict-origin-when-cross-origin')
+        self.assertIn("script-src 'self';", response['Content-Security-Policy'])
+        self.assertIn('camera=()', response['Permissions-Policy'])
+    
+    def test_docs_route_allows_inline_scripts(self):
+        """Test the docs prefix gets its own compiled CSP"""
+        from .middleware import compile_security_headers
+        default_bundle, route_bundles = compile_security_headers({})
+        routes = {prefix: dict(bundle) for prefix, bundle in route_bundles}
+        self.assertIn("'unsafe-inline' https://cdn.jsdelivr.net", routes['/swagger']['Content-Security-Policy'])
+        self.assertNotIn('unsafe-inline', dict(default_bundle)['Content-Security-Policy'].split('style-src')[0])
+    
+    def test_headers_are_set_once_by_the_bundle(self):
+        """Test SecurityMiddleware no longer sets the headers the bundle owns"""
+        from django.conf import settings
+        self.assertFalse(settings.SECURE_CONTENT_TYPE_NOSNIFF)
+        self.assertIsNone(settings.SECURE_REFERRER_POLICY)
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response['Referrer-Policy'], 'strict-origin-when-cross-origin')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+    
+    def test_invalid_header_value_fails_at_compile_time(self):
+        """Test a bad configured value is rejected when the bundle is built"""
+        from django.http import BadHeaderError
+        from .middleware import compile_security_headers
+        with self.assertRaises(BadHeaderError):
+            compile_security_headers({'HEADERS': {'Referrer-Policy': 'no-referrer\nX-Injected: 1'}})
+    
+    def test_policy_configurable_from_settings(self):
+        """Test SECURITY_HEADERS overrides and drops headers without code edits"""
+        from django.test import override_settings
+        config = {
+            'HEADERS': {'Referrer-Policy': 'no-referrer'},
+            'ROUTES': {'/admin': {'HEADERS': {'X-Frame-Options': 'SAMEORIGIN'}}},
+        }
+        with override_settings(SECURITY_HEADERS=config):
+            response = self.client.get('/api/books/')
+            self.assertEqual(response['Referrer-Policy'], 'no-referrer')
+            response = self.client.get('/admin/login/')
+            self.assertEqual(response['X-Frame-Options'], 'SAMEORIGIN')
+
+
+# ==================== LEAN MIDDLEWARE TESTS ====================
+
+class LeanMiddlewareTest(APITestCase):
+    """Test /api/ requests skip session, CSRF, auth and messages middleware"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='leanuser', password='testpass123')
+    
+    def test_api_request_skips_session_and_csrf(self):
+        """Test API responses never set session or CSRF cookies"""
+        response = self.client.get('/api/books/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertNotIn('csrftoken', response.cookies)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertTrue(response.wsgi_request._lean_api)
+    
+    def test_api_post_without_csrf_token(self):
+        """Test unsafe API requests are not subject to CSRF checks"""
+        client = APIClient(enforce_csrf_checks=True)
+        response = client.post('/api/login/', {
+            'username_or_email': 'leanuser',
+            'password': 'testpass123'
+        }, format='json')
+        self.assertNotEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_jwt_still_authenticates(self):
+        """Test JWT authentication works without the auth middleware"""
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get('/api/my-profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_session_does_not_authenticate_api(self):
+        """Test a session cookie is ignored on lean API paths"""
+        self.client.login(username='leanuser', password='testpass123')
+        response = self.client.get('/api/my-profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_admin_keeps_full_stack(self):
+        """Test the admin login page still gets sessions and CSRF"""
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('csrftoken', response.cookies)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.wsgi_request._lean_api)
+    
+    def test_exempt_prefixes_keep_full_stack(self):
+        """Test exempt paths under /api/ still see the session user"""
+        self.client.login(username='leanuser', password='testpass123')
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.wsgi_request.user, self.user)
+    
+    def test_prefixes_configurable(self):
+        """Test an empty LEAN_API_PREFIXES runs the full stack everywhere"""
+        from django.test import override_settings
+        with override_settings(LEAN_API_PREFIXES=[]):
+            response = self.client.get('/api/books/')
+            self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+
+# ==================== STARTUP CHECK TESTS ====================
+
+class StartupChecksTest(TestCase):
+    """Test the background startup migration check"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+    
+    def test_schema_version_is_stable(self):
+        """Test the schema version only depends on migration files"""
+        from .startup import schema_version
+        self.assertEqual(schema_version(), schema_version())
+        self.assertEqual(len(schema_version()), 16)
+    
+    def test_no_pending_migrations(self):
+        """Test the test database is fully migrated"""
+        from .startup import pending_migrations
+        self.assertEqual(pending_migrations(), [])
+    
+    def test_verified_version_is_cached(self):
+        """Test a second check skips the database"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .startup import check_migrations
+        self.assertEqual(check_migrations(), 'current')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(check_migrations(), 'cached')
+        self.assertEqual(len(queries), 0)
+    
+    def test_follower_stands_down(self):
+        """Test a worker that cannot take the lock does not migrate"""
+        from contextlib import contextmanager
+        from unittest.mock import patch
+        from .startup import check_migrations
+        
+        @contextmanager
+        def lock_held_elsewhere(using):
+            yield False
+        
+        with patch('library_api.startup.migration_lock', lock_held_elsewhere), \
+             patch('library_api.startup.pending_migrations') as pending:
+            self.assertEqual(check_migrations(), 'follower')
+            pending.assert_not_called()
+    
+    def test_pending_without_auto_migrate(self):
+        """Test pending migrations are reported, not applied, when auto-migrate is off"""
+        from unittest.mock import patch
+        from .startup import check_migrations
+        with patch('library_api.startup.pending_migrations', return_value=['library_api.9999_new']), \
+             patch('django.core.management.call_command') as migrate:
+            self.assertEqual(check_migrations(auto_migrate=False), 'pending')
+            migrate.assert_not_called()
+    
+    def test_run_startup_checks_records_state(self):
+        """Test the outcome is recorded for health checks"""
+        from django.test import override_settings
+        from .startup import run_startup_checks
+        with override_settings(STARTUP_MIGRATION_CHECK=True):
+            state = run_startup_checks()
+        self.assertEqual(state['status'], 'ready')
+        self.assertIn('migrations: current', state['detail'])
+        self.assertIsNotNone(state['duration_ms'])
+
+
+# ==================== STARTUP PROFILING TESTS ====================
+
+class ProfileStartupTest(TestCase):
+    """Test the importtime parsing behind profile_startup"""
+    
+    IMPORTTIME = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       100 |        100 |     yaml.reader\n'
+        'import time:       200 |        300 |   yaml\n'
+        'import time:        50 |         50 |     drf_spectacular.plumbing\n'
+        'import time:       400 |        750 |   drf_spectacular.openapi\n'
+        'import time:       250 |       1000 | drf_spectacular.views\n'
+    )
+    
+    def test_parse_importtime(self):
+        """Test rows carry module, self, cumulative and nesting depth"""
+        from .management.commands.profile_startup import parse_importtime
+        rows = parse_importtime(self.IMPORTTIME)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], ('yaml.reader', 100, 100, 2))
+        self.assertEqual(rows[-1], ('drf_spectacular.views', 250, 1000, 0))
+    
+    def test_component_cost_counts_outermost_only(self):
+        """Test nested modules of a component are not double counted"""
+        from .management.commands.profile_startup import component_cost_us, parse_importtime
+        rows = parse_importtime(self.IMPORTTIME)
+        self.assertEqual(component_cost_us(rows, 'drf_spectacular'), 1000)
+        self.assertEqual(component_cost_us(rows, 'yaml'), 300)
+        self.assertEqual(component_cost_us(rows, 'requests'), 0)
+    
+    def test_scan_finds_eager_and_deferred_imports(self):
+        """Test module-level imports are told apart from function-level ones"""
+        from django.conf import settings
+        from .management.commands.profile_startup import scan_imports
+        found = {(module, lazy) for module, location, lazy in scan_imports(settings.BASE_DIR)}
+        self.assertIn(('drf_spectacular.views', False), found)
+        self.assertIn(('django.core.management.call_command', True), found)
+    
+    def test_profiles_the_project_wsgi_module(self):
+        """Test the child process boots through settings.WSGI_APPLICATION, not a bare handler"""
+        import json
+        from unittest import mock
+        from django.conf import settings
+        from .management.commands.profile_startup import FIRST_REQUEST_SCRIPT, Command
+        self.assertNotIn('from django.core.wsgi import', FIRST_REQUEST_SCRIPT)
+        completed = mock.Mock(stdout=json.dumps({'total_ms': 1}), stderr='')
+        with mock.patch('subprocess.run', return_value=completed) as run:
+            Command()._run([], '/api/books/', 'localhost')
+        self.assertEqual(run.call_args[0][0][-1], settings.WSGI_APPLICATION)
+    
+    def test_json_report_includes_comparison(self):
+        """Test --compare deltas are part of the --json output"""
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from .management.commands.profile_startup import Command
+        report = {'imports': {'total_self_ms': 120.0}, 'cold_start': {'setup_ms': 80.0, 'total_ms': 300.0}}
+        baseline = {'imports': {'total_self_ms': 100.0}, 'cold_start': {'setup_ms': 90.0}}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as handle:
+            json.dump(baseline, handle)
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        with mock.patch.object(Command, 'build_report', return_value=report):
+            call_command('profile_startup', json=True, compare=handle.name, stdout=out)
+        comparison = json.loads(out.getvalue())['comparison']
+        self.assertEqual(comparison['imports.total_self_ms']['delta'], 20.0)
+        self.assertEqual(comparison['cold_start.setup_ms']['delta'], -10.0)
+        self.assertNotIn('cold_start.total_ms', comparison)
+
+
+# ==================== BENCHMARK HARNESS TESTS ====================
+
+class BenchHarnessTest(TestCase):
+    """Test the measurement helpers behind the bench command"""
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        from .management.commands.bench import percentile
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+    
+    def test_query_counter(self):
+        """Test the execute wrapper counts queries per request"""
+        from django.db import connection
+        from .management.commands.bench import QueryCounter
+        Book.objects.create(title='Bench', author='Author', isbn='9780000000001',
+                            published_date=date(2020, 1, 1), copies_available=1)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            list(Book.objects.all())
+            Book.objects.count()
+        self.assertEqual(counter.queries, 2)
+        if counter.rows_known:
+            self.assertGreaterEqual(counter.rows, 2)
+
+
+# ==================== INSTRUMENTATION TESTS ====================
+
+class InstrumentationTest(APITestCase):
+    """Test request metrics and the /metrics/ endpoint"""
+    
+    def setUp(self):
+        from .metrics import registry
+        registry.reset()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='metricsadmin', password='testpass123')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.member = User.objects.create_user(username='metricsmember', password='testpass123')
+        Book.objects.create(title='Metrics Book', author='Author', isbn='9780000000002',
+                            published_date=date(2020, 1, 1), copies_available=2)
+    
+    def test_every_request_counted(self):
+        """Test latency is recorded per view without sampling"""
+        from django.test import override_settings
+        from .metrics import registry
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.client.get('/api/books/')
+            self.client.get('/api/books/')
+        stats = registry.snapshot()[('book-list-create', 'GET', '2xx')]
+        self.assertEqual(stats[0], 2)
+        self.assertEqual(stats[3], 0)
+    
+    def test_sampled_request_traces_queries_and_render(self):
+        """Test sampled requests record queries, DB time and render time"""
+        from django.test import override_settings
+        from .metrics import registry
+        with override_settings(METRICS_SAMPLE_RATE=1.0):
+            self.client.get('/api/books/')
+        stats = registry.snapshot()[('book-list-create', 'GET', '2xx')]
+        self.assertEqual(stats[3], 1)
+        self.assertGreaterEqual(stats[4], 2)  # count + page
+        self.assertGreater(stats[5], 0)
+        self.assertGreater(stats[6], 0)
+    
+    def test_metrics_endpoint_admin_only(self):
+        """Test /metrics/ requires an admin"""
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.member)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_metrics_endpoint_prometheus_text(self):
+        """Test admins get Prometheus text exposition"""
+        self.client.get('/api/books/')
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE lms_http_requests_total counter', body)
+        self.assertIn('lms_http_requests_total{view="book-list-create",method="GET",status="2xx"} 1', body)
+        self.assertIn('le="+Inf"', body)
+
+
+# ==================== LOGGING PIPELINE TESTS ====================
+
+class LoggingPipelineTest(TestCase):
+    """Test JSON formatting, request ids, sampling and the log queue"""
+    
+    def make_record(self, name='library_api.views', level=20, msg='hello %s', args=('world',)):
+        import logging
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    
+    def test_json_formatter(self):
+        """Test records become one JSON object with extras"""
+        import json
+        from .logs import JsonFormatter
+        record = self.make_record()
+        record.book_id = 7
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload['message'], 'hello world')
+        self.assertEqual(payload['level'], 'INFO')
+        self.assertEqual(payload['logger'], 'library_api.views')
+        self.assertEqual(payload['book_id'], 7)
+    
+    def test_sampling_filter(self):
+        """Test sampled loggers drop INFO but always keep warnings"""
+        from .logs import SamplingFilter
+        sampling = SamplingFilter({'library_api.views': 0, 'library_api.views.keep': 1})
+        self.assertFalse(sampling.filter(self.make_record()))
+        self.assertTrue(sampling.filter(self.make_record(level=30)))
+        self.assertTrue(sampling.filter(self.make_record(name='library_api.views.keep')))
+        self.assertTrue(sampling.filter(self.make_record(name='django.request')))
+    
+    def test_queued_handler_writes_off_thread(self):
+        """Test records reach the target via the listener with the request id attached"""
+        import logging
+        from .logs import QueuedHandler, request_id_var
+        
+        class ListHandler(logging.Handler):
+            def __init__(self):
+                super().__init__()
+                self.records = []
+            
+            def emit(self, record):
+                self.records.append(record)
+        
+        target = ListHandler()
+        handler = QueuedHandler(handlers=[target])
+        token = request_id_var.set('abc123')
+        try:
+            handler.handle(self.make_record())
+        finally:
+            request_id_var.reset(token)
+        handler.flush_and_stop()
+        self.assertEqual(len(target.records), 1)
+        self.assertEqual(target.records[0].getMessage(), 'hello world')
+        self.assertEqual(target.records[0].request_id, 'abc123')
+    
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test a full queue drops records and counts them"""
+        import logging
+        from .logs import QueuedHandler
+        handler = QueuedHandler(handlers=[logging.NullHandler()], queue_size=1)
+        handler._ensure_listener()
+        handler._listener.stop()  # nothing drains the queue now
+        handler._listener = None
+        handler.enqueue(self.make_record())
+        handler.enqueue(self.make_record())
+        self.assertEqual(handler.dropped, 1)
+    
+    def test_dropped_records_are_reported(self):
+        """Test drops reach the metrics and a rate-limited stderr warning"""
+        import io
+        import logging
+        from contextlib import redirect_stderr
+        from .logs import QueuedHandler, dropped_records
+        from .metrics import render_prometheus
+        handler = QueuedHandler(handlers=[logging.NullHandler()], queue_size=1)
+        handler._ensure_listener()
+        handler._listener.stop()
+        handler._listener = None
+        before = dropped_records()
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            for _ in range(4):
+                handler.enqueue(self.make_record())
+        self.assertEqual(dropped_records() - before, 3)
+        self.assertEqual(stderr.getvalue().count('records dropped'), 1)
+        self.assertIn('1 records dropped', stderr.getvalue())
+        text = render_prometheus(snapshot={}, db_stats={})
+        self.assertIn(f'lms_log_records_dropped_total {dropped_records()}', text)
+    
+    def test_request_id_header(self):
+        """Test responses echo a valid incoming id and generate one otherwise"""
+        response = self.client.get('/api/books/', HTTP_X_REQUEST_ID='lb-123')
+        self.assertEqual(response['X-Request-ID'], 'lb-123')
+        response = self.client.get('/api/books/', HTTP_X_REQUEST_ID='bad id!')
+        self.assertNotEqual(response['X-Request-ID'], 'bad id!')
+        self.assertEqual(len(response['X-Request-ID']), 32)
+
+
+# ==================== HEALTH PROBE TESTS ====================
+
+class HealthProbeTest(TestCase):
+    """Test liveness and cached readiness probes"""
+    
+    def setUp(self):
+        from .health import reset_checks
+        reset_checks()
+    
+    def test_liveness_does_no_io(self):
+        """Test /health/live/ runs no queries"""
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/live/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'alive')
+    
+    def test_readiness_reports_timings(self):
+        """Test /health/ready/ reports each dependency with its timing"""
+        response = self.client.get('/health/ready/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['status'], 'ready')
+        self.assertEqual(data['checks']['database']['status'], 'ok')
+        self.assertEqual(data['checks']['cache']['status'], 'ok')
+        self.assertIn('duration_ms', data['checks']['database'])
+        self.assertNotIn('detail', data['checks']['email'])
+    
+    def test_readiness_is_cached(self):
+        """Test repeated probes within the TTL skip the database"""
+        self.client.get('/health/ready/')
+        with self.assertNumQueries(0):
+            self.client.get('/health/ready/')
+    
+    def test_critical_failure_returns_503(self):
+        """Test a failing critical dependency makes the instance not ready"""
+        from unittest.mock import patch
+        from .health import CHECKS
+        
+        def broken():
+            raise RuntimeError('connection refused')
+        
+        with patch.dict(CHECKS, {'database': broken}):
+            response = self.client.get('/health/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database']['status'], 'failing')
+    
+    def test_non_critical_failure_is_degraded(self):
+        """Test a failing email check does not fail readiness"""
+        from unittest.mock import patch
+        from .health import CHECKS
+        
+        def broken():
+            raise RuntimeError('smtp unreachable')
+        
+        with patch.dict(CHECKS, {'email': broken}):
+            response = self.client.get('/health/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks']['email']['status'], 'degraded')
+
+
+# ==================== REPLICA ROUTING TESTS ====================
+
+class ReplicaRoutingTest(APITestCase):
+    """Test primary/replica routing and read-your-writes stickiness"""
+    
+    def setUp(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        cache.clear()
+        # The read-your-writes pin needs a cache shared by the workers; LocMem stands in for one
+        shared = patch('library_api.tokens.cache_is_shared', return_value=True)
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='replicauser', password='testpass123')
+        self.book = Book.objects.create(title='Replica Book', author='Author', isbn='9780000000003',
+                                        published_date=date(2020, 1, 1), copies_available=3)
+        self.client.force_authenticate(user=self.user)
+    
+    def test_router_defaults_to_primary(self):
+        """Test reads outside opted-in views and all writes use the primary"""
+        from django.test import override_settings
+        from .db_routers import PrimaryReplicaRouter
+        router = PrimaryReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica_1']):
+            self.assertEqual(router.db_for_read(Book), 'default')
+            self.assertEqual(router.db_for_write(Book), 'default')
+            self.assertFalse(router.allow_migrate('replica_1', 'library_api'))
+            self.assertTrue(router.allow_migrate('default', 'library_api'))
+    
+    def test_safe_request_reads_from_replica(self):
+        """Test list views route reads to a replica"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        # 'default' stands in for the replica so the query still has a database to hit
+        with override_settings(DATABASE_REPLICAS=['default']), \
+             patch('library_api.db_routers.choose_replica', return_value='default') as chooser:
+            response = self.client.get('/api/available-books/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(chooser.called)
+    
+    def test_no_replicas_configured(self):
+        """Test routing is a no-op without replicas"""
+        from unittest.mock import patch
+        with patch('library_api.db_routers.choose_replica') as chooser:
+            self.client.get('/api/available-books/')
+        chooser.assert_not_called()
+    
+    def test_replica_reads_need_a_shared_cache(self):
+        """Test a per-process cache keeps reads on the primary, with a warning"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        from . import db_routers
+        with override_settings(DATABASE_REPLICAS=['default']), \
+             patch('library_api.tokens.cache_is_shared', return_value=False), \
+             patch.object(db_routers, '_warned_unshared_cache', False), \
+             patch('library_api.db_routers.choose_replica', return_value='default') as chooser:
+            with self.assertLogs('library_api.db_routers', 'WARNING'):
+                response = self.client.get('/api/available-books/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chooser.assert_not_called()
+    
+    def test_checkout_pins_user_to_primary(self):
+        """Test a user's reads stay on the primary right after their checkout"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        with override_settings(DATABASE_REPLICAS=['default']), \
+             patch('library_api.db_routers.choose_replica', return_value='default') as chooser:
+            response = self.client.post('/api/checkout/', {'book': self.book.id})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            chooser.reset_mock()
+            response = self.client.get('/api/my-books/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), 1)
+            chooser.assert_not_called()
+
+
+# ==================== CONNECTION POOL TESTS ====================
+
+class ConnectionPoolTest(TestCase):
+    """Test connection settings, counters and pool metrics"""
+    
+    def test_default_connection_settings(self):
+        """Test health checks are on so stale connections are replaced before use"""
+        from django.conf import settings
+        self.assertIn(settings.DB_POOL_MODE, ('persistent', 'pgbouncer', 'native'))
+        self.assertIn('CONN_HEALTH_CHECKS', settings.DATABASES['default'])
+    
+    def test_connection_created_is_counted(self):
+        """Test new connections increment the per-alias counter"""
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+        from .db_pool import connections_opened
+        before = connections_opened.get('default', 0)
+        connection_created.send(sender=connection.__class__, connection=connection)
+        self.assertEqual(connections_opened['default'], before + 1)
+    
+    def test_pool_stats_reports_every_alias(self):
+        """Test pool_stats covers configured databases without opening new connections"""
+        from django.conf import settings
+        from .db_pool import pool_stats
+        Book.objects.count()
+        stats = pool_stats()
+        self.assertEqual(set(stats), set(settings.DATABASES))
+        self.assertTrue(stats['default']['connected'])
+        self.assertIsNone(stats['default']['pool'])
+    
+    def test_metrics_include_connection_counters(self):
+        """Test the Prometheus output exports connection and native pool gauges"""
+        from .metrics import render_prometheus
+        db_stats = {
+            'default': {'connected': True, 'age_seconds': 12.5, 'opened_total': 3,
+                        'pool': {'pool_size': 4, 'pool_available': 2}},
+        }
+        text = render_prometheus(snapshot={}, db_stats=db_stats)
+        self.assertIn('lms_db_connections_opened_total{alias="default",mode="persistent"} 3', text)
+        self.assertIn('lms_db_connection_age_seconds{alias="default"} 12.5', text)
+        self.assertIn('lms_db_pool{alias="default",stat="pool_available"} 2', text)
+    
+    def test_pgbouncer_migration_lock_uses_cache(self):
+        """Test the migration lock avoids session advisory locks behind PgBouncer"""
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .startup import migration_lock
+        cache.clear()
+        with override_settings(DB_POOL_MODE='pgbouncer'), \
+             patch('django.db.backends.sqlite3.base.DatabaseWrapper.vendor', 'postgresql'), \
+             patch('library_api.tokens.cache_is_shared', return_value=True):
+            with migration_lock() as first:
+                with migration_lock() as second:
+                    self.assertTrue(first)
+                    self.assertFalse(second)
+            with migration_lock() as again:
+                self.assertTrue(again)
+    
+    def test_migrate_endpoint_runs_without_shared_lock(self):
+        """Test POST /migrate/ still migrates, with a warning, when no lock spans the workers"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+        admin = User.objects.create_superuser(username='migrator', email='migrator@example.com', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        with override_settings(DB_POOL_MODE='pgbouncer', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        }), patch('django.db.backends.sqlite3.base.DatabaseWrapper.vendor', 'postgresql'), \
+             patch('django.core.management.call_command') as call_command:
+            response = client.post('/migrate/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('shared cache', response.data['warning'])
+        call_command.assert_called_once()
+    
+    def test_pgbouncer_migration_lock_needs_shared_cache(self):
+        """Test a per-process cache gives no lock and startup doesn't migrate"""
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .startup import check_migrations, migration_lock
+        cache.clear()
+        with override_settings(DB_POOL_MODE='pgbouncer', CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        }), patch('django.db.backends.sqlite3.base.DatabaseWrapper.vendor', 'postgresql'):
+            with migration_lock() as held:
+                self.assertIsNone(held)
+            with patch('library_api.startup.pending_migrations', return_value=['library_api.9999_next']), \
+                 patch('django.core.management.call_command') as call_command:
+                self.assertEqual(check_migrations(auto_migrate=True), 'pending')
+            call_command.assert_not_called()
+
+
+# ==================== JSON RENDERER TESTS ====================
+
+class FastJSONTest(APITestCase):
+    """Test the orjson-backed renderer and parser match DRF's JSON classes"""
+    
+    def payload(self):
+        from decimal import Decimal
+        from datetime import datetime, timezone as dt_timezone
+        from django.utils.translation import gettext_lazy
+        return {
+            'penalty': Decimal('2.50'),
+            'due': date(2024, 1, 15),
+            'at': datetime(2024, 1, 15, 10, 30, 0, 123456, tzinfo=dt_timezone.utc),
+            'label': gettext_lazy('Books'),
+            'text': 'café \u2028 line',
+            'rows': [{'id': 1, 'title': 'A'}, {'id': 2, 'title': None}],
+            1: 'non-string key',
+        }
+    
+    def test_render_matches_default(self):
+        """Test output is byte-for-byte what JSONRenderer produces"""
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = self.payload()
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+    
+    def test_render_falls_back_without_orjson(self):
+        """Test the renderer uses the stdlib encoder when orjson is missing"""
+        from unittest.mock import patch
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = self.payload()
+        with patch('library_api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+    
+    def test_indent_request_is_honoured(self):
+        """Test an indent in the Accept header still indents the response"""
+        from .renderers import FastJSONRenderer
+        body = FastJSONRenderer().render({'a': 1}, 'application/json; indent=4')
+        self.assertEqual(body, b'{\n    "a": 1\n}')
+    
+    def test_parser(self):
+        """Test the parser returns the same data and rejects malformed bodies"""
+        import io
+        from rest_framework.exceptions import ParseError
+        from .renderers import FastJSONParser
+        parser = FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO(b'{"book": 3, "t": "caf\\u00e9"}')), {'book': 3, 't': 'café'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"book": '))
+    
+    def test_api_uses_fast_renderer(self):
+        """Test API responses and JSON request bodies go through the configured classes"""
+        user = User.objects.create_user(username='jsonuser', password='testpass123')
+        user.userprofile.role = 'admin'
+        user.userprofile.save()
+        self.client.force_authenticate(user=user)
+        response = self.client.post('/api/books/', {
+            'title': 'Fast Book', 'author': 'Author', 'isbn': '9781000000047',
+            'published_date': '2020-01-01', 'copies_available': 2,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.accepted_renderer.__class__.__name__, 'FastJSONRenderer')
+        self.assertEqual(response.json()['title'], 'Fast Book')
+
+
+# ==================== SPARSE FIELDSET TESTS ====================
+
+class SparseFieldsetTest(APITestCase):
+    """Test ?fields= and ?omit= on book and transaction listings"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='sparseuser', password='testpass123')
+        self.book = Book.objects.create(title='Sparse Book', author='Author', isbn='9780000000005',
+                                        published_date=date(2020, 1, 1), copies_available=3)
+        self.loan = Transaction.objects.create(book=self.book, user=self.user, checkout_date=date.today(),
+                                               due_date=date.today() + timedelta(days=14))
+        self.client.force_authenticate(user=self.user)
+    
+    def test_fields_selects_top_level_and_nested(self):
+        """Test a mobile client can ask for just the title and due date"""
+        response = self.client.get('/api/my-books/', {'fields': 'book.title,due_date'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'book': {'title': 'Sparse Book'}, 'due_date': str(self.loan.due_date)})
+    
+    def test_omit_removes_fields(self):
+        """Test ?omit= drops top-level and nested fields"""
+        response = self.client.get('/api/transaction-history/', {'omit': 'overdue_penalty,book.isbn'})
+        row = response.data['results'][0]
+        self.assertNotIn('overdue_penalty', row)
+        self.assertNotIn('isbn', row['book'])
+        self.assertIn('title', row['book'])
+    
+    def test_without_selection_response_is_unchanged(self):
+        """Test every field is returned when nothing is selected"""
+        response = self.client.get('/api/my-books/')
+        row = response.data['results'][0]
+        self.assertEqual(set(row), {'id', 'book', 'user', 'checkout_date', 'return_date', 'due_date', 'overdue_penalty'})
+        self.assertEqual(set(row['book']), {'id', 'title', 'author', 'isbn', 'published_date', 'copies_available'})
+    
+    def test_queryset_selects_only_requested_columns(self):
+        """Test the SQL column list shrinks with the selection"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/available-books/', {'fields': 'title'})
+        select = [q['sql'] for q in queries.captured_queries if 'FROM "library_api_book"' in q['sql'] and 'COUNT' not in q['sql']][-1]
+        self.assertIn('"title"', select.split('FROM')[0])
+        self.assertNotIn('"author"', select.split('FROM')[0])
+    
+    def test_unselected_book_is_not_joined(self):
+        """Test dropping the nested book removes the join"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/my-books/', {'fields': 'id,due_date'})
+        self.assertEqual(response.data['results'][0], {'id': self.loan.id, 'due_date': str(self.loan.due_date)})
+        self.assertFalse(any('JOIN "library_api_book"' in q['sql'] for q in queries.captured_queries))
+    
+    def test_selection_ignored_on_writes(self):
+        """Test ?fields= doesn't hide writable fields from validation"""
+        admin = User.objects.create_user(username='sparseadmin', password='testpass123')
+        admin.userprofile.role = 'admin'
+        admin.userprofile.save()
+        self.client.force_authenticate(user=admin)
+        response = self.client.post('/api/books/?fields=title', {
+            'title': 'Written', 'author': 'Author', 'isbn': '9781000000061',
+            'published_date': '2020-01-01', 'copies_available': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['isbn'], '9781000000061')
+
+
+# ==================== SIDELOAD TESTS ====================
+
+class SideloadTest(APITestCase):
+    """Test the compact transaction listing with included books"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='sideloaduser', password='testpass123')
+        self.popular = Book.objects.create(title='Popular Book', author='Author', isbn='9780000000007',
+                                           published_date=date(2020, 1, 1), copies_available=3)
+        self.other = Book.objects.create(title='Other Book', author='Author', isbn='9780000000008',
+                                         published_date=date(2021, 1, 1), copies_available=3)
+        for book in (self.popular, self.popular, self.popular, self.other):
+            Transaction.objects.create(book=book, user=self.user, checkout_date=date.today(),
+                                       due_date=date.today() + timedelta(days=14), return_date=date.today())
+        self.client.force_authenticate(user=self.user)
+    
+    def test_compact_rows_carry_ids_and_books_are_included_once(self):
+        """Test each book is serialized once under included.books"""
+        response = self.client.get('/api/transaction-history/', {'compact': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(row['book'] for row in response.data['results']),
+                         sorted([self.popular.id] * 3 + [self.other.id]))
+        books = response.data['included']['books']
+        self.assertEqual(set(books), {str(self.popular.id), str(self.other.id)})
+        self.assertEqual(books[str(self.popular.id)]['title'], 'Popular Book')
+    
+    def test_compact_uses_one_query_for_books(self):
+        """Test books come from one in_bulk query and the row query has no join"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/transaction-history/', {'compact': 'true'})
+        book_queries = [q['sql'] for q in queries.captured_queries if 'library_api_book' in q['sql']]
+        self.assertEqual(len(book_queries), 1)
+        self.assertNotIn('JOIN', book_queries[0])
+    
+    def test_compact_payload_is_smaller(self):
+        """Test the compact representation ships fewer bytes than nested rows"""
+        full = self.client.get('/api/transaction-history/')
+        compact = self.client.get('/api/transaction-history/', {'compact': '1'})
+        self.assertLess(len(compact.content), len(full.content))
+        self.assertNotIn('included', full.data)
+    
+    def test_compact_respects_field_selection(self):
+        """Test ?fields=book.title limits the included books as well"""
+        response = self.client.get('/api/transaction-history/', {'compact': '1', 'fields': 'id,book.title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'book'})
+        self.assertEqual(response.data['included']['books'][str(self.other.id)], {'title': 'Other Book'})
+
+
+# ==================== COMPRESSION TESTS ====================
+
+class CompressionTest(APITestCase):
+    """Test response compression, negotiation and exclusions"""
+    
+    def middleware(self, response):
+        from .compression import available_encoders
+        from .middleware import CompressionMiddleware
+        middleware = CompressionMiddleware(lambda request: response)
+        # gzip only, so results don't depend on which optional codecs are installed
+        middleware.encoders = {'gzip': available_encoders()['gzip']}
+        return middleware
+    
+    def request(self, path='/api/books/', encoding='gzip, deflate, br'):
+        from django.test import RequestFactory
+        return RequestFactory().get(path, HTTP_ACCEPT_ENCODING=encoding)
+    
+    def json_response(self, size=5000):
+        from django.http import HttpResponse
+        body = ('{"rows": [' + ','.join('{"title": "Collected Letters"}' for _ in range(size // 30)) + ']}').encode()
+        return HttpResponse(body, content_type='application/json'), body
+    
+    def test_large_json_is_gzipped(self):
+        """Test a large JSON body is compressed and decompresses to the original"""
+        import gzip
+        response, body = self.json_response()
+        result = self.middleware(response)(self.request())
+        self.assertEqual(result['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(result.content), body)
+        self.assertEqual(result['Content-Length'], str(len(result.content)))
+        self.assertIn('Accept-Encoding', result['Vary'])
+    
+    def test_small_response_is_left_alone(self):
+        """Test bodies under COMPRESSION_MIN_SIZE cost no compression work"""
+        response, body = self.json_response(size=200)
+        result = self.middleware(response)(self.request())
+        self.assertFalse(result.has_header('Content-Encoding'))
+        self.assertEqual(result.content, body)
+    
+    def test_auth_endpoints_are_excluded(self):
+        """Test token-bearing endpoints are never compressed (BREACH)"""
+        response, body = self.json_response()
+        result = self.middleware(response)(self.request('/api/token/refresh/'))
+        self.assertFalse(result.has_header('Content-Encoding'))
+        self.assertEqual(result.content, body)
+    
+    def test_session_pages_are_excluded(self):
+        """Test admin and other session-rendered HTML is never compressed (BREACH)"""
+        from django.http import HttpResponse
+        body = b'<html>' + b'<input name="csrfmiddlewaretoken" value="secret">' * 100 + b'</html>'
+        for path in ('/admin/', '/api/profile/'):
+            response = HttpResponse(body, content_type='text/html; charset=utf-8')
+            result = self.middleware(response)(self.request(path))
+            self.assertFalse(result.has_header('Content-Encoding'))
+            self.assertEqual(result.content, body)
+    
+    def test_responses_using_csrf_token_are_excluded(self):
+        """Test a lean response that rendered the CSRF token goes out uncompressed"""
+        from django.middleware.csrf import get_token
+        response, body = self.json_response()
+        request = self.request()
+        get_token(request)
+        result = self.middleware(response)(request)
+        self.assertFalse(result.has_header('Content-Encoding'))
+    
+    def test_admin_page_is_uncompressed_end_to_end(self):
+        """Test the admin login page comes back uncompressed through the full stack"""
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip, br, zstd')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+    
+    def test_client_without_accept_encoding(self):
+        """Test identity responses still vary on Accept-Encoding"""
+        response, body = self.json_response()
+        result = self.middleware(response)(self.request(encoding=''))
+        self.assertFalse(result.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', result['Vary'])
+    
+    def test_streaming_response_is_compressed(self):
+        """Test streaming exports are compressed chunk by chunk"""
+        import gzip
+        from django.http import StreamingHttpResponse
+        chunks = [f'{i},Collected Letters,Author\n'.encode() for i in range(500)]
+        response = StreamingHttpResponse(iter(chunks), content_type='text/csv')
+        result = self.middleware(response)(self.request())
+        self.assertEqual(result['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(result.streaming_content)), b''.join(chunks))
+    
+    def test_negotiation(self):
+        """Test q-values and server preference pick the encoding"""
+        from .compression import negotiate
+        encoders = {'zstd': None, 'br': None, 'gzip': None}
+        self.assertEqual(negotiate('gzip, br', encoders), 'br')
+        self.assertEqual(negotiate('gzip, br, zstd', encoders), 'zstd')
+        self.assertEqual(negotiate('br;q=0.5, gzip', encoders), 'gzip')
+        self.assertEqual(negotiate('br', {'gzip': None}), None)
+        self.assertEqual(negotiate('gzip;q=0', encoders), None)
+        self.assertEqual(negotiate('*', {'gzip': None}), 'gzip')
+        self.assertEqual(negotiate('', encoders), None)
+    
+    def test_api_list_is_compressed_end_to_end(self):
+        """Test a book page goes out compressed through the middleware stack"""
+        Book.objects.bulk_create([
+            Book(title=f'Compressed Book {i}', author='Author', isbn=f'97800000001{i:02d}',
+                 published_date=date(2020, 1, 1), copies_available=1)
+            for i in range(30)
+        ])
+        response = self.client.get('/api/available-books/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(response['Content-Encoding'], ('gzip', 'br', 'zstd'))
+
+
+# ==================== PAGINATION COUNT TESTS ====================
+
+class FastCountPaginationTest(APITestCase):
+    """Test estimated and cached counts on paginated listings"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='countuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        Book.objects.bulk_create([
+            Book(title=f'Counted Book {i}', author='Author', isbn=f'97800000002{i:02d}',
+                 published_date=date(2020, 1, 1), copies_available=1)
+            for i in range(12)
+        ])
+    
+    def test_small_counts_are_exact(self):
+        """Test a normal listing reports an exact count"""
+        response = self.client.get('/api/books/')
+        self.assertEqual(response.data['count'], 12)
+        self.assertTrue(response.data['count_exact'])
+    
+    def test_large_unfiltered_table_uses_estimate(self):
+        """Test unfiltered listings above the threshold use the planner estimate"""
+        from unittest.mock import patch
+        with patch('library_api.pagination.estimated_rows', return_value=2500000):
+            response = self.client.get('/api/books/')
+        self.assertEqual(response.data['count'], 2500000)
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 10)
+    
+    def test_filtered_listing_never_uses_table_estimate(self):
+        """Test a filtered listing is counted, not estimated from the whole table"""
+        from unittest.mock import patch
+        with patch('library_api.pagination.estimated_rows', return_value=2500000) as estimate:
+            response = self.client.get('/api/available-books/', {'title': 'Counted Book 1'})
+        estimate.assert_not_called()
+        self.assertEqual(response.data['count'], 3)
+        self.assertTrue(response.data['count_exact'])
+    
+    def test_large_counts_are_cached_per_filter(self):
+        """Test a large exact count is reused for the next page and keyed by the filter"""
+        from django.test import override_settings
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with override_settings(PAGINATION_COUNT_CACHE_MIN=5):
+            first = self.client.get('/api/available-books/', {'title': 'Counted'})
+            with CaptureQueriesContext(connection) as queries:
+                # A middle page: reaching the last one would pin the count down exactly
+                second = self.client.get('/api/available-books/', {'title': 'Counted', 'page': 2, 'page_size': 5})
+            other = self.client.get('/api/available-books/', {'title': 'Counted Book 1'})
+        self.assertTrue(first.data['count_exact'])
+        self.assertEqual(second.data['count'], 12)
+        self.assertFalse(second.data['count_exact'])
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(other.data['count'], 3)
+    
+    def test_low_estimate_still_links_every_page(self):
+        """Test pages past an estimate that is too low are linked and served"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        with override_settings(PAGINATION_ESTIMATE_THRESHOLD=1), \
+                patch('library_api.pagination.estimated_rows', return_value=5):
+            first = self.client.get('/api/books/')
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            self.assertFalse(first.data['count_exact'])
+            self.assertEqual(len(first.data['results']), 10)
+            self.assertIsNotNone(first.data['next'])
+            self.assertGreaterEqual(first.data['count'], 11)
+            last = self.client.get(first.data['next'])
+            self.assertEqual(last.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(last.data['results']), 2)
+            self.assertIsNone(last.data['next'])
+            self.assertEqual(last.data['count'], 12)
+            self.assertTrue(last.data['count_exact'])
+            beyond = self.client.get('/api/books/', {'page': 3})
+            self.assertEqual(beyond.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_high_estimate_stops_at_the_real_end(self):
+        """Test an overestimate doesn't link to pages that don't exist"""
+        from unittest.mock import patch
+        with patch('library_api.pagination.estimated_rows', return_value=2500000):
+            response = self.client.get('/api/books/', {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['count'], 12)
+    
+    def test_low_estimate_limit_offset(self):
+        """Test limit/offset paging past a low estimate keeps its next link"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        admin = User.objects.create_user(username='countadmin', password='testpass123')
+        admin.userprofile.role = 'admin'
+        admin.userprofile.save()
+        for i in range(10):
+            User.objects.create_user(username=f'counted{i}', password='testpass123')
+        total = User.objects.count()
+        self.client.force_authenticate(user=admin)
+        with override_settings(PAGINATION_ESTIMATE_THRESHOLD=1), \
+                patch('library_api.pagination.estimated_rows', return_value=3):
+            response = self.client.get('/api/users/', {'limit': 5, 'offset': 5})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), 5)
+            self.assertIsNotNone(response.data['next'])
+            self.assertFalse(response.data['count_exact'])
+            response = self.client.get('/api/users/', {'limit': 5, 'offset': total - 2})
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNone(response.data['next'])
+            self.assertEqual(response.data['count'], total)
+            self.assertTrue(response.data['count_exact'])
+    
+    def test_limit_offset_default_pagination(self):
+        """Test the global LimitOffset paginator reports count_exact too"""
+        admin = User.objects.create_user(username='countadmin', password='testpass123')
+        admin.userprofile.role = 'admin'
+        admin.userprofile.save()
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('count_exact', response.data)
+        self.assertEqual(response.data['count'], User.objects.count())
+
+
+# ==================== MEMBER DIRECTORY TESTS ====================
+
+class MemberDirectoryTest(APITestCase):
+    """Test the admin member directory and the user listing's query count"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='diradmin', email='admin@library.test', password='testpass123')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        for i in range(5):
+            User.objects.create_user(username=f'reader{i}', email=f'reader{i}@example.com', password='testpass123')
+        inactive = User.objects.get(username='reader4').userprofile
+        inactive.active_status = False
+        inactive.save()
+        self.client.force_authenticate(user=self.admin)
+    
+    def test_user_listing_has_no_per_row_queries(self):
+        """Test /api/users/ joins the user instead of querying it per row"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['username'], 'diradmin')
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'FROM "auth_user" WHERE' in q['sql']])
+    
+    def test_filters(self):
+        """Test role and active status filters"""
+        response = self.client.get('/api/members/', {'role': 'member', 'active': 'false'})
+        self.assertEqual([row['username'] for row in response.data['results']], ['reader4'])
+        response = self.client.get('/api/members/', {'role': 'admin'})
+        self.assertEqual([row['username'] for row in response.data['results']], ['diradmin'])
+    
+    def test_search_username_or_email(self):
+        """Test search matches fragments of the username or email"""
+        response = self.client.get('/api/members/', {'search': 'READER2'})
+        self.assertEqual([row['username'] for row in response.data['results']], ['reader2'])
+        response = self.client.get('/api/members/', {'search': 'library.test'})
+        self.assertEqual([row['username'] for row in response.data['results']], ['diradmin'])
+    
+    def test_keyset_pagination(self):
+        """Test pages follow cursors, newest member first, without overlap"""
+        first = self.client.get('/api/members/', {'page_size': 4})
+        self.assertEqual(len(first.data['results']), 4)
+        self.assertNotIn('count', first.data)
+        second = self.client.get(first.data['next'])
+        usernames = [row['username'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(usernames, ['reader4', 'reader3', 'reader2', 'reader1', 'reader0', 'diradmin'])
+    
+    def test_filtered_pages_walk_the_directory_index(self):
+        """Test EXPLAIN shows role/status pages read from the index that ends in the cursor's id"""
+        from django.db import connection, transaction
+        from .views import MemberCursorPagination, MemberFilter
+        queryset = MemberFilter({'role': 'member', 'active': 'true'}, queryset=UserProfile.objects.all()).qs
+        queryset = queryset.filter(id__lt=self.admin.userprofile.id + 10).order_by(MemberCursorPagination.ordering)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        self.assertIn('userprofile_role_active_idx', plan)
+        if connection.vendor == 'postgresql':
+            # SQLite can't use the bare boolean on active_status as an index key, so it still sorts
+            self.assertNotIn('Sort', plan)
+    
+    def test_members_cannot_browse_directory(self):
+        """Test the directory is admin only"""
+        self.client.force_authenticate(user=User.objects.get(username='reader0'))
+        response = self.client.get('/api/members/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# ==================== AUTOCOMPLETE TESTS ====================
+
+class AutocompleteTest(APITestCase):
+    """Test the in-process typeahead index and its catalog-version refresh"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from .autocomplete import index
+        cache.clear()
+        index.reset()
+        self.addCleanup(index.reset)
+        self.client = APIClient()
+        for i, (title, author) in enumerate([
+            ('Harry Potter and the Chamber of Secrets', 'J. K. Rowling'),
+            ('The Harrowing', 'Alison Littlewood'),
+            ('Thérèse Raquin', 'Émile Zola'),
+            ('Germinal', 'Émile Zola'),
+        ]):
+            Book.objects.create(title=title, author=author, isbn=f'97800000003{i:02d}',
+                                published_date=date(2000, 1, 1), copies_available=1)
+    
+    def titles(self, response):
+        return [row['title'] for row in response.data['results']]
+    
+    def test_prefix_suggestions_are_ranked(self):
+        """Test title-leading matches rank above mid-title matches"""
+        response = self.client.get('/api/books/autocomplete/', {'q': 'harr'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.titles(response), ['Harry Potter and the Chamber of Secrets', 'The Harrowing'])
+    
+    def test_author_and_accent_insensitive_match(self):
+        """Test authors match and accents are folded"""
+        response = self.client.get('/api/books/autocomplete/', {'q': 'emile zo'})
+        self.assertEqual(self.titles(response), ['Germinal', 'Thérèse Raquin'])
+        response = self.client.get('/api/books/autocomplete/', {'q': 'therese'})
+        self.assertEqual(self.titles(response), ['Thérèse Raquin'])
+    
+    def test_non_latin_titles_are_suggested(self):
+        """Test Cyrillic, Greek and CJK titles are indexed, and ß folds to ss"""
+        from .autocomplete import index
+        for i, (title, author) in enumerate([
+            ('Война и мир', 'Лев Толстой'),
+            ('三体', '刘慈欣'),
+            ('Ελληνικά', 'Συγγραφέας'),
+            ('Straße der Zeit', 'Autor'),
+        ]):
+            Book.objects.create(title=title, author=author, isbn=f'97800000004{i:02d}',
+                                published_date=date(2000, 1, 1), copies_available=1)
+        index.reset()
+        for query, title in [('войн', 'Война и мир'), ('толст', 'Война и мир'), ('三体', '三体'),
+                             ('ελλη', 'Ελληνικά'), ('STRASSE', 'Straße der Zeit'), ('straße', 'Straße der Zeit')]:
+            response = self.client.get('/api/books/autocomplete/', {'q': query})
+            self.assertEqual(self.titles(response), [title], query)
+    
+    def test_short_queries_return_nothing(self):
+        """Test one-character queries skip the lookup"""
+        response = self.client.get('/api/books/autocomplete/', {'q': 'h'})
+        self.assertEqual(response.data['results'], [])
+    
+    def test_no_database_hit_per_keystroke(self):
+        """Test suggestions after the first come from memory"""
+        self.client.get('/api/books/autocomplete/', {'q': 'ha'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/books/autocomplete/', {'q': 'harry'})
+    
+    def test_catalog_changes_are_applied_incrementally(self):
+        """Test a new or deleted book is picked up by reloading only that book"""
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        with override_settings(AUTOCOMPLETE_CHECK_INTERVAL=0):
+            self.client.get('/api/books/autocomplete/', {'q': 'ha'})
+            with self.captureOnCommitCallbacks(execute=True):
+                added = Book.objects.create(title='Harvest Moon', author='Author', isbn='9780000000399',
+                                            published_date=date(2001, 1, 1), copies_available=1)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/books/autocomplete/', {'q': 'harv'})
+            self.assertEqual(self.titles(response), ['Harvest Moon'])
+            self.assertEqual(len(queries.captured_queries), 1)
+            self.assertIn(' IN (', queries.captured_queries[0]['sql'])
+            with self.captureOnCommitCallbacks(execute=True):
+                added.delete()
+            response = self.client.get('/api/books/autocomplete/', {'q': 'harv'})
+            self.assertEqual(response.data['results'], [])
+    
+    def test_missing_change_log_triggers_rebuild(self):
+        """Test the index rebuilds when logged changes have expired"""
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .catalog import VERSION_KEY
+        with override_settings(AUTOCOMPLETE_CHECK_INTERVAL=0):
+            self.client.get('/api/books/autocomplete/', {'q': 'ha'})
+            Book.objects.create(title='Hardback Only', author='Author', isbn='9780000000398',
+                                published_date=date(2001, 1, 1), copies_available=1)
+            cache.set(VERSION_KEY, 5, None)  # versions 1-5 were never logged here
+            response = self.client.get('/api/books/autocomplete/', {'q': 'hardb'})
+        self.assertEqual(self.titles(response), ['Hardback Only'])
+
+
+# ==================== ISBN TESTS ====================
+
+class ISBNTest(APITestCase):
+    """Test ISBN normalization, exact lookups and batch lookup"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        # '0-306-40615-2' is the ISBN-10 form of 978-0-306-40615-7
+        self.book = Book.objects.create(title='Seeing Further', author='Author', isbn='0-306-40615-2',
+                                        published_date=date(2010, 1, 1), copies_available=2)
+    
+    def test_normalize(self):
+        """Test every valid form maps to the ISBN-13 and bad checksums are rejected"""
+        from .isbn import InvalidISBN, normalize_isbn
+        self.assertEqual(normalize_isbn('0306406152'), '9780306406157')
+        self.assertEqual(normalize_isbn('978-0-306-40615-7'), '9780306406157')
+        self.assertEqual(normalize_isbn('0-8044-2957-x'), '9780804429573')
+        for bad in ('9780306406158', '0306406153', '12345', 'abcdefghij'):
+            with self.assertRaises(InvalidISBN):
+                normalize_isbn(bad)
+    
+    def test_books_are_stored_as_isbn13(self):
+        """Test saving converts the ISBN to its canonical form"""
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.isbn, '9780306406157')
+    
+    def test_stored_isbns_are_kept_on_later_saves(self):
+        """Test checkouts don't rewrite an ISBN left unconverted because its ISBN-13 is taken"""
+        legacy = Book.objects.create(title='Legacy Copy', author='Author', isbn='9780000000200',
+                                     published_date=date(2010, 1, 1), copies_available=2)
+        # As migration 0014 leaves it: the ISBN-10 form of a book that already exists
+        Book.objects.filter(pk=legacy.pk).update(isbn='0306406152')
+        legacy = Book.objects.get(pk=legacy.pk)
+        legacy.copies_available -= 1
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.isbn, legacy.copies_available), ('0306406152', 1))
+        legacy.isbn = '0-8044-2957-X'
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.isbn, '9780804429573')
+    
+    def test_invalid_isbns_are_kept_as_entered(self):
+        """Test an invalid legacy ISBN keeps its separators and matches as entered"""
+        from .isbn import lookup_key
+        legacy = Book.objects.create(title='Legacy', author='Author', isbn='12-345',
+                                     published_date=date(2010, 1, 1), copies_available=1)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.isbn, '12-345')
+        self.assertEqual(Book.objects.get(isbn=lookup_key(' 12-345 ')), legacy)
+    
+    def test_lookup_endpoint_accepts_any_form(self):
+        """Test /api/books/isbn/<isbn>/ finds the book from an ISBN-10 or 13"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for form in ('0306406152', '978-0-306-40615-7', '9780306406157'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/api/books/isbn/{form}/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['id'], self.book.id)
+            self.assertEqual(len(queries.captured_queries), 1)
+            self.assertIn('"isbn" = ', queries.captured_queries[0]['sql'])
+        response = self.client.get('/api/books/isbn/9780000000002/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_filter_is_exact(self):
+        """Test ?isbn= matches exactly, not as a substring"""
+        response = self.client.get('/api/available-books/', {'isbn': '0-306-40615-2'})
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get('/api/available-books/', {'isbn': '306406'})
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get('/api/available-books/', {'search': '0306406152'})
+        self.assertEqual(response.data['count'], 1)
+    
+    def test_batch_lookup(self):
+        """Test a batch of ISBNs is answered in order with one query"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/books/isbn/batch/',
+                                        {'isbns': ['0306406152', 'not-an-isbn', '9780306406157']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual(response.data['found'], 2)
+        self.assertEqual([row['book']['id'] if row['book'] else None for row in response.data['results']],
+                         [self.book.id, None, self.book.id])
+        response = self.client.post('/api/books/isbn/batch/', {'isbns': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_serializer_rejects_bad_checksum_and_duplicate_forms(self):
+        """Test the API validates checksums and treats ISBN-10/13 forms as one book"""
+        data = {'title': 'T', 'author': 'A', 'published_date': '2020-01-01', 'copies_available': 1}
+        serializer = BookSerializer(data={**data, 'isbn': '9780306406158'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('isbn', serializer.errors)
+        serializer = BookSerializer(data={**data, 'isbn': '978-0-306-40615-7'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('already exists', str(serializer.errors['isbn']))
+        serializer = BookSerializer(data={**data, 'isbn': '0-8044-2957-X'})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['isbn'], '9780804429573')
+
+
+# ==================== DATE RANGE FILTER TESTS ====================
+
+class DateRangeFilterTest(APITestCase):
+    """Test year/date filters compile to index-friendly published_date ranges"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        Book.objects.bulk_create([
+            Book(title=f'Book {i:03d}', author='Author', isbn=f'{i:013d}',
+                 published_date=date(1900 + i % 100, 1 + i % 12, 1), copies_available=i % 3)
+            for i in range(300)
+        ])
+        self.edge_books = [
+            Book.objects.create(title='New Year', author='Edge', isbn='9780000000101',
+                                published_date=date(2000, 1, 1), copies_available=1),
+            Book.objects.create(title='New Year Eve', author='Edge', isbn='9780000000102',
+                                published_date=date(1999, 12, 31), copies_available=1),
+        ]
+    
+    def filtered(self, params, queryset=None):
+        from .views import BookFilter
+        return BookFilter(params, queryset=queryset if queryset is not None else Book.objects.all()).qs
+    
+    def explain(self, queryset):
+        """Query plan, with sequential scans discouraged on Postgres so index eligibility shows"""
+        from django.db import connection, transaction
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+    
+    def test_compile_date_range(self):
+        """Test constraints intersect into one half-open range"""
+        from .date_ranges import EmptyRange, compile_date_range
+        self.assertEqual(compile_date_range(year=1999), (date(1999, 1, 1), date(2000, 1, 1)))
+        self.assertEqual(compile_date_range(year=1999, after=date(1999, 6, 1), before=date(2005, 1, 1)),
+                         (date(1999, 6, 1), date(2000, 1, 1)))
+        self.assertEqual(compile_date_range(before=date(1999, 12, 31)), (None, date(2000, 1, 1)))
+        self.assertEqual(compile_date_range(year=9999), (date(9999, 1, 1), None))
+        self.assertEqual(compile_date_range(), (None, None))
+        self.assertEqual(compile_date_range(decade=1990, year=1995), (date(1995, 1, 1), date(1996, 1, 1)))
+        self.assertEqual(compile_date_range(decade=1990), (date(1990, 1, 1), date(2000, 1, 1)))
+        with self.assertRaises(EmptyRange):
+            compile_date_range(decade=1995)
+        with self.assertRaises(EmptyRange):
+            compile_date_range(year=1999, after=date(2000, 1, 1))
+        with self.assertRaises(EmptyRange):
+            compile_date_range(year=0)
+    
+    def test_year_is_a_range_not_extract(self):
+        """Test year_published compares the bare column and keeps year boundaries right"""
+        queryset = self.filtered({'year_published': '1999'})
+        sql = str(queryset.query).upper()
+        self.assertNotIn('EXTRACT', sql)
+        self.assertNotIn('DJANGO_DATE_EXTRACT', sql)
+        self.assertNotIn('BETWEEN', sql)
+        self.assertIn('"PUBLISHED_DATE" >= ', sql)
+        self.assertIn('"PUBLISHED_DATE" < ', sql)
+        years = {book.published_date.year for book in queryset}
+        self.assertEqual(years, {1999})
+        self.assertIn(self.edge_books[1], queryset)
+        self.assertNotIn(self.edge_books[0], queryset)
+    
+    def test_before_is_inclusive(self):
+        """Test published_before still includes the given day"""
+        queryset = self.filtered({'published_after': '1999-12-31', 'published_before': '1999-12-31'})
+        self.assertEqual(list(queryset), [self.edge_books[1]])
+    
+    def test_contradictory_or_invalid_filters_match_nothing(self):
+        """Test an empty range or impossible year returns no rows without querying errors"""
+        self.assertEqual(self.filtered({'year_published': '1999', 'published_after': '2000-01-01'}).count(), 0)
+        self.assertEqual(self.filtered({'year_published': '0'}).count(), 0)
+        self.assertEqual(self.filtered({'year_published': '1999.5'}).count(), 0)
+        response = self.client.get('/api/available-books/', {'year_published': '12000'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+    
+    def test_year_filter_uses_published_index(self):
+        """Test EXPLAIN shows the year filter seeking book_published_idx"""
+        plan = self.explain(self.filtered({'year_published': '1999'}))
+        self.assertIn('book_published_idx', plan)
+    
+    def test_date_range_uses_published_index(self):
+        """Test EXPLAIN shows after/before seeking book_published_idx"""
+        plan = self.explain(self.filtered({'published_after': '1950-01-01', 'published_before': '1959-12-31'}))
+        self.assertIn('book_published_idx', plan)
+    
+    def test_available_date_range_uses_partial_index(self):
+        """Test available books filtered by year seek the partial index of available books"""
+        queryset = self.filtered({'year_published': '1999'}, Book.objects.filter(copies_available__gt=0))
+        self.assertIn('book_available_published_idx', self.explain(queryset))
+        queryset = self.filtered({'year_published': '1999', 'available': 'true'})
+        self.assertIn('book_available_published_idx', self.explain(queryset))
+    
+    def test_available_listing_walks_title_index(self):
+        """Test the unfiltered available-books page reads in title order from the partial index"""
+        plan = self.explain(Book.objects.filter(copies_available__gt=0))
+        self.assertIn('book_available_title_idx', plan)
+    
+    def test_book_indexes_build_concurrently(self):
+        """Test migration 0015 builds its indexes with CREATE INDEX CONCURRENTLY outside a transaction"""
+        from importlib import import_module
+        from unittest.mock import MagicMock
+        from django.apps import apps
+        from django.db.migrations.state import ProjectState
+        from .migration_operations import AddIndexOnline
+        migration = import_module('library_api.migrations.0015_book_date_indexes').Migration
+        self.assertFalse(migration.atomic)
+        self.assertTrue(all(isinstance(operation, AddIndexOnline) for operation in migration.operations))
+        operation = migration.operations[0]
+        from_state = ProjectState.from_apps(apps)
+        to_state = from_state.clone()
+        schema_editor = MagicMock()
+        schema_editor.connection.vendor = 'postgresql'
+        schema_editor.connection.in_atomic_block = False
+        operation.database_forwards('library_api', schema_editor, from_state, to_state)
+        self.assertEqual(schema_editor.add_index.call_args.kwargs, {'concurrently': True})
+    
+    def test_available_books_endpoint(self):
+        """Test the endpoint applies the year filter on top of availability"""
+        response = self.client.get('/api/available-books/', {'year_published': '1999', 'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = Book.objects.filter(copies_available__gt=0, published_date__year=1999).count()
+        self.assertEqual(response.data['count'], expected)
+        for book in response.data['results']:
+            self.assertTrue(book['published_date'].startswith('1999-'))
+
+
+# ==================== FACET TESTS ====================
+
+class FacetsTest(APITestCase):
+    """Test facet counts on /api/available-books/ and how they are kept current"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from .facets import catalog_facets
+        cache.clear()
+        catalog_facets.reset()
+        self.addCleanup(catalog_facets.reset)
+        self.client = APIClient()
+        self.books = [
+            Book.objects.create(title=title, author=author, isbn=f'97800000004{i:02d}',
+                                published_date=published, copies_available=copies)
+            for i, (title, author, published, copies) in enumerate([
+                ('Emma', 'Jane Austen', date(1815, 12, 23), 2),
+                ('Persuasion', 'Jane Austen', date(1817, 12, 20), 1),
+                ('Sanditon', 'Jane Austen', date(1817, 3, 18), 0),
+                ('Frankenstein', 'Mary Shelley', date(1818, 1, 1), 3),
+                ('Dracula', 'Bram Stoker', date(1897, 5, 26), 1),
+            ])
+        ]
+    
+    def facets(self, **params):
+        response = self.client.get('/api/available-books/', {'facets': '1', **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['facets']
+    
+    def counts(self, facet):
+        return {entry['value']: entry['count'] for entry in facet}
+    
+    def test_unfiltered_facets(self):
+        """Test author, decade and availability counts over the catalog"""
+        facets = self.facets()
+        self.assertEqual(facets['author'][0], {'value': 'Jane Austen', 'count': 2})
+        self.assertEqual(self.counts(facets['author']), {'Jane Austen': 2, 'Mary Shelley': 1, 'Bram Stoker': 1})
+        self.assertEqual(facets['decade'], [{'value': 1810, 'count': 3}, {'value': 1890, 'count': 1}])
+        self.assertEqual(self.counts(facets['availability']), {'available': 4, 'unavailable': 1})
+    
+    def test_facets_are_opt_in(self):
+        """Test plain listings are unchanged"""
+        response = self.client.get('/api/available-books/')
+        self.assertNotIn('facets', response.data)
+    
+    def test_filtered_facets(self):
+        """Test facets follow the listing's filters, including the decade filter"""
+        facets = self.facets(author='austen')
+        self.assertEqual(self.counts(facets['author']), {'Jane Austen': 2})
+        self.assertEqual(self.counts(facets['availability']), {'available': 2, 'unavailable': 1})
+        facets = self.facets(decade='1890')
+        self.assertEqual(self.counts(facets['author']), {'Bram Stoker': 1})
+        self.assertEqual(facets['decade'], [{'value': 1890, 'count': 1}])
+        response = self.client.get('/api/available-books/', {'decade': '1810'})
+        self.assertEqual(response.data['count'], 3)
+    
+    def test_rollup_matches_group_by(self):
+        """Test the in-process rollup agrees with the database aggregate"""
+        from .facets import aggregate_facets
+        catalog = Book.objects.all()
+        self.assertEqual(self.facets(), aggregate_facets(catalog.filter(copies_available__gt=0), catalog))
+    
+    def test_facets_cost_no_extra_queries(self):
+        """Test warm facet requests run the same queries as a plain page"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for params in ({}, {'author': 'austen'}):
+            self.facets(**params)
+            with CaptureQueriesContext(connection) as plain:
+                self.client.get('/api/available-books/', params)
+            with CaptureQueriesContext(connection) as faceted:
+                self.facets(**params)
+            self.assertEqual(len(faceted.captured_queries), len(plain.captured_queries))
+    
+    def test_book_changes_are_applied_incrementally(self):
+        """Test a loan reloads only the changed book into the rollup"""
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        with override_settings(FACETS_CHECK_INTERVAL=0):
+            self.facets()
+            dracula = self.books[4]
+            dracula.copies_available = 0
+            with self.captureOnCommitCallbacks(execute=True):
+                dracula.save()
+            with CaptureQueriesContext(connection) as queries:
+                facets = self.facets()
+            reloads = [query['sql'] for query in queries.captured_queries if ' IN (' in query['sql']]
+            self.assertEqual(len(reloads), 1)
+            self.assertEqual(facets['decade'], [{'value': 1810, 'count': 3}])
+            self.assertNotIn('Bram Stoker', self.counts(facets['author']))
+            self.assertEqual(self.counts(facets['availability']), {'available': 3, 'unavailable': 2})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.books[0].delete()
+            facets = self.facets()
+            self.assertEqual(self.counts(facets['author']), {'Jane Austen': 1, 'Mary Shelley': 1})
+            self.assertEqual(self.counts(facets['availability']), {'available': 2, 'unavailable': 2})
+    
+    def test_loans_that_leave_copies_keep_the_cache(self):
+        """Test only saves that change facet-relevant state bump the catalog version"""
+        from .catalog import catalog_version
+        from .facets import facet_counts
+        self.facets(author='austen')
+        version = catalog_version()
+        emma = Book.objects.get(pk=self.books[0].pk)
+        emma.copies_available -= 1  # 2 -> 1: still on the shelf
+        with self.captureOnCommitCallbacks(execute=True):
+            emma.save()
+        self.assertEqual(catalog_version(), version)
+        with self.assertNumQueries(0):
+            cached = facet_counts(None, None, {'author': 'austen'})
+        self.assertEqual(self.counts(cached['author']), {'Jane Austen': 2})
+        emma.copies_available -= 1  # 1 -> 0: leaves the available listing
+        with self.captureOnCommitCallbacks(execute=True):
+            emma.save()
+        self.assertEqual(catalog_version(), version + 1)
+        self.assertEqual(self.counts(self.facets(author='austen')['author']), {'Jane Austen': 1})
+    
+    def test_facets_reuse_the_listing_filterset(self):
+        """Test ?facets=1 doesn't build and validate a second filterset"""
+        from unittest.mock import patch
+        from .views import BookFilter
+        with patch.object(BookFilter, 'is_valid', autospec=True, side_effect=BookFilter.is_valid) as is_valid:
+            self.facets(author='austen')
+        self.assertEqual(is_valid.call_count, 1)
+    
+    def test_filtered_facets_are_keyed_by_catalog_version(self):
+        """Test cached filtered facets are replaced after a Book change"""
+        self.assertEqual(self.counts(self.facets(author='shelley')['author']), {'Mary Shelley': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='The Last Man', author='Mary Shelley', isbn='9780000000499',
+                                published_date=date(1826, 1, 1), copies_available=1)
+        facets = self.facets(author='shelley')
+        self.assertEqual(self.counts(facets['author']), {'Mary Shelley': 2})
+        self.assertEqual(self.counts(facets['decade']), {1810: 1, 1820: 1})
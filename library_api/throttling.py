@@ -0,0 +1,209 @@
+"""
+Token bucket throttles for the unauthenticated login and password reset endpoints.
+
+Each request takes one token from a bucket per identity (client IP, submitted
+username or email). A bucket holds at most `num` tokens and refills
+continuously at num/period tokens per second, so a client can burst up to
+`num` requests and is then held to the steady rate, with no doubled burst at
+a window boundary.
+
+Every check is a single atomic cache operation, with no lock:
+- Django's Redis backend runs the bucket update as one Lua script (EVALSHA),
+  so the whole check is one round trip.
+- Other shared caches (Memcached, ...) can't update a bucket atomically, so
+  they count requests per fixed `period` window with cache.incr(). That can
+  let a client through twice at a window boundary.
+- A per-process cache (LocMem) would only limit each worker separately
+  anyway, so it uses an in-process bucket directly.
+If the cache is unreachable the throttle falls back to the in-process bucket
+rather than failing open.
+
+Rates live in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] as '<scope>.<identity>',
+e.g. 'login.ip': '30/min'. An identity without a configured rate is not limited.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .tokens import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+REDIS_CACHE = 'django.core.cache.backends.redis.RedisCache'
+
+# spend() as a Redis script: KEYS[1] is a hash of tokens and last update; returns the wait
+BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local rate = capacity / period
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', string.format('%.17g', tokens), 'updated', string.format('%.17g', now))
+redis.call('EXPIRE', KEYS[1], math.ceil(period))
+return string.format('%.17g', wait)
+"""
+
+_local_buckets = {}
+_local_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60); None -> None"""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0].lower()]
+
+
+def spend(state, capacity, period, now):
+    """
+    Refill a bucket for the time since its last update and take one token.
+    state is (tokens, updated at), or None for a full bucket. Returns the new
+    state and the seconds to wait: 0 if a token was taken, otherwise the time
+    until one has refilled.
+    """
+    refill_rate = capacity / period
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+def _take_local(key, capacity, period, now):
+    with _local_lock:
+        entry = _local_buckets.get(key)
+        state, wait = spend(entry[0] if entry else None, capacity, period, now)
+        # An untouched bucket is full again after one period, so it can be forgotten then
+        _local_buckets[key] = (state, now + period)
+        if len(_local_buckets) > 10000:
+            for stale in [k for k, (_, expires) in _local_buckets.items() if expires <= now]:
+                del _local_buckets[stale]
+        return wait
+
+
+def _take_redis(key, capacity, period, now):
+    client = cache._cache.get_client(key, write=True)
+    script = client.register_script(BUCKET_SCRIPT)
+    wait = script(keys=[cache.make_and_validate_key(key)], args=[capacity, period, repr(now)])
+    return float(wait)
+
+
+def _take_windowed(key, capacity, period, now):
+    window = math.floor(now / period)
+    window_key = f'{key}:{window}'
+    try:
+        count = cache.incr(window_key)
+    except ValueError:
+        # First request in this window; add() loses to a concurrent first request
+        if cache.add(window_key, 1, period + 1):
+            count = 1
+        else:
+            count = cache.incr(window_key)
+    if count <= capacity:
+        return 0
+    return (window + 1) * period - now
+
+
+def take_token(key, capacity, period, now=None):
+    """Spend one token from the bucket stored at key; returns 0, or seconds until a token is available"""
+    now = time.time() if now is None else now
+    if cache_is_shared():
+        try:
+            if settings.CACHES['default']['BACKEND'] == REDIS_CACHE:
+                return _take_redis(key, capacity, period, now)
+            return _take_windowed(key, capacity, period, now)
+        except Exception as e:
+            logger.warning(f'Throttle cache unavailable, using local buckets: {str(e)}')
+    return _take_local(key, capacity, period, now)
+
+
+class BucketThrottle(BaseThrottle):
+    """Base class: subclasses set `scope` and implement get_identities()"""
+    scope = None
+
+    def get_identities(self, request):
+        """Return (identity kind, value) pairs to throttle this request on"""
+        return [('ip', self.get_ident(request))]
+
+    def get_rate(self, kind):
+        return parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(f'{self.scope}.{kind}'))
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if request.method in SAFE_METHODS:
+            return True
+
+        now = time.time()
+        allowed = True
+        for kind, value in self.get_identities(request):
+            rate = self.get_rate(kind)
+            if not value or rate is None:
+                continue
+            num, period = rate
+            digest = hashlib.md5(str(value).strip().lower().encode()).hexdigest()
+            wait = take_token(f'throttle:{self.scope}:{kind}:{digest}', num, period, now)
+            if wait:
+                allowed = False
+                self._wait = max(self._wait or 0, wait)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+    def get_request_value(self, request, field):
+        try:
+            value = request.data.get(field)
+        except Exception:
+            # Malformed bodies are rejected by the view itself
+            return None
+        return value if isinstance(value, str) else None
+
+
+class LoginRateThrottle(BucketThrottle):
+    scope = 'login'
+
+    def get_identities(self, request):
+        return [
+            ('ip', self.get_ident(request)),
+            ('username', self.get_request_value(request, 'username_or_email')),
+        ]
+
+
+class PasswordResetRateThrottle(BucketThrottle):
+    scope = 'password_reset'
+
+    def get_identities(self, request):
+        return [
+            ('ip', self.get_ident(request)),
+            ('email', self.get_request_value(request, 'email')),
+        ]
+
+
+class OTPVerifyRateThrottle(BucketThrottle):
+    scope = 'otp_verify'
+
+    def get_identities(self, request):
+        return [
+            ('ip', self.get_ident(request)),
+            ('email', self.get_request_value(request, 'email')),
+        ]
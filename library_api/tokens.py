@@ -0,0 +1,135 @@
+"""
+Cache front for the simplejwt refresh token blacklist.
+
+Blacklisted JTIs are written to the cache whenever a BlacklistedToken row is
+saved (see signals.py) and warmed at startup, so most blacklist checks are a
+single cache lookup instead of a join over the token_blacklist tables.
+
+A miss falls back to the database, so an evicted or cold cache costs a query
+but never lets a blacklisted token through. On a shared cache "not
+blacklisted" answers are cached too, for JWT_BLACKLIST_NEGATIVE_CACHE_TTL
+seconds, so refreshing a valid token doesn't query the blacklist either.
+Blacklisting deletes that entry before writing the blacklisted one, and a
+failure to do so is raised rather than logged, since the stale entry would
+otherwise keep answering "not blacklisted". A per-process cache (LocMem)
+can't be cleared in the other workers, so there only blacklisted JTIs are
+cached and every other check goes to the database.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_CACHE_PREFIX = 'jwt:blacklist:'
+BLACKLISTED = 1
+NOT_BLACKLISTED = 0
+
+# Backends whose contents are private to a single process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _cache_key(jti):
+    return f'{BLACKLIST_CACHE_PREFIX}{jti}'
+
+
+def _seconds_until(expires_at):
+    return max(int((expires_at - timezone.now()).total_seconds()), 1)
+
+
+def cache_is_shared():
+    """True when the default cache is visible to every worker process"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend not in PROCESS_LOCAL_CACHES
+
+
+def mark_jti_blacklisted(jti, expires_at):
+    """
+    Record a blacklisted JTI until the token would have expired anyway.
+
+    On a shared cache a cached "not blacklisted" answer is deleted first, and
+    cache errors are raised: the caller must not treat the token as revoked
+    while other workers may still be told it isn't.
+    """
+    key = _cache_key(jti)
+    if not cache_is_shared():
+        try:
+            cache.set(key, BLACKLISTED, timeout=_seconds_until(expires_at))
+        except Exception as e:
+            logger.warning(f'Could not cache blacklisted token {jti}: {str(e)}')
+        return
+    try:
+        cache.delete(key)
+        cache.set(key, BLACKLISTED, timeout=_seconds_until(expires_at))
+    except Exception as e:
+        logger.error(f'Could not clear the cached blacklist state of token {jti}: {str(e)}')
+        raise
+
+
+def is_jti_blacklisted(jti):
+    """
+    Check the blacklist, consulting the cache before the database.
+
+    A cache hit for a blacklisted JTI is authoritative. Anything else is
+    resolved against the database and the answer cached for next time.
+    """
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    key = _cache_key(jti)
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached == BLACKLISTED:
+        return True
+    if cached == NOT_BLACKLISTED:
+        return False
+
+    row = BlacklistedToken.objects.filter(token__jti=jti).values_list('token__expires_at', flat=True).first()
+    if row is not None:
+        mark_jti_blacklisted(jti, row)
+        return True
+
+    if cache_is_shared():
+        # add() never overwrites, so a concurrent blacklist write always wins
+        try:
+            cache.add(key, NOT_BLACKLISTED, timeout=getattr(settings, 'JWT_BLACKLIST_NEGATIVE_CACHE_TTL', 60))
+        except Exception:
+            pass
+    return False
+
+
+def warm_blacklist_cache(batch_size=1000):
+    """Load every unexpired blacklisted JTI into the cache; returns the count"""
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    rows = BlacklistedToken.objects.filter(
+        token__expires_at__gt=timezone.now()
+    ).values_list('token__jti', 'token__expires_at')
+
+    warmed = 0
+    for jti, expires_at in rows.iterator(chunk_size=batch_size):
+        try:
+            mark_jti_blacklisted(jti, expires_at)
+        except Exception:
+            break  # logged; checks fall back to the database
+        warmed += 1
+    return warmed
+
+
+class CachedRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check goes through the cache front"""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if is_jti_blacklisted(jti):
+            raise TokenError(_('Token is blacklisted'))
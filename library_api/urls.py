@@ -2,7 +2,7 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from .views import  (
-    home, profile_view, OverdueBooksView, MyBooksView, TransactionHistoryView, CurrentUserProfileView, BookListCreateView, BookDetailView, UserProfileDetailView, UserProfileListCreateView, ReturnBookview, AvailableBooksView, CheckOutBookView, UserRegistrationView, UserLoginView, UserLogoutView, MyTokenObtainPairView, PasswordResetRequestView, PasswordResetConfirmView, PasswordResetOTPRequestView, PasswordResetOTPVerifyView
+    home, profile_view, OverdueBooksView, MyBooksView, TransactionHistoryView, CurrentUserProfileView, BookListCreateView, BookAutocompleteView, BookISBNView, BookISBNBatchView, BookDetailView, UserProfileDetailView, UserProfileListCreateView, MemberDirectoryView, ReturnBookview, AvailableBooksView, CheckOutBookView, UserRegistrationView, UserLoginView, UserLogoutView, MyTokenObtainPairView, PasswordResetRequestView, PasswordResetConfirmView, PasswordResetOTPRequestView, PasswordResetOTPVerifyView
  )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -17,6 +17,9 @@ urlpatterns = [
     path('profile/', profile_view, name='profile'),
     path('home/', home, name='home'),
     path('books/', BookListCreateView.as_view(), name='book-list-create'),
+    path('books/autocomplete/', BookAutocompleteView.as_view(), name='book-autocomplete'),
+    path('books/isbn/batch/', BookISBNBatchView.as_view(), name='book-isbn-batch'),
+    path('books/isbn/<str:isbn>/', BookISBNView.as_view(), name='book-isbn'),
     path('books/<int:pk>/', BookDetailView.as_view(), name='book-detail'),
     # OTP-based password reset (NEW - SIMPLER APPROACH)
     path('password-reset-otp/', PasswordResetOTPRequestView.as_view(), name='password-reset-otp-request'),
@@ -26,6 +29,7 @@ urlpatterns = [
     path('password-reset-confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
     path('users/', UserProfileListCreateView.as_view(), name='user-list-create'),
     path('users/<int:pk>/', UserProfileDetailView.as_view(), name='user-detail'),
+    path('members/', MemberDirectoryView.as_view(), name='member-directory'),
     path('checkout/', CheckOutBookView.as_view(), name='checkout-book'),
     path('return/<int:pk>/', ReturnBookview.as_view(), name='return-book'),
     path('available-books/', AvailableBooksView.as_view(), name='available-books'),
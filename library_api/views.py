@@ -2,22 +2,29 @@ from rest_framework import filters, permissions, generics, serializers, status
 from rest_framework.views import APIView
 from django_filters import rest_framework as filters
 from .models import Book, Transaction, UserProfile
-from .serializers import BookSerializer, TransactionSerializer, UserProfileSerializer, UserRegistrationSerializer, UserLoginSerializer, TokenObtainPairSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, PasswordResetOTPRequestSerializer, PasswordResetOTPVerifySerializer
+from .serializers import parse_field_list, BookSerializer, TransactionSerializer, UserProfileSerializer, UserRegistrationSerializer, UserLoginSerializer, TokenObtainPairSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, PasswordResetOTPRequestSerializer, PasswordResetOTPVerifySerializer
 from .permissions import IsAdminUser, IsMemberUser, CanDeleteBook, CanViewBook, IsAdminOrMember
+from .throttling import LoginRateThrottle, PasswordResetRateThrottle, OTPVerifyRateThrottle
 from django.shortcuts import render
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import timedelta
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, SAFE_METHODS
 from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from .tokens import CachedRefreshToken
+from .db_routers import ReplicaReadMixin
+from .pagination import FastCountPageNumberPagination
+from .isbn import InvalidISBN, lookup_key, normalize_isbn
+from .date_ranges import EmptyRange, compile_date_range, filter_date_range
+from .facets import facet_counts
 from django.conf import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(FastCountPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -31,7 +38,109 @@ class MyCursorPagination(CursorPagination):
     page_size = 10
     ordering = 'published_date'
 
-class BookListCreateView(generics.ListCreateAPIView):
+class MemberCursorPagination(CursorPagination):
+    """Keyset pagination: each page is an index range scan, however deep the client pages"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+class SparseFieldsetMixin:
+    """
+    ?fields=title,due_date and ?omit=book.isbn on reads. The selection is handed to
+    the serializer (see SparseFieldsMixin) and narrows the query with .only(), so
+    unselected columns are neither fetched nor serialized. Related objects whose
+    fields aren't selected are no longer joined.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        request = getattr(self, 'request', None)
+        if request is not None and request.method in SAFE_METHODS:
+            context['fields'] = parse_field_list(request.query_params.get('fields'))
+            context['omit'] = parse_field_list(request.query_params.get('omit'))
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        context = self.get_serializer_context()
+        if not (context.get('fields') or context.get('omit')):
+            return queryset
+        paths = self.get_serializer_class()(context=context).only_fields()
+        if paths is None:
+            return queryset
+
+        select_related = queryset.query.select_related
+        joined = set()
+        if isinstance(select_related, dict):
+            joined = {relation for relation in select_related if relation in paths}
+            queryset = queryset.select_related(None)
+            if joined:
+                queryset = queryset.select_related(*joined)
+        # Columns of a related model can only be limited when it is joined
+        paths = [path for path in paths if '__' not in path or path.split('__', 1)[0] in joined]
+        return queryset.only(*paths)
+
+class SideloadMixin:
+    """
+    ?compact=1 on list views: each row carries related ids (e.g. `book: 12`) and
+    the response gains `included`, e.g. {'books': {'12': {...}}}, with every
+    related object serialized once and fetched in one in_bulk() query instead
+    of being joined and repeated on every row.
+
+    sideload maps a serializer field to the `included` key it is collected under.
+    """
+    sideload = {}
+
+    def is_compact(self):
+        request = getattr(self, 'request', None)
+        return (
+            request is not None and request.method in SAFE_METHODS
+            and request.query_params.get('compact', '').lower() in ('1', 'true', 'yes')
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.is_compact():
+            context['sideload'] = set(self.sideload)
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        select_related = queryset.query.select_related
+        if self.is_compact() and isinstance(select_related, dict):
+            kept = [relation for relation in select_related if relation not in self.sideload]
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*kept)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not self.is_compact() or response.status_code != status.HTTP_200_OK:
+            return response
+        paginated = isinstance(response.data, dict)
+        rows = response.data['results'] if paginated else response.data
+        root = self.get_serializer()
+        included = {}
+        for name, key in self.sideload.items():
+            nested_class = root.nested_serializers[name]
+            context = root.nested_context(name)
+            ids = {row[name] for row in rows if row.get(name) is not None}
+            queryset = nested_class.Meta.model.objects.all()
+            columns = nested_class(context=context).only_fields()
+            if columns:
+                queryset = queryset.only(*columns)
+            objects = queryset.in_bulk(ids) if ids else {}
+            data = nested_class(list(objects.values()), many=True, context=context).data
+            included[key] = {str(pk): item for pk, item in zip(objects, data)}
+        if paginated:
+            response.data['included'] = included
+        else:
+            response.data = {'results': rows, 'included': included}
+        return response
+
+class BookListCreateView(ReplicaReadMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     serializer_class = BookSerializer
     permission_classes = [CanViewBook]
     pagination_class = StandardResultsSetPagination
@@ -40,7 +149,59 @@ class BookListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         return Book.objects.all().order_by('title', 'author')
 
-class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BookAutocompleteView(APIView):
+    """Typeahead suggestions for ?q=, answered from the in-process index (no query per keystroke)"""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        from .autocomplete import index
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 25)
+        except ValueError:
+            limit = 10
+        if len(query) < getattr(settings, 'AUTOCOMPLETE_MIN_CHARS', 2):
+            return Response({'query': query, 'results': []})
+        return Response({'query': query, 'results': index.suggest(query, limit)})
+
+class BookISBNView(ReplicaReadMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
+    """A book by any form of its ISBN (ISBN-10 or 13, hyphens optional)"""
+    serializer_class = BookSerializer
+    permission_classes = [CanViewBook]
+    queryset = Book.objects.all()
+
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        book = generics.get_object_or_404(queryset, isbn=lookup_key(self.kwargs['isbn']))
+        self.check_object_permissions(self.request, book)
+        return book
+
+class BookISBNBatchView(generics.GenericAPIView):
+    """POST {"isbns": [...]}: look up to ISBN_BATCH_LIMIT ISBNs with one query"""
+    serializer_class = BookSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        isbns = request.data.get('isbns')
+        if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+            return Response({'error': 'isbns must be a list of strings'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = getattr(settings, 'ISBN_BATCH_LIMIT', 100)
+        if len(isbns) > limit:
+            return Response({'error': f'At most {limit} ISBNs per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        keys = [lookup_key(isbn) for isbn in isbns]
+        books = {book.isbn: book for book in Book.objects.filter(isbn__in=set(keys))}
+        results = []
+        for isbn, key in zip(isbns, keys):
+            book = books.get(key)
+            results.append({
+                'isbn': isbn,
+                'normalized': key,
+                'book': self.get_serializer(book).data if book is not None else None,
+            })
+        return Response({'found': sum(1 for row in results if row['book'] is not None), 'results': results})
+
+class BookDetailView(ReplicaReadMixin, SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = BookSerializer
     permission_classes = [CanViewBook]
     
@@ -86,8 +247,9 @@ class UserRegistrationView(generics.CreateAPIView):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserProfileListCreateView(generics.ListCreateAPIView):
-    queryset = UserProfile.objects.all().order_by('user')
+class UserProfileListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
+    # The serializer reads user.username and user.email
+    queryset = UserProfile.objects.select_related('user').order_by('user')
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
 
@@ -96,7 +258,7 @@ class UserProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrMember]
 
-class CheckOutBookView(generics.CreateAPIView):
+class CheckOutBookView(ReplicaReadMixin, generics.CreateAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrMember]
 
@@ -134,7 +296,7 @@ class CheckOutBookView(generics.CreateAPIView):
         else:
             raise serializers.ValidationError('No copies available for checkout')
 
-class ReturnBookview(generics.UpdateAPIView):
+class ReturnBookview(ReplicaReadMixin, generics.UpdateAPIView):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrMember]
@@ -153,8 +315,9 @@ class ReturnBookview(generics.UpdateAPIView):
         transaction.calculate_penalty()
         serializer.save()
 
-class MyBooksView(generics.ListAPIView):
+class MyBooksView(ReplicaReadMixin, SparseFieldsetMixin, SideloadMixin, generics.ListAPIView):
     serializer_class = TransactionSerializer
+    sideload = {'book': 'books'}
     permission_classes = [permissions.IsAuthenticated, IsAdminOrMember]
     pagination_class = StandardResultsSetPagination
     
@@ -164,8 +327,9 @@ class MyBooksView(generics.ListAPIView):
             user=self.request.user
         ).select_related('book').order_by('-checkout_date')
 
-class TransactionHistoryView(generics.ListAPIView):
+class TransactionHistoryView(ReplicaReadMixin, SparseFieldsetMixin, SideloadMixin, generics.ListAPIView):
     serializer_class = TransactionSerializer
+    sideload = {'book': 'books'}
     permission_classes = [permissions.IsAuthenticated, IsAdminOrMember]
     pagination_class = StandardResultsSetPagination
     
@@ -181,28 +345,68 @@ class CurrentUserProfileView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user.userprofile
 
-class OverdueBooksView(generics.ListAPIView):
+class OverdueBooksView(ReplicaReadMixin, SparseFieldsetMixin, SideloadMixin, generics.ListAPIView):
     serializer_class = TransactionSerializer
+    sideload = {'book': 'books'}
     permission_classes = [permissions.IsAuthenticated, IsAdminOrMember]
     pagination_class = StandardResultsSetPagination
     
     def get_queryset(self):
         return Transaction.objects.filter(return_date__isnull=True, due_date__lt=timezone.now().date(), user=self.request.user)
 
+class RetainedFilterBackend(filters.DjangoFilterBackend):
+    """DjangoFilterBackend that leaves the bound filterset on the view as `view.filterset`"""
+
+    def get_filterset(self, request, queryset, view):
+        filterset = super().get_filterset(request, queryset, view)
+        view.filterset = filterset
+        return filterset
+
 class BookFilter(filters.FilterSet):
     title = filters.CharFilter(field_name='title', lookup_expr='icontains')
     author = filters.CharFilter(field_name='author', lookup_expr='icontains')
-    isbn = filters.CharFilter(field_name='isbn', lookup_expr='icontains')
+    isbn = filters.CharFilter(method='filter_isbn', label='ISBN')
     search = filters.CharFilter(method='filter_search', label='Search')
     available = filters.BooleanFilter(field_name='copies_available', lookup_expr='gt', method='filter_available')
     published_after = filters.DateFilter(field_name='published_date', lookup_expr='gte')
     published_before = filters.DateFilter(field_name='published_date', lookup_expr='lte')
     year_published = filters.NumberFilter(field_name='published_date', lookup_expr='year')
+    decade = filters.NumberFilter(field_name='published_date', label='Decade (e.g. 1990)')
+
+    # Applied together as one published_date range (see date_ranges.py), not one lookup each
+    DATE_RANGE_FILTERS = ('year_published', 'decade', 'published_after', 'published_before')
+
+    def filter_queryset(self, queryset):
+        data = self.form.cleaned_data
+        for name, value in data.items():
+            if name not in self.DATE_RANGE_FILTERS:
+                queryset = self.filters[name].filter(queryset, value)
+        try:
+            lower, upper = compile_date_range(
+                year=data.get('year_published'),
+                decade=data.get('decade'),
+                after=data.get('published_after'),
+                before=data.get('published_before'),
+            )
+        except EmptyRange:
+            return queryset.none()
+        return filter_date_range(queryset, 'published_date', lower, upper)
+
+    def filter_isbn(self, queryset, name, value):
+        """Exact match on the canonical ISBN-13, whichever form was entered (unique index seek)"""
+        if not value:
+            return queryset
+        return queryset.filter(isbn=lookup_key(value))
 
     def filter_search(self, queryset, name, value):
         """Unified search across title, author, and ISBN"""
         if not value:
             return queryset
+        try:
+            # A scanned or typed full ISBN: seek, don't scan
+            return queryset.filter(isbn=normalize_isbn(value))
+        except InvalidISBN:
+            pass
         from django.db.models import Q
         return queryset.filter(
             Q(title__icontains=value) |
@@ -221,13 +425,44 @@ class BookFilter(filters.FilterSet):
 
     class Meta:
         model = Book
-        fields = ['title', 'author', 'isbn', 'search', 'available', 'published_after', 'published_before', 'year_published']
+        fields = ['title', 'author', 'isbn', 'search', 'available', 'published_after', 'published_before', 'year_published', 'decade']
+
+class MemberFilter(filters.FilterSet):
+    # CharFilter rather than ChoiceFilter, which django-filter 23.2 can't build on Django 5.0
+    role = filters.CharFilter(field_name='role')
+    active = filters.BooleanFilter(field_name='active_status')
+    joined_after = filters.DateFilter(field_name='date_of_membership', lookup_expr='gte')
+    joined_before = filters.DateFilter(field_name='date_of_membership', lookup_expr='lte')
+    search = filters.CharFilter(method='filter_search', label='Search')
 
-class AvailableBooksView(generics.ListAPIView):
+    def filter_search(self, queryset, name, value):
+        """Username or email fragment; trigram-indexed on Postgres (migration 0013)"""
+        value = value.strip()
+        if not value:
+            return queryset
+        from django.db.models import Q
+        return queryset.filter(Q(user__username__icontains=value) | Q(user__email__icontains=value))
+
+    class Meta:
+        model = UserProfile
+        fields = ['role', 'active', 'joined_after', 'joined_before', 'search']
+
+class MemberDirectoryView(ReplicaReadMixin, generics.ListAPIView):
+    """Admin member lookup: filter by role, status and join date, search by username or email"""
+    serializer_class = UserProfileSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    pagination_class = MemberCursorPagination
+    filter_backends = (filters.DjangoFilterBackend,)
+    filterset_class = MemberFilter
+
+    def get_queryset(self):
+        return UserProfile.objects.select_related('user')
+
+class AvailableBooksView(ReplicaReadMixin, SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = BookSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = StandardResultsSetPagination
-    filter_backends = (filters.DjangoFilterBackend,)
+    filter_backends = (RetainedFilterBackend,)
     filterset_class = BookFilter
 
     def get_queryset(self):
@@ -243,9 +478,23 @@ class AvailableBooksView(generics.ListAPIView):
             except:
                 return []
     
+    def wants_facets(self):
+        return self.request.query_params.get('facets', '').lower() in ('1', 'true', 'yes')
+
+    def get_facets(self):
+        """Facet counts for the filters in the request (see facets.py)"""
+        # The filterset the listing was filtered with, already validated
+        filterset = self.filterset
+        params = {name: value for name, value in filterset.form.cleaned_data.items() if value not in (None, '')}
+        catalog = filterset.filter_queryset(Book.objects.all())
+        return facet_counts(filterset.qs, catalog, params)
+
     def list(self, request, *args, **kwargs):
         try:
-            return super().list(request, *args, **kwargs)
+            response = super().list(request, *args, **kwargs)
+            if self.wants_facets() and response.status_code == status.HTTP_200_OK and isinstance(response.data, dict):
+                response.data['facets'] = self.get_facets()
+            return response
         except Exception as e:
             logger.error(f"Error in AvailableBooksView.list: {str(e)}")
             import traceback
@@ -259,6 +508,7 @@ class AvailableBooksView(generics.ListAPIView):
 class UserLoginView(generics.GenericAPIView):
     serializer_class = UserLoginSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
   
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -290,7 +540,7 @@ class UserLogoutView(APIView):
             if not refresh_token:
                 return Response({'error': 'Refresh token is required'}, status=status.HTTP_400_BAD_REQUEST)
             
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
 
             logger.info(f'Token blacklisted successfully for user: {request.user.username}')
@@ -318,13 +568,15 @@ class MyTokenObtainPairView(TokenObtainPairView):
 class PasswordResetRequestView(generics.GenericAPIView):
     serializer_class = PasswordResetRequestSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [PasswordResetRateThrottle]
 
     def post(self, request, *args, **kwargs):
-        # Log request data for debugging
-        logger.info(f'Password reset request received')
-        logger.info(f'Request data type: {type(request.data)}')
-        logger.info(f'Request data: {request.data}')
-        logger.info(f'Request MIME type: {request.content_type}')
+        # Request payload details are DEBUG only: they contain the address and are
+        # too chatty for INFO on a public, unauthenticated endpoint
+        logger.info('Password reset request received')
+        logger.debug(f'Request data type: {type(request.data)}')
+        logger.debug(f'Request data: {request.data}')
+        logger.debug(f'Request MIME type: {request.content_type}')
         
         # Extract email directly from request.data (DRF already parsed the body)
         # NOTE: Cannot read request.body after request.data has been accessed
@@ -342,8 +594,7 @@ class PasswordResetRequestView(generics.GenericAPIView):
                 # Try to access as attribute
                 email_raw = getattr(request.data, 'email', None)
             
-            logger.info(f'Extracted email from request.data: {repr(email_raw)}, type: {type(email_raw)}')
-            logger.info(f'Full request.data: {request.data}')
+            logger.debug(f'Extracted email from request.data: {repr(email_raw)}, type: {type(email_raw)}')
             
         except Exception as e:
             logger.error(f'Error extracting email from request: {str(e)}')
@@ -410,8 +661,8 @@ class PasswordResetRequestView(generics.GenericAPIView):
         
         # Normalize email (lowercase) but preserve the original for logging
         email_normalized = email.lower().strip()
-        logger.info(f'Processing password reset for: {repr(email_normalized)} (original: {repr(email)})')
-        logger.info(f'Email parts - local: {parts[0]}, domain: {parts[1]}')
+        logger.debug(f'Processing password reset for: {repr(email_normalized)} (original: {repr(email)})')
+        logger.debug(f'Email parts - local: {parts[0]}, domain: {parts[1]}')
         
         # Call serializer's save method directly with validated email
         # Create a minimal serializer instance and manually set validated_data
@@ -560,6 +811,7 @@ class PasswordResetOTPRequestView(generics.GenericAPIView):
     """Request OTP code for password reset - simpler approach"""
     serializer_class = PasswordResetOTPRequestSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [PasswordResetRateThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -623,6 +875,7 @@ class PasswordResetOTPVerifyView(generics.GenericAPIView):
     """Verify OTP code and reset password"""
     serializer_class = PasswordResetOTPVerifySerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPVerifyRateThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
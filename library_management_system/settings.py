@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
+import json
 import os
 
 load_dotenv()
@@ -107,18 +108,52 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library_api.middleware.InstrumentationMiddleware',  # first, so latency covers the whole stack
+    'library_api.middleware.RequestIdMiddleware',
+    # Early in the list so it compresses the final body on the way out
+    'library_api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'library_api.middleware.SecurityHeadersMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # The Lean* wrappers skip sessions, CSRF, auth and messages for stateless
+    # JWT requests under LEAN_API_PREFIXES; admin and docs still get them
+    'library_api.middleware.LeanSessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library_api.middleware.LeanCsrfViewMiddleware',
+    'library_api.middleware.LeanAuthenticationMiddleware',
+    'library_api.middleware.LeanMessageMiddleware',
+    # X-Frame-Options is part of the SecurityHeadersMiddleware bundle, so
+    # XFrameOptionsMiddleware is not needed
 ]
 
+# Response compression: zstd or brotli when the zstandard/brotli packages are installed,
+# gzip otherwise. Bodies smaller than COMPRESSION_MIN_SIZE bytes go out as-is. Only the
+# stateless API under LEAN_API_PREFIXES is compressed: admin, docs and other session pages
+# carry CSRF tokens, and endpoints that return tokens or echo credentials are excluded
+# too (BREACH). HTML is never compressed here.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_CONTENT_TYPES = (
+    'application/json',
+    'text/csv',
+)
+COMPRESSION_EXCLUDE_PREFIXES = [
+    '/api/login/',
+    '/api/logout/',
+    '/api/register/',
+    '/api/token/',
+    '/api/password-reset',
+    '/api/my-profile/',
+]
+
+# Paths served without session/CSRF/auth/messages middleware. The API authenticates
+# with JWT; DRF's SessionAuthentication is inert on these paths. Set
+# LEAN_API_PREFIXES to an empty string to run the full stack everywhere.
+LEAN_API_PREFIXES = [p.strip() for p in os.getenv('LEAN_API_PREFIXES', '/api/').split(',') if p.strip()]
+# Template views under /api/ that still render for the logged-in session user
+LEAN_API_EXEMPT_PREFIXES = ['/api/schema/', '/api/profile/', '/api/home/']
+
 ROOT_URLCONF = 'library_management_system.urls'
 
 TEMPLATES = [
@@ -154,10 +189,66 @@ DATABASES = {
         'OPTIONS': {
             'connect_timeout': 10,
         },
-        'CONN_MAX_AGE': 600,  # Keep connections alive for 10 minutes
+        # Reuse a worker's connection for up to DB_CONN_MAX_AGE seconds, checking it is
+        # still usable before the first query of each request (catches failovers)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Connection pooling. DB_POOL_MODE picks how workers share Postgres connections:
+#   persistent - one long-lived connection per worker thread (the default)
+#   pgbouncer  - DB_HOST/DB_PORT point at PgBouncer in transaction mode, so Postgres
+#                sees PgBouncer's pool size rather than one connection per worker.
+#                Server-side cursors and prepared statements don't survive a
+#                connection being handed to another client between transactions.
+#   native     - psycopg's in-process pool (Django 5.1+, needs psycopg[pool]); this
+#                still holds connections per worker process, so only pgbouncer
+#                decouples the worker count from Postgres connections.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'persistent').lower()
+if DB_POOL_MODE == 'pgbouncer':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+elif DB_POOL_MODE == 'native':
+    import django
+    if django.VERSION >= (5, 1):
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool owns connection lifetimes
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+    else:
+        import warnings
+        warnings.warn(
+            f'DB_POOL_MODE=native needs Django 5.1 or later (running {django.get_version()}); '
+            'falling back to persistent connections'
+        )
+        DB_POOL_MODE = 'persistent'
+elif DB_POOL_MODE != 'persistent':
+    raise ValueError(f'Unknown DB_POOL_MODE {DB_POOL_MODE!r}; use persistent, pgbouncer or native')
+
+# Read replicas: DB_REPLICA_HOSTS=replica1.internal,replica2.internal adds one alias per
+# host with the primary's name and credentials. Safe requests on the list/report views
+# read from a random replica; a user who just wrote stays on the primary for
+# REPLICA_STICKY_SECONDS so they see their own checkout or return. That pin lives in the
+# cache, so replica reads are only used with a shared one (REDIS_URL).
+DATABASE_REPLICAS = []
+for _index, _host in enumerate([h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()], start=1):
+    DATABASES[f'replica_{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in DATABASES['default']['OPTIONS'].items()
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+DATABASE_ROUTERS = ['library_api.db_routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '15'))
+
 # Validate database configuration in production
 if not DEBUG:
     db_config = DATABASES['default']
@@ -181,6 +272,31 @@ if not DEBUG:
     logger.info(f"Database configured: {db_config['NAME']}@{db_config['HOST']}:{db_config['PORT']} (user: {db_config['USER']})")
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Set REDIS_URL to share the cache between workers (requires the `redis` package);
+# otherwise each worker process keeps its own in-memory cache.
+
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'library-default',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -201,6 +317,54 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Authentication backends
+# Login accepts a username or an email; the backend resolves either (plus the
+# user's profile) in a single query.
+
+AUTHENTICATION_BACKENDS = [
+    'library_api.backends.UsernameOrEmailBackend',
+]
+
+
+# Password hashing
+# PASSWORD_HASHER picks the algorithm used for new hashes: pbkdf2 (default), scrypt
+# or argon2 (requires argon2-cffi). The cost parameters below are read by the hashers in
+# library_api/hashers.py; changing any of them rehashes passwords on the next login.
+# Use `python manage.py bench_hashers` to measure hashes per second per core.
+
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2').strip().lower()
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '720000'))
+SCRYPT_WORK_FACTOR = int(os.getenv('SCRYPT_WORK_FACTOR', str(2 ** 14)))
+SCRYPT_BLOCK_SIZE = int(os.getenv('SCRYPT_BLOCK_SIZE', '8'))
+SCRYPT_PARALLELISM = int(os.getenv('SCRYPT_PARALLELISM', '1'))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '102400'))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '8'))
+
+_password_hashers = {
+    'pbkdf2': 'library_api.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'library_api.hashers.TunedScryptPasswordHasher',
+    'argon2': 'library_api.hashers.TunedArgon2PasswordHasher',
+}
+if PASSWORD_HASHER not in _password_hashers:
+    raise ValueError(f"PASSWORD_HASHER must be one of: {', '.join(_password_hashers)}")
+
+if PASSWORD_HASHER == 'argon2':
+    import importlib.util
+    if importlib.util.find_spec('argon2') is None:
+        import warnings
+        warnings.warn(
+            "PASSWORD_HASHER=argon2 requires the argon2-cffi package. Falling back to scrypt.",
+            UserWarning
+        )
+        PASSWORD_HASHER = 'scrypt'
+
+# Preferred hasher first; the rest stay listed so existing hashes still verify
+PASSWORD_HASHERS = [_password_hashers[PASSWORD_HASHER]] + [
+    path for name, path in _password_hashers.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -220,8 +384,19 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 #Security Headers
 X_FRAME_OPTIONS = "SAMEORIGIN"
-SECURE_CONTENT_TYPE_NOSNIFF = True
-SECURE_REFERRER_POLICY = "same-origin"
+
+# Header policy for library_api.middleware.SecurityHeadersMiddleware, merged over its
+# defaults and compiled once at startup. Keys: PERMISSIONS_POLICY (list of features),
+# CSP (directive -> sources), HEADERS (name -> value, empty to drop) and ROUTES
+# (path prefix -> the same keys). Example:
+# SECURITY_HEADERS_JSON='{"ROUTES": {"/admin": {"HEADERS": {"X-Frame-Options": "SAMEORIGIN"}}}}'
+SECURITY_HEADERS = json.loads(os.getenv('SECURITY_HEADERS_JSON', '') or '{}')
+# X-Content-Type-Options and Referrer-Policy come from that bundle; SecurityMiddleware
+# is left to HSTS, SSL redirects and COOP so no header is set twice
+SECURE_CONTENT_TYPE_NOSNIFF = False
+SECURE_REFERRER_POLICY = None
+# `check --deploy` can't see the bundle; these are its warnings about the two settings above
+SILENCED_SYSTEM_CHECKS = ['security.W006', 'security.W022']
 
 # Additional directories for static files (only if they exist)
 STATICFILES_DIRS = []
@@ -250,8 +425,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS':
-    'rest_framework.pagination.LimitOffsetPagination',
+    'library_api.pagination.FastCountLimitOffsetPagination',
     'PAGE_SIZE': 100, #I have set the Limit Offset Pagination to 100 you never know
+    # orjson-backed JSON when the package is installed, DRF's stdlib JSON otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'library_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'library_api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': ( 
         'rest_framework.authentication.BasicAuthentication', 
         'rest_framework.authentication.SessionAuthentication',
@@ -264,8 +449,45 @@ REST_FRAMEWORK = {
     
     # Custom exception handler to return JSON instead of HTML
     'EXCEPTION_HANDLER': 'library_api.exceptions.custom_exception_handler',
+
+    # Token bucket rates for library_api.throttling ('<scope>.<identity>': 'num/period')
+    'DEFAULT_THROTTLE_RATES': {
+        'login.ip': os.getenv('THROTTLE_LOGIN_IP', '30/min'),
+        'login.username': os.getenv('THROTTLE_LOGIN_USERNAME', '10/min'),
+        'password_reset.ip': os.getenv('THROTTLE_PASSWORD_RESET_IP', '20/hour'),
+        'password_reset.email': os.getenv('THROTTLE_PASSWORD_RESET_EMAIL', '5/hour'),
+        'otp_verify.ip': os.getenv('THROTTLE_OTP_VERIFY_IP', '30/hour'),
+        'otp_verify.email': os.getenv('THROTTLE_OTP_VERIFY_EMAIL', '10/hour'),
+    },
 } 
 
+# List counts (library_api.pagination): unfiltered tables past the threshold report the
+# Postgres row estimate; large exact counts are cached per query for a few minutes.
+PAGINATION_ESTIMATE_THRESHOLD = int(os.getenv('PAGINATION_ESTIMATE_THRESHOLD', '100000'))
+PAGINATION_COUNT_CACHE_MIN = int(os.getenv('PAGINATION_COUNT_CACHE_MIN', '1000'))
+PAGINATION_COUNT_CACHE_SECONDS = int(os.getenv('PAGINATION_COUNT_CACHE_SECONDS', '300'))
+
+# Typeahead index (library_api.autocomplete), one per worker. It checks the catalog
+# version at most every AUTOCOMPLETE_CHECK_INTERVAL seconds and is rebuilt from the
+# Book table at least every AUTOCOMPLETE_MAX_AGE seconds.
+AUTOCOMPLETE_MIN_CHARS = int(os.getenv('AUTOCOMPLETE_MIN_CHARS', '2'))
+AUTOCOMPLETE_CHECK_INTERVAL = float(os.getenv('AUTOCOMPLETE_CHECK_INTERVAL', '1.0'))
+AUTOCOMPLETE_MAX_AGE = int(os.getenv('AUTOCOMPLETE_MAX_AGE', '300'))
+AUTOCOMPLETE_MAX_CHANGES = int(os.getenv('AUTOCOMPLETE_MAX_CHANGES', '500'))
+AUTOCOMPLETE_MAX_CANDIDATES = int(os.getenv('AUTOCOMPLETE_MAX_CANDIDATES', '500'))
+
+# ?facets=1 on /api/available-books/ (library_api.facets). Unfiltered counts come from a
+# per-worker rollup checked against the catalog version at most every FACETS_CHECK_INTERVAL
+# seconds; filtered counts are cached per catalog version for FACETS_CACHE_SECONDS.
+FACETS_AUTHOR_LIMIT = int(os.getenv('FACETS_AUTHOR_LIMIT', '20'))
+FACETS_CHECK_INTERVAL = float(os.getenv('FACETS_CHECK_INTERVAL', '1.0'))
+FACETS_MAX_AGE = int(os.getenv('FACETS_MAX_AGE', '300'))
+FACETS_MAX_CHANGES = int(os.getenv('FACETS_MAX_CHANGES', '500'))
+FACETS_CACHE_SECONDS = int(os.getenv('FACETS_CACHE_SECONDS', '300'))
+
+# Most ISBNs accepted by one POST /api/books/isbn/batch/
+ISBN_BATCH_LIMIT = int(os.getenv('ISBN_BATCH_LIMIT', '100'))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60 if not DEBUG else 500),  # Shorter in production
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7 if not DEBUG else 1),  # Longer in production
@@ -275,8 +497,48 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Checks the refresh token blacklist through the cache before the database
+    'TOKEN_REFRESH_SERIALIZER': 'library_api.serializers.CachedTokenRefreshSerializer',
 }
 
+# How long a "not blacklisted" answer may be cached on a shared cache; blacklisting clears
+# it at once. With a per-process cache only blacklisted tokens are cached.
+JWT_BLACKLIST_NEGATIVE_CACHE_TTL = int(os.getenv('JWT_BLACKLIST_NEGATIVE_CACHE_TTL', '60'))
+
+# Request metrics exported at /metrics/ (admin only). Every request's latency is
+# recorded; METRICS_SAMPLE_RATE of them are also traced for queries, DB and render time.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '0.1'))
+
+# /health/ready/ caches each dependency check in process for this many seconds;
+# the email check opens a network connection, so it is cached for longer
+HEALTH_CHECK_TTL = float(os.getenv('HEALTH_CHECK_TTL', '10'))
+HEALTH_EMAIL_CHECK_TTL = float(os.getenv('HEALTH_EMAIL_CHECK_TTL', '60'))
+# Checks that make the instance not ready (503); the rest are reported as degraded
+HEALTH_CRITICAL_CHECKS = [c.strip() for c in os.getenv('HEALTH_CRITICAL_CHECKS', 'database').split(',') if c.strip()]
+
+# Startup readiness: each worker checks the schema in a background thread at boot.
+# Only the worker holding a Postgres advisory lock migrates, and a verified schema
+# version is cached so other workers (with a shared cache) skip the database.
+STARTUP_MIGRATION_CHECK = os.getenv('STARTUP_MIGRATION_CHECK', str(not DEBUG)).lower() == 'true'
+STARTUP_AUTO_MIGRATE = os.getenv('STARTUP_AUTO_MIGRATE', 'True').lower() == 'true'
+# Block worker boot until the check finishes (the pre-thread behaviour)
+STARTUP_CHECK_BLOCKING = os.getenv('STARTUP_CHECK_BLOCKING', 'False').lower() == 'true'
+
+# Housekeeping: purge expired PasswordResetCode rows and expired refresh tokens
+# Run `python manage.py housekeeping` from a cron job, or set HOUSEKEEPING_INTERVAL
+# (seconds) to run it from a background thread in each web worker. 0 disables it.
+HOUSEKEEPING_INTERVAL = int(os.getenv('HOUSEKEEPING_INTERVAL', '0'))
+HOUSEKEEPING_BATCH_SIZE = int(os.getenv('HOUSEKEEPING_BATCH_SIZE', '500'))
+
+# Logging: loggers hand records to the 'queue' handler, and a background listener
+# thread writes them to the console and files, so log I/O stays off the request path.
+# LOG_FORMAT is 'json' (one object per line, with request ids) or 'verbose'.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'verbose' if DEBUG else 'json')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Fraction of sub-WARNING records to keep per logger, e.g. LOG_SAMPLING_JSON='{"library_api.views": 0.1}'
+LOG_SAMPLING = json.loads(os.getenv('LOG_SAMPLING_JSON', '') or '{}')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -285,40 +547,56 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'library_api.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'library_api.logs.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
     },
     'handlers': {
+        'queue': {
+            '()': 'library_api.logs.QueuedHandler',
+            'handlers': ['console', 'file_warning', 'file_error'],
+            'queue_size': LOG_QUEUE_SIZE,
+            'filters': ['sampling'],
+        },
         'console': {
             'level': 'INFO' if not DEBUG else 'DEBUG',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
         'file_warning': {
             'level': 'WARNING',
             'class': 'logging.FileHandler',
             'filename': 'library_warning.log',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
         'file_error': {
             'level': 'ERROR',
             'class': 'logging.FileHandler',
             'filename': 'library_error.log',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file_warning', 'file_error'],
+            'handlers': ['queue'],
             'level': 'INFO' if not DEBUG else 'DEBUG',
-            'propagate': True,
+            # The root logger shares the same handler; propagating would log twice
+            'propagate': False,
         },
         'library_api': {
-            'handlers': ['console', 'file_warning', 'file_error'],
+            'handlers': ['queue'],
             'level': 'INFO' if not DEBUG else 'DEBUG',
             'propagate': False,
         },
     },
     'root': {
-        'handlers': ['console', 'file_warning', 'file_error'],
+        'handlers': ['queue'],
         'level': 'INFO' if not DEBUG else 'DEBUG',
     },
 }
@@ -392,17 +670,18 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
     SESSION_COOKIE_SECURE = True
     SECURE_SSL_REDIRECT = True
+    # Load balancer probes may come over plain HTTP from inside the platform
+    SECURE_REDIRECT_EXEMPT = [r'^health/(live|ready)/$']
     
     #HSTS Settings
     SECURE_HSTS_SECONDS = 31536000 #1 year
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
     
-    #Browser Security Headers
-    SECURE_CONTENT_TYPE_NOSNIFF = True
+    #Browser Security Headers (nosniff, Referrer-Policy and X-Frame-Options are
+    # set by SecurityHeadersMiddleware)
     SECURE_BROWSER_XSS_FILTER = True
     X_FRAME_OPTIONS = 'DENY'
-    SECURE_REFERRER_POLICY = 'strict-origin-when-cross-origin'
 else:
     # Development settings
     CSRF_COOKIE_SECURE = False
@@ -29,6 +29,7 @@ from rest_framework import permissions
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.db import connection
+from library_api.health import liveness_view, readiness_view
 import os
 
 def check_admin_access(user):
@@ -150,11 +151,33 @@ def db_health_check(request):
         }, status=503)
 db_health_check.permission_classes = [permissions.IsAuthenticated]
 
+@api_view(['GET'])
+def metrics_view(request):
+    """Request metrics in Prometheus text format - SECURED: Admin only"""
+    from library_api.metrics import render_prometheus
+
+    if not check_admin_access(request.user):
+        if not request.user.is_authenticated:
+            return Response({
+                'status': 'error',
+                'message': 'Authentication required. Admin access only.',
+            }, status=401)
+        return Response({
+            'status': 'error',
+            'message': 'Permission denied. Admin access only.',
+        }, status=403)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+metrics_view.permission_classes = [permissions.IsAuthenticated]
+
 @api_view(['GET', 'POST'])
 def run_migrations(request):
     """Run database migrations - SECURED: Admin only"""
     from django.core.management import call_command
     from io import StringIO
+    from library_api.startup import migration_lock
+    import logging
+
+    logger = logging.getLogger(__name__)
 
     if not check_admin_access(request.user):
         if not request.user.is_authenticated:
@@ -169,16 +192,32 @@ def run_migrations(request):
     try:
         out = StringIO()
         err = StringIO()
-        call_command('migrate', '--noinput', verbosity=2, stdout=out, stderr=err)
+        warning = None
+        # Share the startup lock so this can't race a worker's startup migration
+        with migration_lock() as acquired:
+            if acquired is None:
+                # No lock spans the workers (PgBouncer without a shared cache). Startup never
+                # migrates then, so this request is the way to do it; just don't run it twice at once.
+                warning = 'Ran without a migration lock: DB_POOL_MODE=pgbouncer needs a shared cache for one.'
+                logger.warning(warning)
+            elif not acquired:
+                return Response({
+                    'status': 'error',
+                    'message': 'Migrations are already running in another process.',
+                }, status=409)
+            call_command('migrate', '--noinput', verbosity=2, stdout=out, stderr=err)
         output = out.getvalue()
         errors = err.getvalue()
         
-        return Response({
+        response = {
             'status': 'success',
             'message': 'Migrations completed',
             'output': output,
             'errors': errors if errors else None
-        }, status=200)
+        }
+        if warning:
+            response['warning'] = warning
+        return Response(response, status=200)
     except Exception as e:
         import traceback
         return Response({
@@ -509,6 +548,9 @@ urlpatterns = [
     path('api/', include('library_api.urls')),
     path('health/', health_check, name='health-check'),
     path('health/db/', db_health_check, name='db-health-check'),
+    path('health/live/', liveness_view, name='health-live'),
+    path('health/ready/', readiness_view, name='health-ready'),
+    path('metrics/', metrics_view, name='metrics'),
     path('migrate/', run_migrations, name='run-migrations'),
     path('test-email/', test_email_connection_admin_check, name='test-email-connection'),
     path('', root_view, name='root'),
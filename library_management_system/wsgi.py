@@ -9,6 +9,9 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 import logging
+import time
+
+_boot_started = time.perf_counter()
 
 # Configure logging first
 logging.basicConfig(level=logging.INFO)
@@ -21,34 +24,27 @@ from django.core.wsgi import get_wsgi_application
 # Initialize Django application
 application = get_wsgi_application()
 
-# Auto-run migrations on startup if table is missing (AFTER Django is initialized)
+# Migration check and cache warm-up run in a background thread so workers
+# start serving without waiting on the database (see library_api/startup.py)
 try:
-    # Only check in production (not in test/debug)
-    if os.getenv('DEBUG', 'False').lower() != 'true':
-        from django.db import connection
-        from django.core.management import call_command
-        
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'library_api_passwordresetcode'
-                );
-            """)
-            table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            logger.warning("⚠️  PasswordResetCode table missing! Running migrations on startup...")
-            try:
-                call_command('migrate', '--noinput', verbosity=1)
-                logger.info("✅ Migrations completed on startup!")
-            except Exception as migrate_error:
-                logger.error(f"❌ Failed to run migrations on startup: {str(migrate_error)}")
-                logger.info("💡 You can run migrations manually via: POST https://api.librarymanagementsystem.store/migrate/")
-        else:
-            logger.info("✅ Database tables are up to date.")
+    from django.conf import settings
+    from library_api.startup import start_startup_checks
+
+    start_startup_checks(background=not getattr(settings, 'STARTUP_CHECK_BLOCKING', False))
 except Exception as e:
-    # Don't fail startup if migration check fails
-    logger.warning(f"⚠️  Could not check/run migrations on startup: {str(e)}")
-    logger.info("💡 You can run migrations manually via: POST https://api.librarymanagementsystem.store/migrate/")
+    # Don't fail startup if the checks can't be scheduled
+    logger.warning(f"⚠️  Could not start startup checks: {str(e)}")
+
+# Optional in-process housekeeping (see HOUSEKEEPING_INTERVAL in settings)
+try:
+    from django.conf import settings
+    from library_api.housekeeping import start_housekeeping_scheduler
+
+    start_housekeeping_scheduler(
+        getattr(settings, 'HOUSEKEEPING_INTERVAL', 0),
+        getattr(settings, 'HOUSEKEEPING_BATCH_SIZE', 500),
+    )
+except Exception as e:
+    logger.warning(f"⚠️  Could not start housekeeping scheduler: {str(e)}")
+
+logger.info(f"WSGI application loaded in {(time.perf_counter() - _boot_started) * 1000:.0f}ms")